@@ -5,13 +5,17 @@ entrenar_modelo.py
 Feature engineering basado en cosechas temporales.
 Ventanas: 1, 3, 5, 7, 9, 12, 15, 18, 24, 36 meses hacia atrás.
 Selección automática de top-10 features por importancia.
-Guarda modelo_prediccion.pkl y top_features.csv.
+Guarda el bundle de inferencia modelo_prediccion/ (un archivo por modelo + manifest),
+top_features.csv y, mientras la página de Predicción lo use de respaldo, también el
+modelo_prediccion.pkl del formato anterior.
 
 Uso:
     python entrenar_modelo.py
-    python entrenar_modelo.py --csv ruta/archivo.csv --out modelo.pkl
+    python entrenar_modelo.py --csv ruta/archivo.csv --bundle modelo/
+    python entrenar_modelo.py --out ""     # sin el pkl del formato anterior
+    python entrenar_modelo.py --workers 8 --hilos 2
 """
-import argparse, os, sys, pickle, warnings
+import argparse, os, sys, time, glob, json, hashlib, pickle, warnings
 from datetime import datetime
 
 import pandas as pd
@@ -21,7 +25,7 @@ warnings.filterwarnings("ignore")
 
 ROOT = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, ROOT)
-from utils import load_data, normalize_columns, ensure_fields
+from utils import load_data, normalize_columns, ensure_fields, _hash_archivo, shap_hacia_p1
 
 VENTANAS   = [1, 3, 5, 7, 9, 12, 15, 18, 24, 36]
 TRAIN_END  = 202602
@@ -48,103 +52,132 @@ def _prep(df_raw):
     return df, df_pend_raw
 
 
-def _liga_cat(row):
-    lg  = str(row.get("league", ""))
-    lc  = str(row.get("Ligas_categoria", ""))
-    return lc if (lg == "LIGA" and lc not in ["nan", "No Posee Liga", ""]) else lg
+def _texto(df, col, defecto=""):
+    """str() de cada valor de la columna (NaN -> 'nan'), o el defecto si no existe."""
+    if col not in df.columns:
+        return pd.Series(str(defecto), index=df.index)
+    return df[col].astype(str)
 
 
-def _instancia_key(row, lcat):
+def _entero(df, col):
+    if col not in df.columns:
+        return np.zeros(len(df), dtype=np.int64)
+    return pd.to_numeric(df[col], errors="coerce").fillna(0).astype(np.int64).to_numpy()
+
+
+def _liga_cat(df):
+    lg  = _texto(df, "league")
+    lc  = _texto(df, "Ligas_categoria")
+    return lc.where((lg == "LIGA") & ~lc.isin(["nan", "No Posee Liga", ""]), lg)
+
+
+def _instancia_key(df, lcat):
     """Identifica la competencia específica (torneo puntual, liga+temporada puntual,
     ascenso puntual o cypher puntual) para poder contar repeticiones de un mismo
     cruce SOLO dentro de esa instancia."""
-    lg = str(row.get("league", "")).upper()
-    if lg == "LIGA":
-        rnd = str(row.get("round", ""))
-        partes = rnd.split(" ")
-        temporada = partes[1] if len(partes) > 1 else rnd
-        return f"{lcat}_{temporada}"
-    torneo_id = row.get("tournament", row.get("round", ""))
-    return f"{lcat}_{torneo_id}"
+    lg  = _texto(df, "league").str.upper()
+    rnd = _texto(df, "round")
+    temporada = rnd.str.split(" ").str[1].fillna(rnd)
+    torneo_id = _texto(df, "tournament") if "tournament" in df.columns else rnd
+    return lcat + "_" + temporada.where(lg == "LIGA", torneo_id)
 
 
 # ════════════════════════════════════════════════════════════════
 # 2. HISTORIAL POR JUGADOR
 # ════════════════════════════════════════════════════════════════
 
+FASES = [("jornada","jornadas"),("grupos","grupos"),
+         ("suiza","rondas"),("playoff","eliminatorias"),
+         ("final","eliminatorias"),("semi","eliminatorias"),
+         ("cuarto","eliminatorias"),("octavo","eliminatorias")]   # gana la primera que aparece
+
+
 def build_historial(df):
-    df_ok = df[df["Walkover"] == 0].copy()
+    """Dos filas por batalla jugada (ganador y perdedor, en ese orden), en orden cronológico."""
+    df_ok = df[df["Walkover"] == 0]
     tiers = sorted(df_ok["Tier"].dropna().unique().tolist())
+    if df_ok.empty:
+        return pd.DataFrame(), tiers
+
+    ganador  = _texto(df_ok, "winner").str.strip().to_numpy()
+    p1       = _texto(df_ok, "player1").str.strip().to_numpy()
+    p2       = _texto(df_ok, "player2").str.strip().to_numpy()
+    perdedor = np.where(ganador == p1, p2, p1)
+    ym       = df_ok["ym"].astype(np.int64).to_numpy()
+    fmt      = _texto(df_ok, "Formato", "SINGLES").str.upper()
+    tier     = _texto(df_ok, "Tier").str.strip().to_numpy()
+    lcat     = _liga_cat(df_ok)
+    lcat_up  = lcat.str.upper()
+    fase_raw = (_texto(df_ok, "Fase_completo") if "Fase_completo" in df_ok.columns
+                else _texto(df_ok, "round")).str.lower()
+    pob_g    = _entero(df_ok, "pokemons Sob")
+    pob_v    = _entero(df_ok, "pokemon vencidos")
+
+    # Rep: n° de batalla de este cruce específico dentro de la misma competencia+formato
+    # (df_ok ya está ordenado por fecha, así que el conteo acumulado es cronológico)
+    clave = pd.DataFrame({"a": np.minimum(p1, p2), "b": np.maximum(p1, p2),
+                          "instancia": _instancia_key(df_ok, lcat).to_numpy(), "fmt": fmt.to_numpy()})
+    rep_actual = clave.groupby(["a", "b", "instancia", "fmt"], sort=False).cumcount().to_numpy() + 1
+    rep_bucket = np.minimum(rep_actual, 5)  # 5 = "5 o más"
+
+    fase = np.select([fase_raw.str.contains(k, regex=False) for k, _ in FASES],
+                     [v for _, v in FASES], default="eliminatorias")
+
+    # cada batalla aporta la fila del ganador y luego la del perdedor
+    def _ambos(v):   return np.repeat(np.asarray(v), 2)
+    def _g_p(g, p):  return np.stack([np.asarray(g), np.asarray(p)], axis=1).reshape(-1)
+    def _flag(m):    return _ambos(np.asarray(m, dtype=np.int64))
+
+    gano = np.tile(np.array([1, 0], dtype=np.int64), len(df_ok))
+    hist = {
+        "jugador":       _g_p(ganador, perdedor),
+        "ym":            _ambos(ym),
+        "gano":          gano,
+        "fmt_singles":   _flag(fmt == "SINGLES"),
+        "fmt_dobles":    _flag(fmt == "DOBLES"),
+        "fmt_vgc":       _flag(fmt == "VGC"),
+        "cat_liga":      _flag(lcat.str.contains("ST", regex=False) | (_texto(df_ok, "league") == "LIGA")),
+        "cat_torneo":    _flag(lcat == "TORNEO"),
+        "cat_ascenso":   _flag(lcat == "ASCENSO"),
+        "cat_cypher":    _flag(lcat == "CYPHER"),
+        "fase_elim":     _flag(fase == "eliminatorias"),
+        "fase_grupos":   _flag(fase == "grupos"),
+        "fase_jornadas": _flag(fase == "jornadas"),
+        "fase_rondas":   _flag(fase == "rondas"),
+        "pokes_sob":     _g_p(pob_g, np.maximum(0, 6 - pob_v)),
+        "pokes_venc":    _g_p(pob_v, np.maximum(0, 6 - pob_g)),
+        "participo_liga":_flag(np.logical_or.reduce([lcat_up.str.contains(l, regex=False) for l in LIGAS_STD])),
+        "rep_actual":    _ambos(rep_bucket),
+    }
+    for t in tiers:
+        hist[f"wr_tier_{t}"] = np.where(_ambos(tier == t), gano, np.nan)
+    for b in REP_BUCKETS:
+        hist[f"wr_rep_{b}"] = np.where(_ambos(rep_bucket == b), gano, np.nan)
+    for l in LIGAS_STD:
+        hist[f"liga_{l.lower()}"] = _flag(lcat_up.str.contains(l, regex=False))
 
-    rows = []
-    rep_counter = {}   # (par_jugadores, instancia, formato) -> cuántas veces se han cruzado
-    for _, r in df_ok.iterrows():
-        ganador  = str(r["winner"]).strip()
-        p1, p2   = str(r["player1"]).strip(), str(r["player2"]).strip()
-        perdedor = p2 if ganador == p1 else p1
-        ym       = int(r["ym"])
-        fmt      = str(r.get("Formato", "SINGLES")).upper()
-        tier     = str(r.get("Tier", "")).strip()
-        lcat     = _liga_cat(r)
-        fase_raw = str(r.get("Fase_completo", r.get("round", ""))).lower()
-        pob_g    = int(r.get("pokemons Sob", 0) or 0)
-        pob_v    = int(r.get("pokemon vencidos", 0) or 0)
-
-        # Rep: n° de batalla de este cruce específico dentro de la misma competencia+formato
-        # (df_ok ya está ordenado por fecha, así que el conteo incremental es cronológico)
-        instancia  = _instancia_key(r, lcat)
-        key_rep    = (frozenset({p1, p2}), instancia, fmt)
-        rep_counter[key_rep] = rep_counter.get(key_rep, 0) + 1
-        rep_actual = rep_counter[key_rep]
-        rep_bucket = rep_actual if rep_actual <= 4 else 5  # 5 = "5 o más"
-
-        fase = "eliminatorias"
-        for k, v in [("jornada","jornadas"),("grupos","grupos"),
-                     ("suiza","rondas"),("playoff","eliminatorias"),
-                     ("final","eliminatorias"),("semi","eliminatorias"),
-                     ("cuarto","eliminatorias"),("octavo","eliminatorias")]:
-            if k in fase_raw:
-                fase = v; break
-
-        ligas_flags = {f"liga_{l.lower()}": 1 if l in lcat.upper() else 0
-                       for l in LIGAS_STD}
-
-        for jugador, es_g in [(ganador, True), (perdedor, False)]:
-            row_base = {
-                "jugador":       jugador,
-                "ym":            ym,
-                "gano":          1 if es_g else 0,
-                "fmt_singles":   1 if fmt == "SINGLES" else 0,
-                "fmt_dobles":    1 if fmt == "DOBLES"  else 0,
-                "fmt_vgc":       1 if fmt == "VGC"     else 0,
-                "cat_liga":      1 if "ST" in lcat or str(r.get("league","")) == "LIGA" else 0,
-                "cat_torneo":    1 if lcat == "TORNEO"  else 0,
-                "cat_ascenso":   1 if lcat == "ASCENSO" else 0,
-                "cat_cypher":    1 if lcat == "CYPHER"  else 0,
-                "fase_elim":     1 if fase == "eliminatorias" else 0,
-                "fase_grupos":   1 if fase == "grupos"        else 0,
-                "fase_jornadas": 1 if fase == "jornadas"      else 0,
-                "fase_rondas":   1 if fase == "rondas"        else 0,
-                "pokes_sob":     pob_g if es_g else max(0, 6 - pob_v),
-                "pokes_venc":    pob_v if es_g else max(0, 6 - pob_g),
-                "participo_liga":1 if any(l in lcat.upper() for l in LIGAS_STD) else 0,
-                "rep_actual":    rep_bucket,
-            }
-            for t in tiers:
-                row_base[f"wr_tier_{t}"] = (1 if es_g else 0) if tier == t else np.nan
-            for b in REP_BUCKETS:
-                row_base[f"wr_rep_{b}"] = (1 if es_g else 0) if rep_bucket == b else np.nan
-            row_base.update(ligas_flags)
-            rows.append(row_base)
-
-    return pd.DataFrame(rows), tiers
+    return pd.DataFrame(hist), tiers
 
 
 # ════════════════════════════════════════════════════════════════
 # 3. COSECHAS
 # ════════════════════════════════════════════════════════════════
 
+def _mes_abs(ym):
+    """YYYYMM -> n° de mes absoluto (año*12 + mes-1), para que las ventanas crucen años."""
+    ym = np.asarray(ym, dtype=np.int64)
+    return (ym // 100) * 12 + ym % 100 - 1
+
+
 def build_cosechas(hist, tiers):
+    """
+    Una fila por jugador × mes con datos. Cada ventana de n meses resume las batallas
+    del jugador en los n meses calendario anteriores a ese mes (sin incluirlo).
+
+    Se arma una sola vez la matriz jugador × mes calendario con las sumas y conteos
+    mensuales de cada columna; cada ventana sale de la diferencia de sus sumas
+    acumuladas, así que agregar ventanas no cuesta casi nada.
+    """
     base_cols = [
         "gano","fmt_singles","fmt_dobles","fmt_vgc",
         "cat_liga","cat_torneo","cat_ascenso","cat_cypher",
@@ -154,52 +187,59 @@ def build_cosechas(hist, tiers):
       + [f"wr_tier_{t}" for t in tiers] \
       + [f"wr_rep_{b}" for b in REP_BUCKETS]
 
-    all_ym    = sorted(hist["ym"].unique())
+    if hist.empty:
+        return pd.DataFrame()
+
     jugadores = hist["jugador"].unique()
-    cosecha_rows = []
-
-    for jugador in jugadores:
-        h_j = hist[hist["jugador"] == jugador].copy()
-        for ym in all_ym:
-            row_cos = {"jugador": jugador, "ym": ym}
-            ym_dt = pd.Timestamp(year=ym // 100, month=ym % 100, day=1)
-
-            for n in VENTANAS:
-                ini_dt = ym_dt - pd.DateOffset(months=n)
-                ini_ym = ini_dt.year * 100 + ini_dt.month
-                fin_ym = ym - 1
-
-                ventana = h_j[(h_j["ym"] >= ini_ym) & (h_j["ym"] <= fin_ym)]
-
-                if ventana.empty:
-                    row_cos[f"n_batallas_m{n}"]  = 0
-                    row_cos[f"winrate_m{n}"]      = np.nan
-                    row_cos[f"meses_activo_m{n}"] = 0
-                    for col in base_cols:
-                        if col == "gano": continue
-                        if col.startswith("wr_"):
-                            row_cos[f"{col}_m{n}"] = np.nan
-                        else:
-                            row_cos[f"{col}_sum_m{n}"]  = 0
-                            row_cos[f"{col}_mean_m{n}"] = np.nan
+    all_ym    = np.sort(hist["ym"].unique())
+    mes       = _mes_abs(hist["ym"])
+    mes0      = mes.min()
+    n_jug, n_mes = len(jugadores), int(mes.max() - mes0) + 1
+    celda     = pd.Index(jugadores).get_indexer(hist["jugador"]) * n_mes + (mes - mes0)
+    fin       = _mes_abs(all_ym) - mes0   # la ventana termina justo antes del mes de la cosecha
+
+    def _acumulada(pesos=None, solo_activos=False):
+        """acum[j, t] = total del jugador j en los meses anteriores a t."""
+        mensual = np.bincount(celda, weights=pesos, minlength=n_jug * n_mes).reshape(n_jug, n_mes)
+        if solo_activos:
+            mensual = mensual > 0
+        acum = np.zeros((n_jug, n_mes + 1))
+        np.cumsum(mensual, axis=1, out=acum[:, 1:])
+        return acum
+
+    def _ventana(acum, n):
+        return (acum[:, fin] - acum[:, np.maximum(fin - n, 0)]).ravel()
+
+    acum_bat    = _acumulada()
+    acum_activo = _acumulada(solo_activos=True)
+    sumas, presentes, enteras = {}, {}, {}
+    for col in base_cols:
+        v = hist[col].to_numpy(dtype=float)
+        hay = ~np.isnan(v)
+        sumas[col] = _acumulada(np.where(hay, v, 0.0))
+        if col.startswith("wr_"):
+            presentes[col] = _acumulada(hay.astype(float))
+        enteras[col] = pd.api.types.is_integer_dtype(hist[col])
+
+    cos = {"jugador": np.repeat(jugadores, len(all_ym)), "ym": np.tile(all_ym, n_jug)}
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for n in VENTANAS:
+            n_bat = _ventana(acum_bat, n)
+            vacia = n_bat == 0
+            cos[f"n_batallas_m{n}"]  = n_bat.astype(np.int64)
+            cos[f"winrate_m{n}"]      = np.where(vacia, np.nan, _ventana(sumas["gano"], n) / n_bat)
+            cos[f"meses_activo_m{n}"] = _ventana(acum_activo, n).astype(np.int64)
+            for col in base_cols:
+                if col == "gano": continue
+                s = _ventana(sumas[col], n)
+                if col.startswith("wr_"):
+                    k = _ventana(presentes[col], n)
+                    cos[f"{col}_m{n}"] = np.where(k == 0, np.nan, s / k)
                 else:
-                    n_bat  = len(ventana)
-                    n_wins = ventana["gano"].sum()
-                    row_cos[f"n_batallas_m{n}"]  = n_bat
-                    row_cos[f"winrate_m{n}"]      = n_wins / n_bat if n_bat > 0 else np.nan
-                    row_cos[f"meses_activo_m{n}"] = ventana["ym"].nunique()
-                    for col in base_cols:
-                        if col == "gano": continue
-                        if col.startswith("wr_"):
-                            sub = ventana[col].dropna()
-                            row_cos[f"{col}_m{n}"] = sub.mean() if len(sub) > 0 else np.nan
-                        else:
-                            row_cos[f"{col}_sum_m{n}"]  = ventana[col].fillna(0).sum()
-                            row_cos[f"{col}_mean_m{n}"] = ventana[col].fillna(0).mean()
-
-            cosecha_rows.append(row_cos)
+                    cos[f"{col}_sum_m{n}"]  = s.astype(np.int64) if enteras[col] else s
+                    cos[f"{col}_mean_m{n}"] = np.where(vacia, np.nan, s / n_bat)
 
-    return pd.DataFrame(cosecha_rows)
+    return pd.DataFrame(cos)
 
 
 # ════════════════════════════════════════════════════════════════
@@ -238,33 +278,51 @@ def build_derived(cos):
 # 5. DATASET
 # ════════════════════════════════════════════════════════════════
 
+def _cosecha_asof(jugadores, yms, cos, cols, estricto):
+    """
+    Para cada (jugador, ym) la última cosecha del jugador con mes < ym (estricto) o
+    <= ym, en el mismo orden de entrada. Es una sola unión as-of ordenada por mes en
+    lugar de filtrar cos por cada batalla. Devuelve (features, encontrado); las filas
+    sin cosecha quedan en NaN.
+    """
+    izq = pd.DataFrame({"jugador": np.asarray(jugadores, dtype=object),
+                        "ym": np.asarray(yms, dtype=np.int64),
+                        "_pos": np.arange(len(jugadores))})
+    der = cos.reindex(columns=["jugador", "ym"] + cols).assign(ym=cos["ym"].astype(np.int64), _hay=True)
+    out = pd.merge_asof(izq.sort_values("ym", kind="stable"),
+                        der.sort_values("ym", kind="stable"),
+                        on="ym", by="jugador", direction="backward",
+                        allow_exact_matches=not estricto)
+    out = out.sort_values("_pos").reset_index(drop=True)
+    return out[cols], out["_hay"].eq(True).to_numpy()
+
+
+def _pares_features(cos_g, cos_p, feat_cols):
+    """Columnas c_g, c_p intercaladas por feature, como las arma el modelo."""
+    pares = pd.concat([cos_g.add_suffix("_g"), cos_p.add_suffix("_p")], axis=1)
+    return pares[[f"{c}{s}" for c in feat_cols for s in ("_g", "_p")]]
+
+
 def build_dataset(df_battles, cos):
     df_ok = df_battles[df_battles["Walkover"] == 0].copy()
     feat_cols = [c for c in cos.columns if c not in ["jugador", "ym"]]
 
-    cos_idx = cos.set_index(["jugador", "ym"])
-
-    def get_latest(jugador, ym_bat):
-        sub = cos[(cos["jugador"] == jugador) & (cos["ym"] < ym_bat)]
-        if sub.empty: return None
-        return sub.sort_values("ym").iloc[-1]
-
-    rows = []
-    for _, r in df_ok.iterrows():
-        ganador  = str(r["winner"]).strip()
-        p1, p2   = str(r["player1"]).strip(), str(r["player2"]).strip()
-        perdedor = p2 if ganador == p1 else p1
-        ym       = int(r["ym"])
-        cos_g = get_latest(ganador, ym)
-        cos_p = get_latest(perdedor, ym)
-        if cos_g is None or cos_p is None: continue
-        fila = {"ym_batalla": ym, "ganador": ganador, "perdedor": perdedor}
-        for c in feat_cols:
-            fila[f"{c}_g"] = cos_g[c] if c in cos_g.index else np.nan
-            fila[f"{c}_p"] = cos_p[c] if c in cos_p.index else np.nan
-        rows.append(fila)
-
-    data = pd.DataFrame(rows)
+    ganador  = df_ok["winner"].astype(str).str.strip().to_numpy()
+    p1       = df_ok["player1"].astype(str).str.strip().to_numpy()
+    p2       = df_ok["player2"].astype(str).str.strip().to_numpy()
+    perdedor = np.where(ganador == p1, p2, p1)
+    ym       = df_ok["ym"].astype(np.int64).to_numpy()
+
+    # cosecha más reciente de cada jugador ANTES del mes de la batalla
+    cos_g, hay_g = _cosecha_asof(ganador,  ym, cos, feat_cols, estricto=True)
+    cos_p, hay_p = _cosecha_asof(perdedor, ym, cos, feat_cols, estricto=True)
+    ok    = hay_g & hay_p
+    tipos = cos[feat_cols].dtypes
+    data = pd.concat([
+        pd.DataFrame({"ym_batalla": ym[ok], "ganador": ganador[ok], "perdedor": perdedor[ok]}),
+        _pares_features(cos_g[ok].astype(tipos).reset_index(drop=True),
+                        cos_p[ok].astype(tipos).reset_index(drop=True), feat_cols),
+    ], axis=1)
     if data.empty:
         raise ValueError("No se pudieron construir filas.")
 
@@ -317,50 +375,132 @@ def select_top_features(X, y, n=TOP_N_FEAT, out_csv="top_features.csv"):
 # 7. ENTRENAMIENTO
 # ════════════════════════════════════════════════════════════════
 
-def train_models(X, y, X_val, y_val):
-    from sklearn.ensemble import RandomForestClassifier
-    from sklearn.model_selection import cross_val_score
+CV_FOLDS = 5
+
+# nombre -> (módulo, clase, parámetros). Se instancian dentro de cada trabajo del pool,
+# con n_jobs = hilos asignados al trabajo.
+MODELOS = {
+    "XGBoost":              ("xgboost", "XGBClassifier",
+                             dict(n_estimators=200, max_depth=5,
+                                  learning_rate=0.05, subsample=0.8,
+                                  colsample_bytree=0.8, eval_metric="logloss",
+                                  random_state=42, verbosity=0)),
+    "XGBoost (tuned)":      ("xgboost", "XGBClassifier",
+                             dict(n_estimators=300, max_depth=4,
+                                  learning_rate=0.03, subsample=0.7,
+                                  colsample_bytree=0.7, min_child_weight=3,
+                                  eval_metric="logloss", random_state=42, verbosity=0)),
+    "LightGBM":             ("lightgbm", "LGBMClassifier",
+                             dict(n_estimators=200, max_depth=5,
+                                  learning_rate=0.05, subsample=0.8,
+                                  colsample_bytree=0.8, random_state=42, verbose=-1)),
+    "LightGBM (tuned)":     ("lightgbm", "LGBMClassifier",
+                             dict(n_estimators=300, num_leaves=31,
+                                  learning_rate=0.03, min_child_samples=10,
+                                  subsample=0.7, random_state=42, verbose=-1)),
+    "Random Forest":        ("sklearn.ensemble", "RandomForestClassifier",
+                             dict(n_estimators=200, max_depth=8,
+                                  min_samples_leaf=5, random_state=42)),
+    "Random Forest (deep)": ("sklearn.ensemble", "RandomForestClassifier",
+                             dict(n_estimators=300, max_depth=12,
+                                  min_samples_leaf=3, max_features="sqrt",
+                                  random_state=42)),
+}
+
+
+def _crear_modelo(nombre, hilos):
+    import importlib
+    modulo, clase, params = MODELOS[nombre]
+    return getattr(importlib.import_module(modulo), clase)(**params, n_jobs=hilos)
+
+
+_DATOS = {}   # X, y, X_val, y_val e hilos del proceso (se cargan una vez por proceso)
+
+
+def _init_trabajos(X, y, X_val, y_val, hilos):
+    _DATOS.update(X=X, y=y, X_val=X_val, y_val=y_val, hilos=hilos)
+
+
+def _trabajo(tarea):
+    """
+    Un ajuste: fold=None entrena con todo X y evalúa en validación; si no, entrena
+    y puntúa un fold de la validación cruzada (igual que cross_val_score).
+    Devuelve (nombre, fold, resultado).
+    """
+    from threadpoolctl import threadpool_limits
     from sklearn.metrics import accuracy_score, roc_auc_score
-    import xgboost as xgb
-    import lightgbm as lgb
-
-    models = {
-        "XGBoost":              xgb.XGBClassifier(n_estimators=200, max_depth=5,
-                                    learning_rate=0.05, subsample=0.8,
-                                    colsample_bytree=0.8, eval_metric="logloss",
-                                    random_state=42, verbosity=0),
-        "XGBoost (tuned)":      xgb.XGBClassifier(n_estimators=300, max_depth=4,
-                                    learning_rate=0.03, subsample=0.7,
-                                    colsample_bytree=0.7, min_child_weight=3,
-                                    eval_metric="logloss", random_state=42, verbosity=0),
-        "LightGBM":             lgb.LGBMClassifier(n_estimators=200, max_depth=5,
-                                    learning_rate=0.05, subsample=0.8,
-                                    colsample_bytree=0.8, random_state=42, verbose=-1),
-        "LightGBM (tuned)":     lgb.LGBMClassifier(n_estimators=300, num_leaves=31,
-                                    learning_rate=0.03, min_child_samples=10,
-                                    subsample=0.7, random_state=42, verbose=-1),
-        "Random Forest":        RandomForestClassifier(n_estimators=200, max_depth=8,
-                                    min_samples_leaf=5, random_state=42, n_jobs=-1),
-        "Random Forest (deep)": RandomForestClassifier(n_estimators=300, max_depth=12,
-                                    min_samples_leaf=3, max_features="sqrt",
-                                    random_state=42, n_jobs=-1),
-    }
-    results, trained = {}, {}
-    for name, model in models.items():
+    nombre, fold, idx_tr, idx_te = tarea
+    X, y, hilos = _DATOS["X"], _DATOS["y"], _DATOS["hilos"]
+    t0 = time.perf_counter()
+    try:
+        with threadpool_limits(hilos):
+            model = _crear_modelo(nombre, hilos)
+            if fold is None:
+                model.fit(X, y)
+                X_val, y_val = _DATOS["X_val"], _DATOS["y_val"]
+                res = {"modelo":       model,
+                       "val_accuracy": accuracy_score(y_val, model.predict(X_val)),
+                       "val_auc":      roc_auc_score(y_val, model.predict_proba(X_val)[:, 1])}
+            else:
+                model.fit(X.iloc[idx_tr], y.iloc[idx_tr])
+                res = {"accuracy": accuracy_score(y.iloc[idx_te], model.predict(X.iloc[idx_te]))}
+    except Exception as e:
+        res = {"error": str(e)}
+    res["segundos"] = time.perf_counter() - t0
+    return nombre, fold, res
+
+
+def train_models(X, y, X_val, y_val, workers=None, hilos=None):
+    """
+    Entrena cada modelo de MODELOS con todo X (evaluado en X_val) y su validación
+    cruzada de CV_FOLDS folds. Cada (modelo, fold) es un trabajo independiente que
+    se reparte en un pool de `workers` procesos, cada uno limitado a `hilos` hilos
+    (por defecto los núcleos / workers) para no sobresuscribir la máquina. Los
+    resultados se arman en el orden de MODELOS, así que no dependen del reparto.
+    """
+    from sklearn.model_selection import StratifiedKFold
+    n_cpu   = os.cpu_count() or 1
+    workers = workers or n_cpu
+    hilos   = hilos or max(1, n_cpu // workers)
+
+    folds  = list(StratifiedKFold(CV_FOLDS).split(X, y))
+    # primero los ajustes completos (los más largos), después los folds
+    tareas = [(n, None, None, None) for n in MODELOS] + \
+             [(n, k, tr, te) for n in MODELOS for k, (tr, te) in enumerate(folds)]
+
+    def _en_serie():
+        _init_trabajos(X, y, X_val, y_val, hilos)
+        return list(map(_trabajo, tareas))
+
+    if workers > 1:
         try:
-            model.fit(X, y)
-            pred_val = model.predict(X_val)
-            prob_val = model.predict_proba(X_val)[:, 1]
-            acc_val  = accuracy_score(y_val, pred_val)
-            auc_val  = roc_auc_score(y_val, prob_val)
-            cv_acc   = cross_val_score(model, X, y, cv=5, scoring="accuracy").mean()
-            results[name] = {"val_accuracy": round(acc_val,4),
-                             "val_auc":      round(auc_val,4),
-                             "cv_accuracy":  round(cv_acc,4)}
-            trained[name] = model
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_trabajos,
+                                     initargs=(X, y, X_val, y_val, hilos)) as pool:
+                salidas = list(pool.map(_trabajo, tareas))
         except Exception as e:
+            print(f"      Pool de procesos no disponible ({e}); entrenando en serie.")
+            salidas = _en_serie()
+    else:
+        salidas = _en_serie()
+    salidas = {(n, k): r for n, k, r in salidas}
+
+    results, trained = {}, {}
+    for name in MODELOS:
+        partes = [salidas[(name, None)]] + [salidas[(name, k)] for k in range(CV_FOLDS)]
+        segundos = round(sum(p["segundos"] for p in partes), 1)
+        error = next((p["error"] for p in partes if "error" in p), None)
+        if error is not None:
             results[name] = {"val_accuracy":0.0,"val_auc":0.0,
-                             "cv_accuracy":0.0,"error":str(e)}
+                             "cv_accuracy":0.0,"error":error,"segundos":segundos}
+            continue
+        full   = partes[0]
+        cv_acc = np.array([p["accuracy"] for p in partes[1:]]).mean()
+        results[name] = {"val_accuracy": round(full["val_accuracy"],4),
+                         "val_auc":      round(full["val_auc"],4),
+                         "cv_accuracy":  round(cv_acc,4),
+                         "segundos":     segundos}
+        trained[name] = full["modelo"]
     return trained, results
 
 
@@ -369,50 +509,176 @@ def train_models(X, y, X_val, y_val):
 # ════════════════════════════════════════════════════════════════
 
 def build_pred_features(df_pend, cos, top_feat):
-    feat_cols_base = list({c[:-2] for c in top_feat if c.endswith(("_g","_p"))})
+    feat_cols_base = list(dict.fromkeys(c[:-2] for c in top_feat if c.endswith(("_g","_p"))))
 
     # ym máximo disponible (para pendientes sin fecha que tienen ym=0)
     max_ym = int(cos["ym"].max()) if not cos.empty else 999999
 
-    def get_latest(jugador, ym_bat):
-        ym_ref = max_ym if ym_bat == 0 else ym_bat
-        sub = cos[(cos["jugador"] == jugador) & (cos["ym"] <= ym_ref)]
-        if sub.empty: return None
-        return sub.sort_values("ym").iloc[-1]
-
-    rows = []
-    for _, r in df_pend.iterrows():
-        p1, p2 = str(r["player1"]).strip(), str(r["player2"]).strip()
-        ym     = int(r.get("ym", 0))
-        cos1   = get_latest(p1, ym)
-        cos2   = get_latest(p2, ym)
-        fila   = {"player1": p1, "player2": p2, "ym": ym,
-                  "Formato":    r.get("Formato",""),
-                  "Tier":       r.get("Tier",""),
-                  "Aka_evento": r.get("Aka_evento",""),
-                  "round":      r.get("round",""),
-                  "N_Torneo":   r.get("N_Torneo","")}
-        for c in feat_cols_base:
-            fila[f"{c}_g"] = cos1[c] if cos1 is not None and c in cos1.index else np.nan
-            fila[f"{c}_p"] = cos2[c] if cos2 is not None and c in cos2.index else np.nan
-        rows.append(fila)
-
-    pred_df = pd.DataFrame(rows)
+    p1  = df_pend["player1"].astype(str).str.strip().to_numpy()
+    p2  = df_pend["player2"].astype(str).str.strip().to_numpy()
+    ym  = df_pend["ym"].fillna(0).astype(np.int64).to_numpy() if "ym" in df_pend.columns \
+          else np.zeros(len(df_pend), dtype=np.int64)
+    ym_ref = np.where(ym == 0, max_ym, ym)
+
+    # cosecha más reciente de cada jugador hasta el mes de la batalla (inclusive)
+    cos1, hay1 = _cosecha_asof(p1, ym_ref, cos, feat_cols_base, estricto=False)
+    cos2, hay2 = _cosecha_asof(p2, ym_ref, cos, feat_cols_base, estricto=False)
+    if hay1.all() and hay2.all():
+        tipos = cos.reindex(columns=feat_cols_base).dtypes
+        cos1, cos2 = cos1.astype(tipos), cos2.astype(tipos)
+
+    info = pd.DataFrame({"player1": p1, "player2": p2, "ym": ym})
+    for c in ["Formato", "Tier", "Aka_evento", "round", "N_Torneo"]:
+        info[c] = df_pend[c].to_numpy() if c in df_pend.columns else ""
+    pred_df = pd.concat([info, _pares_features(cos1, cos2, feat_cols_base)], axis=1)
     for c in top_feat:
         if c not in pred_df.columns:
             pred_df[c] = 0.0
     return pred_df
 
 
+SHAP_TOP = 3   # factores que se guardan a favor de cada jugador
+
+
+def puntuar_pendientes(trained, pred_features, top_feat):
+    """
+    {modelo: tabla} con la predicción de cada batalla pendiente, en el mismo orden
+    que pred_features: probabilidades, favorito y confianza (como los muestra la
+    página) y, si shap está instalado, el SHAP de cada feature hacia player1
+    (shap_<feature>) y los SHAP_TOP factores que más empujan a cada lado.
+    """
+    if pred_features.empty:
+        return {}
+    try:
+        import shap
+    except ImportError:
+        shap = None
+        print("      shap no está instalado: se guardan sólo las probabilidades.")
+
+    X  = pred_features[top_feat].fillna(0)
+    p1 = pred_features["player1"].to_numpy()
+    p2 = pred_features["player2"].to_numpy()
+    feats = np.asarray(top_feat, dtype=object)
+
+    def _top(sv, n=SHAP_TOP):
+        orden = np.argsort(-sv, axis=1, kind="stable")[:, :n]
+        return [", ".join(feats[o][sv[i, o] > 0]) for i, o in enumerate(orden)]
+
+    out = {}
+    for nombre, modelo in trained.items():
+        prob = modelo.predict_proba(X)
+        t = pd.DataFrame({"prob_p1": (prob[:, 0] * 100).round(1),
+                          "prob_p2": (prob[:, 1] * 100).round(1)})
+        t["favorito"]  = np.where(t["prob_p1"] >= t["prob_p2"], p1, p2)
+        t["confianza"] = t[["prob_p1", "prob_p2"]].max(axis=1)
+        if shap is not None:
+            try:
+                sv = shap_hacia_p1(shap.TreeExplainer(modelo).shap_values(X))
+                for j, f in enumerate(top_feat):
+                    t[f"shap_{f}"] = sv[:, j].astype(np.float32)
+                t["top_p1"], t["top_p2"] = _top(sv), _top(-sv)
+            except Exception as e:
+                print(f"      SHAP no disponible para {nombre}: {e}")
+        out[nombre] = t
+    return out
+
+
 # ════════════════════════════════════════════════════════════════
-# 9. MAIN
+# 9. BUNDLE DE INFERENCIA
+# ════════════════════════════════════════════════════════════════
+
+BUNDLE_DIR     = "modelo_prediccion"
+BUNDLE_FORMATO = 1   # vistas/prediccion.py lee este mismo formato
+
+
+def _artefacto(directorio, sub, nombre, ext, escribir):
+    """Escribe con escribir(ruta_tmp) y lo deja como sub/<nombre>_<hash>.<ext>: el nombre
+    depende del contenido, así que un archivo que no cambió se reutiliza tal cual.
+    Devuelve la entrada del manifest."""
+    os.makedirs(os.path.join(directorio, sub), exist_ok=True)
+    tmp = os.path.join(directorio, sub, f".{nombre}.{os.getpid()}.tmp")
+    escribir(tmp)
+    sha1 = _hash_archivo(tmp)
+    rel  = f"{sub}/{nombre}_{sha1[:16]}.{ext}"
+    os.replace(tmp, os.path.join(directorio, rel))
+    return {"archivo": rel, "sha1": sha1,
+            "mb": round(os.path.getsize(os.path.join(directorio, rel)) / 1024 / 1024, 2)}
+
+
+def guardar_bundle(directorio, trained, tablas, meta, predicciones=None):
+    """
+    Bundle para la página de Predicción: un pickle por modelo (se cargan de a uno,
+    cuando se eligen), las tablas de features en Arrow sin comprimir (se leen
+    memory-mapped) y un manifest.json chico con métricas, top_feat y el hash de
+    cada archivo. Las predicciones precalculadas de cada modelo (puntuar_pendientes)
+    quedan en su entrada del manifest y llevan el hash del modelo que las generó.
+    El manifest se escribe al final, así que quien lo lea siempre encuentra sus archivos.
+    """
+    import re
+    import pyarrow as pa
+
+    def _pickle(obj):
+        def _escribir(ruta):
+            with open(ruta, "wb") as f:
+                pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+        return _escribir
+
+    def _arrow(df):
+        def _escribir(ruta):
+            tabla = pa.Table.from_pandas(df, preserve_index=False)
+            with pa.OSFile(ruta, "wb") as sink, pa.ipc.new_file(sink, tabla.schema) as writer:
+                writer.write_table(tabla)
+        return _escribir
+
+    def _slug(nombre):
+        return re.sub(r"[^a-z0-9]+", "_", nombre.lower()).strip("_")
+
+    modelos = {nombre: _artefacto(directorio, "modelos", _slug(nombre), "pkl", _pickle(modelo))
+               for nombre, modelo in trained.items()}
+    tablas = {nombre: _artefacto(directorio, "tablas", nombre, "arrow", _arrow(df))
+              for nombre, df in tablas.items()}
+    for nombre, df in (predicciones or {}).items():
+        if nombre in modelos:
+            m = modelos[nombre]
+            m["predicciones"] = _artefacto(directorio, "tablas", f"pred_{_slug(nombre)}", "arrow",
+                                           _arrow(df.assign(modelo_sha1=m["sha1"])))
+
+    manifest = dict(meta, formato=BUNDLE_FORMATO, modelos=modelos, tablas=tablas)
+    ruta_man = os.path.join(directorio, "manifest.json")
+    tmp = f"{ruta_man}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=1, default=str)
+    os.replace(tmp, ruta_man)
+
+    # artefactos de entrenamientos anteriores
+    artefactos = list(modelos.values()) + list(tablas.values()) + \
+                 [m["predicciones"] for m in modelos.values() if "predicciones" in m]
+    vigentes = {os.path.abspath(os.path.join(directorio, a["archivo"])) for a in artefactos}
+    for viejo in glob.glob(os.path.join(directorio, "modelos", "*.pkl")) + \
+                 glob.glob(os.path.join(directorio, "tablas", "*.arrow")):
+        if os.path.abspath(viejo) not in vigentes:
+            try: os.remove(viejo)
+            except OSError: pass
+    return manifest
+
+
+# ════════════════════════════════════════════════════════════════
+# 10. MAIN
 # ════════════════════════════════════════════════════════════════
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--csv",     default=None)
-    parser.add_argument("--out",     default="modelo_prediccion.pkl")
+    parser.add_argument("--bundle",  default=BUNDLE_DIR,
+                        help="carpeta del bundle de inferencia que lee la página de Predicción")
+    parser.add_argument("--out",     default="modelo_prediccion.pkl",
+                        help="pkl monolítico del formato anterior, respaldo de la página si falta "
+                             "el bundle ('' para no escribirlo)")
     parser.add_argument("--top_csv", default="top_features.csv")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="procesos para entrenar modelos y folds (por defecto, uno por núcleo)")
+    parser.add_argument("--hilos",   type=int, default=None,
+                        help="hilos por trabajo (por defecto, núcleos / workers)")
     args = parser.parse_args()
 
     print("=" * 65)
@@ -433,7 +699,7 @@ def main():
     hist_all, tiers = build_historial(df)
     print(f"      {len(hist_all)} filas | Tiers: {tiers}")
 
-    print("\n[3/7] Cosechas temporales (puede tardar varios minutos)...")
+    print("\n[3/7] Cosechas temporales...")
     cos = build_cosechas(hist_all, tiers)
     print(f"      {len(cos)} filas | {len(cos.columns)} columnas")
 
@@ -461,15 +727,17 @@ def main():
     X_vl_top = X_vl[top_feat].fillna(0)
 
     print(f"\n[7/7] Entrenando modelos...")
-    trained, results = train_models(X_tr_top, y_tr, X_vl_top, y_vl)
+    t0 = time.perf_counter()
+    trained, results = train_models(X_tr_top, y_tr, X_vl_top, y_vl, args.workers, args.hilos)
+    print(f"      {len(MODELOS)} modelos × (1 + {CV_FOLDS} folds) en {time.perf_counter() - t0:.1f} s")
 
     print("\n  Resultados:")
-    print(f"  {'Modelo':<25} {'Val Acc':>9} {'Val AUC':>9} {'CV Acc':>9}")
-    print("  " + "-"*55)
+    print(f"  {'Modelo':<25} {'Val Acc':>9} {'Val AUC':>9} {'CV Acc':>9} {'Tiempo':>8}")
+    print("  " + "-"*64)
     for name, r in sorted(results.items(), key=lambda x: -x[1].get("val_auc",0)):
         if "error" not in r:
             print(f"  {name:<25} {r['val_accuracy']*100:>8.2f}%"
-                  f" {r['val_auc']:>9.4f} {r['cv_accuracy']*100:>8.2f}%")
+                  f" {r['val_auc']:>9.4f} {r['cv_accuracy']*100:>8.2f}% {r['segundos']:>7.1f}s")
         else:
             print(f"  {name:<25} ERROR: {r['error']}")
 
@@ -481,33 +749,50 @@ def main():
     pred_features = build_pred_features(df_pend, cos, top_feat) \
                     if not df_pend.empty else pd.DataFrame()
     print(f"  {len(pred_features)} batallas pendientes.")
+    predicciones = puntuar_pendientes(trained, pred_features, top_feat)
+    if predicciones:
+        print(f"  Pendientes puntuadas con {len(predicciones)} modelos.")
 
-    import hashlib
     data_hash = hashlib.md5(str(len(df_raw)).encode()).hexdigest()[:8]
 
     # ── latest_stats: última cosecha por jugador (liviana, para predicción) ──
     latest_stats = cos.sort_values("ym").groupby("jugador").last().reset_index()
-
-    cache = dict(
-        trained=trained, results=results,
-        top_feat=top_feat, all_feat=all_feat,
-        tiers=tiers,
-        latest_stats=latest_stats,      # cosecha más reciente por jugador (~liviano)
-        pred_features=pred_features,    # features de batallas pendientes
-        df_pend=df_pend,
-        trained_at=datetime.now(), data_hash=data_hash,
-        train_end=TRAIN_END, val_start=VAL_START, ventanas=VENTANAS,
-        # NO se guarda: cos (grande), X_train, X_val, y_train, y_val
+    trained_at   = datetime.now()
+
+    manifest = guardar_bundle(
+        args.bundle, trained,
+        tablas=dict(latest_stats=latest_stats,     # cosecha más reciente por jugador (~liviano)
+                    pred_features=pred_features,   # features de batallas pendientes
+                    df_pend=df_pend),
+        meta=dict(results=results, top_feat=top_feat, tiers=tiers,
+                  trained_at=trained_at.isoformat(timespec="seconds"), data_hash=data_hash,
+                  train_end=TRAIN_END, val_start=VAL_START, ventanas=VENTANAS),
+        predicciones=predicciones,
+        # NO se guarda: cos (grande), all_feat, X_train, X_val, y_train, y_val
     )
-    with open(args.out, "wb") as f:
-        pickle.dump(cache, f)
+    size_mb = sum(a["mb"] for a in list(manifest["modelos"].values()) + list(manifest["tablas"].values()))
+    size_mb += sum(m["predicciones"]["mb"] for m in manifest["modelos"].values() if "predicciones" in m)
+    print(f"\n  Guardado: {args.bundle}/ ({len(trained)} modelos, {size_mb:.1f} MB)")
+
+    if args.out:
+        cache = dict(
+            trained=trained, results=results,
+            top_feat=top_feat, all_feat=all_feat,
+            tiers=tiers,
+            latest_stats=latest_stats,
+            pred_features=pred_features,
+            df_pend=df_pend,
+            trained_at=trained_at, data_hash=data_hash,
+            train_end=TRAIN_END, val_start=VAL_START, ventanas=VENTANAS,
+        )
+        with open(args.out, "wb") as f:
+            pickle.dump(cache, f)
+        print(f"  Guardado: {args.out} ({os.path.getsize(args.out) / 1024 / 1024:.1f} MB, formato anterior)")
 
-    size_mb = os.path.getsize(args.out) / 1024 / 1024
-    print(f"\n  Guardado: {args.out} ({size_mb:.1f} MB)")
     print(f"  Features: {args.top_csv}")
-    print("\n[OK] Sube modelo_prediccion.pkl y top_features.csv al repo.")
+    subir = f"la carpeta {args.bundle}/, {args.out}" if args.out else f"la carpeta {args.bundle}/"
+    print(f"\n[OK] Sube {subir} y top_features.csv al repo.")
     print("=" * 65)
 
-
 if __name__ == "__main__":
     main()
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+generar_rankings_elo.py
+-----------------------
+Genera las imágenes del Ranking Elo mensual (una por cada mes con datos) a partir
+del historial de calcular_elo (antes se armaban y subían a mano Julio26.png, etc.).
+
+- El ranking de cada mes es el Elo acumulado al cierre del mes (IndiceEloHistorico).
+- Las imágenes se guardan en data/rankings_elo/ con nombre según el contenido del
+  ranking: si un mes no cambió, no se vuelve a dibujar.
+- manifest_<versión>.json indica, para cada versión del CSV, qué imagen le toca a
+  cada mes. La página de Rankings lo lee para descubrir los meses.
+- Los meses pendientes se dibujan en paralelo con un pool de procesos.
+- La página nunca dibuja: sólo lee el manifest más reciente. Hay que correr este
+  script cada vez que cambia el CSV (a mano, con cron o antes de subir el CSV) y
+  subir data/rankings_elo/ junto con el CSV si la app se despliega desde el repo.
+
+Uso:
+    python generar_rankings_elo.py
+    python generar_rankings_elo.py --top 30 --workers 4
+"""
+import argparse, os, sys, json, glob, hashlib
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+from utils import IndiceEloHistorico
+
+RANKINGS_DIR = os.path.join("data", "rankings_elo")
+TOP_DEFAULT  = 20
+RENDER_VERSION = 1   # subirlo si cambia el diseño: fuerza a redibujar todo
+
+MESES_ES = {1: 'Enero', 2: 'Febrero', 3: 'Marzo', 4: 'Abril', 5: 'Mayo', 6: 'Junio',
+            7: 'Julio', 8: 'Agosto', 9: 'Septiembre', 10: 'Octubre', 11: 'Noviembre',
+            12: 'Diciembre'}
+
+
+def etiqueta_mes(periodo):
+    """'2026-07' -> 'Julio 2026'."""
+    p = pd.Period(periodo, freq='M')
+    return f"{MESES_ES[p.month]} {p.year}"
+
+
+# ════════════════════════════════════════════════════════════════
+# 1. RANKINGS MENSUALES
+# ════════════════════════════════════════════════════════════════
+
+def rankings_mensuales(data_filas, top=TOP_DEFAULT):
+    """{'YYYY-MM': ranking top-N al cierre del mes} para cada mes del historial."""
+    if data_filas is None or data_filas.empty:
+        return {}
+    indice = IndiceEloHistorico(data_filas)
+    fechas = pd.to_datetime(data_filas['Fecha'])
+    meses = pd.period_range(fechas.min().to_period('M'), fechas.max().to_period('M'), freq='M')
+    return {str(m): indice.ranking(m.end_time).head(top) for m in meses}
+
+
+def _hash_ranking(ranking, top):
+    contenido = f"{RENDER_VERSION}|{top}|" + ranking.to_csv(index=False)
+    return hashlib.sha1(contenido.encode("utf-8")).hexdigest()[:16]
+
+
+# ════════════════════════════════════════════════════════════════
+# 2. DIBUJO (se ejecuta en los procesos del pool)
+# ════════════════════════════════════════════════════════════════
+
+def _font(size, bold=False):
+    candidatos = ([
+        "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",
+        "/usr/share/fonts/truetype/liberation/LiberationSans-Bold.ttf",
+        "C:/Windows/Fonts/arialbd.ttf",
+    ] if bold else [
+        "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+        "/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf",
+        "C:/Windows/Fonts/arial.ttf",
+    ])
+    for path in candidatos:
+        if os.path.exists(path):
+            try: return ImageFont.truetype(path, size)
+            except: pass
+    return ImageFont.load_default()
+
+
+def _render_mes(tarea):
+    """Dibuja un ranking mensual y lo guarda en tarea['ruta']. Recibe solo tipos
+    simples para poder viajar al proceso hijo."""
+    ruta, titulo, filas = tarea["ruta"], tarea["titulo"], tarea["filas"]
+
+    ROW_H, PAD, TITLE_H, WIDTH = 46, 28, 96, 620
+    HEIGHT = TITLE_H + ROW_H * (len(filas) + 1) + PAD * 2
+    BG_TOP, BG_BOT = (15, 17, 35), (25, 30, 60)
+    ROW_A, ROW_B   = (30, 34, 60), (22, 26, 50)
+    GOLD, SILVER, BRONZE = (255, 200, 50), (192, 200, 215), (200, 140, 80)
+    WHITE, CYAN, SUBTEXT, HEADER_TXT = (255, 255, 255), (90, 210, 255), (140, 150, 190), (160, 180, 255)
+
+    img  = Image.new("RGB", (WIDTH, HEIGHT), color=BG_TOP)
+    draw = ImageDraw.Draw(img)
+    for y in range(HEIGHT):
+        t = y / HEIGHT
+        draw.line([(0, y), (WIDTH, y)], fill=tuple(int(a + (b - a) * t) for a, b in zip(BG_TOP, BG_BOT)))
+
+    f_title, f_sub, f_head = _font(26, True), _font(14), _font(15, True)
+    f_rank, f_name, f_elo  = _font(20, True), _font(18, True), _font(18)
+
+    draw.rectangle([0, 0, WIDTH, 4], fill=GOLD)
+    draw.rectangle([0, HEIGHT - 4, WIDTH, HEIGHT], fill=GOLD)
+    draw.text((PAD, 18), "RANKING ELO", font=f_title, fill=GOLD)
+    draw.text((PAD, 54), f"{titulo}  ·  Top {len(filas)}  ·  Poketubi Stats", font=f_sub, fill=SUBTEXT)
+    draw.rectangle([PAD, TITLE_H - 4, WIDTH - PAD, TITLE_H - 2], fill=(60, 70, 120))
+
+    for label, cx in [("#", PAD), ("Jugador", 110), ("Elo", 500)]:
+        draw.text((cx, TITLE_H + 8), label, font=f_head, fill=HEADER_TXT)
+
+    for i, (rank, jugador, elo) in enumerate(filas):
+        y  = TITLE_H + ROW_H + i * ROW_H
+        draw.rectangle([PAD // 2, y, WIDTH - PAD // 2, y + ROW_H - 2], fill=ROW_A if i % 2 == 0 else ROW_B)
+        medal = GOLD if rank == 1 else SILVER if rank == 2 else BRONZE if rank == 3 else SUBTEXT
+        draw.rectangle([PAD // 2, y, PAD // 2 + 3, y + ROW_H - 2], fill=medal if rank <= 3 else (60, 80, 140))
+        cy = y + ROW_H // 2
+        draw.text((PAD, cy - 11), f"{rank}°", font=f_rank, fill=medal)
+        draw.text((110, cy - 10), str(jugador)[:32], font=f_name, fill=WHITE)
+        draw.text((500, cy - 10), str(elo), font=f_elo, fill=CYAN)
+
+    tmp = f"{ruta}.{os.getpid()}.tmp"
+    img.save(tmp, format="PNG")
+    os.replace(tmp, ruta)
+    return ruta
+
+
+# ════════════════════════════════════════════════════════════════
+# 3. GENERACIÓN POR LOTES
+# ════════════════════════════════════════════════════════════════
+
+def _ruta_manifest(version, out_dir):
+    return os.path.join(out_dir, f"manifest_{version[:16]}.json")
+
+
+def manifest_vigente(out_dir=RANKINGS_DIR):
+    """(ruta, versión, mtime_ns) del manifest más reciente de out_dir, o None si todavía
+    no se generó ninguno. La versión son los 16 primeros caracteres del hash del CSV."""
+    candidatos = []
+    for ruta in glob.glob(os.path.join(out_dir, "manifest_*.json")):
+        try:
+            candidatos.append((os.stat(ruta).st_mtime_ns, ruta))
+        except OSError:
+            pass
+    if not candidatos:
+        return None
+    mtime_ns, ruta = max(candidatos)
+    version = os.path.basename(ruta)[len("manifest_"):-len(".json")]
+    return ruta, version, mtime_ns
+
+
+def leer_manifest(ruta):
+    """{'YYYY-MM': ruta_png} de un manifest, o {} si no se puede leer."""
+    try:
+        with open(ruta) as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+
+def generar_imagenes(data_filas, version, out_dir=RANKINGS_DIR, top=TOP_DEFAULT, workers=None):
+    """
+    Genera (o reutiliza) la imagen de cada mes y escribe el manifest de la versión.
+    Devuelve (manifest, n_dibujadas). Solo se dibujan los meses cuyo top-N no tiene
+    ya una imagen con el mismo contenido; el resto se reutiliza tal cual.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    manifest, pendientes = {}, []
+    for mes, ranking in rankings_mensuales(data_filas, top).items():
+        if ranking.empty:
+            continue
+        ruta = os.path.join(out_dir, f"elo_{mes}_{_hash_ranking(ranking, top)}.png")
+        manifest[mes] = ruta
+        if not os.path.exists(ruta):
+            pendientes.append({"ruta": ruta, "titulo": etiqueta_mes(mes),
+                               "filas": list(ranking[['RANK', 'Participantes', 'Elo']]
+                                             .itertuples(index=False, name=None))})
+
+    if len(pendientes) > 1 and workers != 1:
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(_render_mes, pendientes))
+        except Exception as e:
+            print(f"Pool de procesos no disponible ({e}); dibujando en serie.")
+            for t in pendientes:
+                if not os.path.exists(t["ruta"]): _render_mes(t)
+    else:
+        for t in pendientes: _render_mes(t)
+
+    tmp = f"{_ruta_manifest(version, out_dir)}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp, _ruta_manifest(version, out_dir))
+
+    # manifests de otras versiones e imágenes que ya nadie usa
+    for viejo in glob.glob(os.path.join(out_dir, "manifest_*.json")):
+        if os.path.abspath(viejo) != os.path.abspath(_ruta_manifest(version, out_dir)):
+            try: os.remove(viejo)
+            except OSError: pass
+    vigentes = {os.path.abspath(r) for r in manifest.values()}
+    for png in glob.glob(os.path.join(out_dir, "elo_*.png")):
+        if os.path.abspath(png) not in vigentes:
+            try: os.remove(png)
+            except OSError: pass
+    return manifest, len(pendientes)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--out",     default=RANKINGS_DIR)
+    parser.add_argument("--top",     type=int, default=TOP_DEFAULT)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    from utils import version_datos
+    from vistas.elo import calcular_elo
+    version = version_datos()
+    _, data_filas, _ = calcular_elo()
+    manifest, n = generar_imagenes(data_filas, version, args.out, args.top, args.workers)
+    print(f"{len(manifest)} meses | {n} imágenes nuevas | {len(manifest) - n} reutilizadas")
+
+
+if __name__ == "__main__":
+    main()
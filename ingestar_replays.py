@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+ingestar_replays.py
+-------------------
+Descarga y parsea los replays nuevos del CSV de batallas fuera de la página de
+Uso de Pokémon, para correrlo con cron y que la página sólo lea el caché.
+
+- Recorre todas las Match_replays del CSV (mismo filtro de Rep que la página).
+- Pide sólo lo que no está en caché y no está en espera por fallos anteriores,
+  con el descargador concurrente de vistas/replays.py.
+- Al terminar recalcula el uso materializado y deja registro de la corrida
+  (la página lo muestra y deja de descargar por defecto).
+- Un archivo de bloqueo evita dos corridas a la vez si cron se superpone.
+
+Uso:
+    python ingestar_replays.py
+    python ingestar_replays.py --limite 500 --workers 16
+    python ingestar_replays.py --servidor http://127.0.0.1:8000   # replays de prueba locales
+
+Cron (cada 30 minutos):
+    */30 * * * * cd /ruta/al/proyecto && python ingestar_replays.py >> data/ingesta.log 2>&1
+"""
+import argparse, os, sys, time, datetime
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+from utils import load_data, normalize_columns, ensure_fields, version_datos
+import vistas.replays as replays
+
+LOCK_FILE  = os.path.join(replays.CACHE_DIR, "ingesta.lock")
+LOCK_VIEJO = 6 * 3600   # un bloqueo más viejo que esto se considera abandonado
+
+
+def _tomar_bloqueo(ruta=LOCK_FILE):
+    """True si se pudo crear el archivo de bloqueo (nadie más está ingestando)."""
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    try:
+        if time.time() - os.path.getmtime(ruta) > LOCK_VIEJO:
+            os.remove(ruta)
+    except OSError:
+        pass
+    try:
+        fd = os.open(ruta, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return False
+    with os.fdopen(fd, "w") as f:
+        f.write(str(os.getpid()))
+    return True
+
+
+def _progreso_consola(cada=50):
+    def _imprimir(hechos, total):
+        if hechos == total or hechos % cada == 0:
+            print(f"  {hechos}/{total} replays", flush=True)
+    return _imprimir
+
+
+def ingestar(limite=None, workers=replays.REPLAY_WORKERS, rate_por_host=replays.REPLAY_RATE_POR_HOST):
+    """Una pasada completa. Devuelve el resumen que queda registrado en el caché."""
+    df = ensure_fields(normalize_columns(load_data().copy()))
+    pendientes, info = replays._replays_a_analizar(df)
+    print(f"{pendientes['Match_replays'].nunique()} replays en el CSV (tras el filtro de Rep)")
+
+    t0 = time.time()
+    n_nuevos, n_fallidos = (0, 0) if pendientes.empty else replays._descargar_pendientes(
+        pendientes, info, progreso=_progreso_consola(), limite=limite,
+        workers=workers, rate_por_host=rate_por_host,
+    )
+    resumen = {
+        "fecha": datetime.datetime.now().isoformat(sep=" ", timespec="minutes"),
+        "nuevos": n_nuevos,
+        "fallidos": n_fallidos,
+        "omitidos": info.get("omitidos_por_fallos_previos", 0),
+        "pendientes": max(info.get("pendientes_de_descarga", 0) - n_nuevos - n_fallidos, 0),
+        "segundos": round(time.time() - t0, 1),
+    }
+    if n_nuevos or n_fallidos:
+        replays.materializar_uso(df, version_datos())
+    replays._registrar_ingesta(resumen)
+    return resumen
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--limite",   type=int,   default=None, help="máximo de replays a pedir en esta corrida")
+    parser.add_argument("--workers",  type=int,   default=replays.REPLAY_WORKERS)
+    parser.add_argument("--rate",     type=float, default=replays.REPLAY_RATE_POR_HOST,
+                        help="peticiones por segundo por host (0 = sin límite)")
+    parser.add_argument("--servidor", default=None, help="pedir los .json a otro servidor (pruebas)")
+    args = parser.parse_args()
+
+    if args.servidor:
+        replays.REPLAY_SERVIDOR = args.servidor
+    if not _tomar_bloqueo():
+        print("Ya hay una ingesta en curso; se omite esta corrida.")
+        return
+    try:
+        r = ingestar(args.limite, args.workers, args.rate)
+    finally:
+        try: os.remove(LOCK_FILE)
+        except OSError: pass
+    print(f"{r['nuevos']} nuevos | {r['fallidos']} fallidos | {r['omitidos']} en espera por fallos "
+          f"| {r['pendientes']} pendientes para la próxima | {r['segundos']} s")
+
+
+if __name__ == "__main__":
+    main()
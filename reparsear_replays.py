@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+reparsear_replays.py
+--------------------
+Rehace el caché de replays (data/replay_cache.sqlite) a partir de los logs crudos
+archivados en data/replay_logs/, sin pedir nada a Showdown.
+
+Sirve para aplicar un arreglo del parser (_parsear_replay, _parsear_teamsheet_texto,
+SIN_TEAMPREVIEW…) a todo lo ya descargado: se sube PARSER_VERSION en
+vistas/replays.py y se corre este script.
+
+- Por defecto sólo re-parsea las urls cuyo parser_version es distinto al actual
+  (y las que quedaron 'failed' aunque su log esté archivado); con --todos
+  re-parsea el archivo completo.
+- El parseo se reparte en un pool de procesos; los resultados se escriben por lotes
+  reemplazando las filas anteriores de cada url. Al terminar se recalcula el uso
+  materializado, así la página no tiene que hacerlo en la primera visita.
+
+- Con --benchmark no escribe nada: mide cuánto tarda _parsear_replay por replay
+  sobre los logs archivados (sin contar la lectura del disco).
+
+Uso:
+    python reparsear_replays.py
+    python reparsear_replays.py --todos --workers 4
+    python reparsear_replays.py --benchmark
+"""
+import argparse, os, sys, glob, time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+from vistas.replays import (REPLAY_LOGS_DIR, PARSER_VERSION, CACHE_COLS, _ruta_log,
+                            _leer_log_archivado, _parsear_replay, _leer_cache, _guardar_en_cache,
+                            materializar_uso)
+
+LOTE = 500   # urls por escritura en la base
+
+
+def _reparsear(ruta):
+    """(url, formato_esp, filas | None) de un log archivado. Se ejecuta en los procesos del pool."""
+    archivado = _leer_log_archivado(ruta)
+    if archivado is None:
+        return None, "", None
+    url, fmt = archivado["url"], archivado.get("formato_esp", "")
+    return url, fmt, _parsear_replay(url, archivado["replay"], fmt)
+
+
+def _fila_fallida(url, formato_esp=""):
+    fila = dict.fromkeys(CACHE_COLS, "")
+    fila.update(url=url, status="failed", formato_esp=formato_esp)
+    return fila
+
+
+def logs_a_reparsear(todos=False, logs_dir=REPLAY_LOGS_DIR):
+    """Rutas del archivo que hay que re-parsear."""
+    rutas = sorted(glob.glob(os.path.join(logs_dir, "*", "*.json.gz")))
+    if todos:
+        return rutas
+    cache = _leer_cache(status="ok")
+    al_dia = set(cache.loc[cache["parser_version"] == str(PARSER_VERSION), "url"])
+    # una url está al día sólo si TODAS sus filas lo están
+    al_dia -= set(cache.loc[cache["parser_version"] != str(PARSER_VERSION), "url"])
+    rutas_al_dia = {_ruta_log(u) for u in al_dia}
+    return [r for r in rutas if r not in rutas_al_dia]
+
+
+def reparsear(rutas, workers=None):
+    """Re-parsea los logs y reemplaza sus filas en el caché. Devuelve (n_ok, n_sin_pokemon)."""
+    n_ok, n_vacios, pendientes = 0, 0, []
+
+    def _volcar():
+        if pendientes:
+            _guardar_en_cache(pd.DataFrame(pendientes, columns=CACHE_COLS), reemplazar=True)
+            pendientes.clear()
+
+    if workers == 1 or len(rutas) < 2:
+        resultados = map(_reparsear, rutas)
+        pool = None
+    else:
+        pool = ProcessPoolExecutor(max_workers=workers)
+        resultados = pool.map(_reparsear, rutas, chunksize=64)
+    try:
+        for i, (url, fmt, filas) in enumerate(resultados, start=1):
+            if url is None:
+                continue
+            if filas is None:
+                pendientes.append(_fila_fallida(url, fmt))
+                n_vacios += 1
+            else:
+                pendientes.extend(filas)
+                n_ok += 1
+            if i % LOTE == 0:
+                _volcar()
+        _volcar()
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return n_ok, n_vacios
+
+
+def benchmark(rutas, repeticiones=3):
+    """Tiempo de parseo por replay (el mejor de `repeticiones`), en microsegundos."""
+    logs = [a for a in map(_leer_log_archivado, rutas) if a is not None]
+    tiempos = np.empty(len(logs))
+    for i, a in enumerate(logs):
+        mejor = float("inf")
+        for _ in range(repeticiones):
+            t0 = time.perf_counter()
+            _parsear_replay(a["url"], a["replay"], a.get("formato_esp", ""))
+            mejor = min(mejor, time.perf_counter() - t0)
+        tiempos[i] = mejor * 1e6
+    lineas = np.array([a["replay"].get("log", "").count("\n") + 1 for a in logs])
+    return pd.Series({
+        "replays": len(logs),
+        "lineas_promedio": lineas.mean() if len(logs) else 0,
+        "us_promedio": tiempos.mean() if len(logs) else 0,
+        "us_mediana": np.median(tiempos) if len(logs) else 0,
+        "us_p95": np.percentile(tiempos, 95) if len(logs) else 0,
+        "us_por_linea": tiempos.sum() / lineas.sum() if len(logs) else 0,
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--todos",   action="store_true", help="re-parsear también lo que ya está al día")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--benchmark", action="store_true", help="sólo medir el parser, sin escribir")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        print(benchmark(logs_a_reparsear(True)).round(1).to_string())
+        return
+
+    rutas = logs_a_reparsear(args.todos)
+    print(f"Parser v{PARSER_VERSION} | {len(rutas)} logs a re-parsear")
+    n_ok, n_vacios = reparsear(rutas, args.workers)
+    print(f"{n_ok} replays actualizados | {n_vacios} sin Pokémon identificables")
+    if n_ok or n_vacios:
+        from utils import load_data, normalize_columns, ensure_fields, version_datos
+        materializar_uso(ensure_fields(normalize_columns(load_data().copy())), version_datos())
+        print("Uso materializado actualizado.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,15 @@
+import os, sys
+
+import pytest
+
+# las rutas de datos del proyecto (CSV, data/) son relativas a la raíz
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+
+@pytest.fixture(scope="session")
+def batallas():
+    """Tabla de hechos del CSV del repo (la misma que usan las vistas)."""
+    from utils import load_data, preparar_batallas
+    return preparar_batallas(load_data())
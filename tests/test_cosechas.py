@@ -0,0 +1,327 @@
+"""Paridad de build_historial / build_cosechas con los bucles originales."""
+import numpy as np
+import pandas as pd
+import pytest
+
+import entrenar_modelo as em
+from entrenar_modelo import LIGAS_STD, REP_BUCKETS, VENTANAS
+
+
+# ── Referencia: el cálculo de antes, fila por fila ───────────────
+
+def _liga_cat_fila(row):
+    lg  = str(row.get("league", ""))
+    lc  = str(row.get("Ligas_categoria", ""))
+    return lc if (lg == "LIGA" and lc not in ["nan", "No Posee Liga", ""]) else lg
+
+
+def _instancia_fila(row, lcat):
+    lg = str(row.get("league", "")).upper()
+    if lg == "LIGA":
+        rnd = str(row.get("round", ""))
+        partes = rnd.split(" ")
+        temporada = partes[1] if len(partes) > 1 else rnd
+        return f"{lcat}_{temporada}"
+    torneo_id = row.get("tournament", row.get("round", ""))
+    return f"{lcat}_{torneo_id}"
+
+
+def _historial_bucles(df):
+    df_ok = df[df["Walkover"] == 0].copy()
+    tiers = sorted(df_ok["Tier"].dropna().unique().tolist())
+
+    rows = []
+    rep_counter = {}
+    for _, r in df_ok.iterrows():
+        ganador  = str(r["winner"]).strip()
+        p1, p2   = str(r["player1"]).strip(), str(r["player2"]).strip()
+        perdedor = p2 if ganador == p1 else p1
+        ym       = int(r["ym"])
+        fmt      = str(r.get("Formato", "SINGLES")).upper()
+        tier     = str(r.get("Tier", "")).strip()
+        lcat     = _liga_cat_fila(r)
+        fase_raw = str(r.get("Fase_completo", r.get("round", ""))).lower()
+        pob_g    = int(r.get("pokemons Sob", 0) or 0)
+        pob_v    = int(r.get("pokemon vencidos", 0) or 0)
+
+        instancia  = _instancia_fila(r, lcat)
+        key_rep    = (frozenset({p1, p2}), instancia, fmt)
+        rep_counter[key_rep] = rep_counter.get(key_rep, 0) + 1
+        rep_actual = rep_counter[key_rep]
+        rep_bucket = rep_actual if rep_actual <= 4 else 5
+
+        fase = "eliminatorias"
+        for k, v in em.FASES:
+            if k in fase_raw:
+                fase = v; break
+
+        ligas_flags = {f"liga_{l.lower()}": 1 if l in lcat.upper() else 0 for l in LIGAS_STD}
+
+        for jugador, es_g in [(ganador, True), (perdedor, False)]:
+            row_base = {
+                "jugador":       jugador,
+                "ym":            ym,
+                "gano":          1 if es_g else 0,
+                "fmt_singles":   1 if fmt == "SINGLES" else 0,
+                "fmt_dobles":    1 if fmt == "DOBLES"  else 0,
+                "fmt_vgc":       1 if fmt == "VGC"     else 0,
+                "cat_liga":      1 if "ST" in lcat or str(r.get("league","")) == "LIGA" else 0,
+                "cat_torneo":    1 if lcat == "TORNEO"  else 0,
+                "cat_ascenso":   1 if lcat == "ASCENSO" else 0,
+                "cat_cypher":    1 if lcat == "CYPHER"  else 0,
+                "fase_elim":     1 if fase == "eliminatorias" else 0,
+                "fase_grupos":   1 if fase == "grupos"        else 0,
+                "fase_jornadas": 1 if fase == "jornadas"      else 0,
+                "fase_rondas":   1 if fase == "rondas"        else 0,
+                "pokes_sob":     pob_g if es_g else max(0, 6 - pob_v),
+                "pokes_venc":    pob_v if es_g else max(0, 6 - pob_g),
+                "participo_liga":1 if any(l in lcat.upper() for l in LIGAS_STD) else 0,
+                "rep_actual":    rep_bucket,
+            }
+            for t in tiers:
+                row_base[f"wr_tier_{t}"] = (1 if es_g else 0) if tier == t else np.nan
+            for b in REP_BUCKETS:
+                row_base[f"wr_rep_{b}"] = (1 if es_g else 0) if rep_bucket == b else np.nan
+            row_base.update(ligas_flags)
+            rows.append(row_base)
+
+    return pd.DataFrame(rows), tiers
+
+
+def _cosechas_bucles(hist, tiers):
+    base_cols = [
+        "gano","fmt_singles","fmt_dobles","fmt_vgc",
+        "cat_liga","cat_torneo","cat_ascenso","cat_cypher",
+        "fase_elim","fase_grupos","fase_jornadas","fase_rondas",
+        "pokes_sob","pokes_venc","participo_liga","rep_actual",
+    ] + [f"liga_{l.lower()}" for l in LIGAS_STD] \
+      + [f"wr_tier_{t}" for t in tiers] \
+      + [f"wr_rep_{b}" for b in REP_BUCKETS]
+
+    all_ym    = sorted(hist["ym"].unique())
+    cosecha_rows = []
+    for jugador in hist["jugador"].unique():
+        h_j = hist[hist["jugador"] == jugador].copy()
+        for ym in all_ym:
+            row_cos = {"jugador": jugador, "ym": ym}
+            ym_dt = pd.Timestamp(year=ym // 100, month=ym % 100, day=1)
+            for n in VENTANAS:
+                ini_dt = ym_dt - pd.DateOffset(months=n)
+                ini_ym = ini_dt.year * 100 + ini_dt.month
+                ventana = h_j[(h_j["ym"] >= ini_ym) & (h_j["ym"] <= ym - 1)]
+                if ventana.empty:
+                    row_cos[f"n_batallas_m{n}"]  = 0
+                    row_cos[f"winrate_m{n}"]      = np.nan
+                    row_cos[f"meses_activo_m{n}"] = 0
+                    for col in base_cols:
+                        if col == "gano": continue
+                        if col.startswith("wr_"):
+                            row_cos[f"{col}_m{n}"] = np.nan
+                        else:
+                            row_cos[f"{col}_sum_m{n}"]  = 0
+                            row_cos[f"{col}_mean_m{n}"] = np.nan
+                else:
+                    n_bat  = len(ventana)
+                    row_cos[f"n_batallas_m{n}"]  = n_bat
+                    row_cos[f"winrate_m{n}"]      = ventana["gano"].sum() / n_bat
+                    row_cos[f"meses_activo_m{n}"] = ventana["ym"].nunique()
+                    for col in base_cols:
+                        if col == "gano": continue
+                        if col.startswith("wr_"):
+                            sub = ventana[col].dropna()
+                            row_cos[f"{col}_m{n}"] = sub.mean() if len(sub) > 0 else np.nan
+                        else:
+                            row_cos[f"{col}_sum_m{n}"]  = ventana[col].fillna(0).sum()
+                            row_cos[f"{col}_mean_m{n}"] = ventana[col].fillna(0).mean()
+            cosecha_rows.append(row_cos)
+    return pd.DataFrame(cosecha_rows)
+
+
+# ── Historiales de prueba ────────────────────────────────────────
+
+def _sintetico():
+    """~80 batallas entre 6 jugadores, con huecos de meses y cruce de años, para
+    que todas las ventanas (1 a 36 meses) tengan casos llenos, parciales y vacíos."""
+    rng = np.random.default_rng(7)
+    jugadores = ["Ash", "Misty", "Brock ", "Gary", "May", "Dawn"]
+    meses = pd.to_datetime(["2021-11-03", "2021-12-20", "2022-01-15", "2022-06-01", "2023-02-11",
+                            "2023-03-09", "2023-12-30", "2024-01-02", "2024-11-17", "2025-02-05"])
+    ligas = [("LIGA", "PMS", "Jornada 1 T5"), ("LIGA", "PJS", "Jornada 2 T5"), ("LIGA", "No Posee Liga", "Fase de grupos"),
+             ("TORNEO", "No Posee Liga", "RONDA SUIZA 1"), ("TORNEO", "No Posee Liga", "Cuartos de Final"),
+             ("ASCENSO", "No Posee Liga", "Playoff"), ("CYPHER", "No Posee Liga", "Final")]
+    filas = []
+    for i in range(80):
+        a, b = rng.choice(len(jugadores), 2, replace=False)
+        league, cat, rnd = ligas[rng.integers(len(ligas))]
+        if i % 9 == 0:   # el mismo cruce en la misma liga, para llegar a Rep 5+
+            (a, b), (league, cat, rnd) = (0, 1) if i % 2 else (1, 0), ligas[0]
+        filas.append({
+            "player1": jugadores[a], "player2": jugadores[b],
+            "winner": jugadores[a if rng.random() < 0.55 else b].strip(),
+            "date": meses[rng.integers(len(meses))] + pd.Timedelta(days=int(rng.integers(0, 5))),
+            "league": league, "Ligas_categoria": cat, "round": rnd, "Fase_completo": rnd,
+            "Formato": rng.choice(["SINGLES", "DOBLES", "VGC", "vgc"]),
+            "Tier": rng.choice(["OU", "VGC", "DOU", None]),
+            "pokemons Sob": int(rng.integers(1, 7)), "pokemon vencidos": int(rng.choice([6, 6, 6, 3])),
+            "Walkover": 0 if i % 13 else 1,
+        })
+    df = pd.DataFrame(filas)
+    df["ym"] = df["date"].dt.year * 100 + df["date"].dt.month
+    return df.sort_values("date", kind="stable").reset_index(drop=True)
+
+
+def _del_csv():
+    """Las batallas del CSV del repo entre cinco jugadores frecuentes."""
+    from utils import load_data
+    df, _ = em._prep(load_data())
+    jugados = df[df["Walkover"] == 0]
+    frecuentes = pd.concat([jugados["player1"], jugados["player2"]]).str.strip().value_counts().index[:5]
+    entre = df["player1"].str.strip().isin(frecuentes) & df["player2"].str.strip().isin(frecuentes)
+    return df[entre].reset_index(drop=True)
+
+
+@pytest.fixture(scope="module", params=["sintetico", "csv"])
+def batallas_prueba(request):
+    return _sintetico() if request.param == "sintetico" else _del_csv()
+
+
+def test_historial_igual_a_los_bucles(batallas_prueba):
+    hist, tiers = em.build_historial(batallas_prueba)
+    hist_ref, tiers_ref = _historial_bucles(batallas_prueba)
+    assert tiers == tiers_ref
+    assert list(hist.columns) == list(hist_ref.columns)
+    pd.testing.assert_frame_equal(hist, hist_ref, check_dtype=False)
+
+
+def test_cosechas_iguales_a_los_bucles(batallas_prueba):
+    hist, tiers = em.build_historial(batallas_prueba)
+    cos = em.build_cosechas(hist, tiers)
+    cos_ref = _cosechas_bucles(hist, tiers)
+    assert list(cos.columns) == list(cos_ref.columns)
+    assert len(cos) == len(cos_ref) > 0
+    for n in VENTANAS:
+        cols = [c for c in cos.columns if c.endswith(f"_m{n}")]
+        assert cols, n
+        pd.testing.assert_frame_equal(cos[["jugador", "ym"] + cols], cos_ref[["jugador", "ym"] + cols],
+                                      check_dtype=False, rtol=1e-9, obj=f"ventana de {n} meses")
+
+
+# ── Cosecha vigente: la búsqueda por fila de antes ───────────────
+
+def _ultima_cosecha_fila(cos, jugador, ym, estricto):
+    sub = cos[(cos["jugador"] == jugador) & ((cos["ym"] < ym) if estricto else (cos["ym"] <= ym))]
+    if sub.empty: return None
+    return sub.sort_values("ym").iloc[-1]
+
+
+def _dataset_bucles(df_battles, cos):
+    df_ok = df_battles[df_battles["Walkover"] == 0].copy()
+    feat_cols = [c for c in cos.columns if c not in ["jugador", "ym"]]
+    rows = []
+    for _, r in df_ok.iterrows():
+        ganador  = str(r["winner"]).strip()
+        p1, p2   = str(r["player1"]).strip(), str(r["player2"]).strip()
+        perdedor = p2 if ganador == p1 else p1
+        ym       = int(r["ym"])
+        cos_g = _ultima_cosecha_fila(cos, ganador, ym, estricto=True)
+        cos_p = _ultima_cosecha_fila(cos, perdedor, ym, estricto=True)
+        if cos_g is None or cos_p is None: continue
+        fila = {"ym_batalla": ym, "ganador": ganador, "perdedor": perdedor}
+        for c in feat_cols:
+            fila[f"{c}_g"] = cos_g[c] if c in cos_g.index else np.nan
+            fila[f"{c}_p"] = cos_p[c] if c in cos_p.index else np.nan
+        rows.append(fila)
+    return pd.DataFrame(rows)
+
+
+def _pred_bucles(df_pend, cos, top_feat):
+    feat_cols_base = list({c[:-2] for c in top_feat if c.endswith(("_g","_p"))})
+    max_ym = int(cos["ym"].max()) if not cos.empty else 999999
+    rows = []
+    for _, r in df_pend.iterrows():
+        p1, p2 = str(r["player1"]).strip(), str(r["player2"]).strip()
+        ym     = int(r.get("ym", 0))
+        ym_ref = max_ym if ym == 0 else ym
+        cos1   = _ultima_cosecha_fila(cos, p1, ym_ref, estricto=False)
+        cos2   = _ultima_cosecha_fila(cos, p2, ym_ref, estricto=False)
+        fila   = {"player1": p1, "player2": p2, "ym": ym,
+                  "Formato":    r.get("Formato",""),
+                  "Tier":       r.get("Tier",""),
+                  "Aka_evento": r.get("Aka_evento",""),
+                  "round":      r.get("round",""),
+                  "N_Torneo":   r.get("N_Torneo","")}
+        for c in feat_cols_base:
+            fila[f"{c}_g"] = cos1[c] if cos1 is not None and c in cos1.index else np.nan
+            fila[f"{c}_p"] = cos2[c] if cos2 is not None and c in cos2.index else np.nan
+        rows.append(fila)
+    pred_df = pd.DataFrame(rows)
+    for c in top_feat:
+        if c not in pred_df.columns:
+            pred_df[c] = 0.0
+    return pred_df
+
+
+@pytest.fixture(scope="module")
+def cosechas_prueba(batallas_prueba):
+    hist, tiers = em.build_historial(batallas_prueba)
+    return em.build_derived(em.build_cosechas(hist, tiers))
+
+
+def _consultas(cos):
+    """Todos los (jugador, mes) del rango de cos, más uno sin cosecha y meses antes del primero."""
+    jugadores = list(cos["jugador"].unique()) + ["Nadie"]
+    yms = sorted(cos["ym"].unique())
+    yms = [yms[0] - 1, yms[0]] + yms[1:] + [yms[-1] + 1]
+    return [(j, ym) for j in jugadores for ym in yms]
+
+
+@pytest.mark.parametrize("estricto", [True, False])
+def test_cosecha_asof_igual_a_la_busqueda_por_fila(cosechas_prueba, estricto):
+    cos = cosechas_prueba
+    cols = [c for c in cos.columns if c not in ["jugador", "ym"]][:40]
+    consultas = _consultas(cos)
+    jugadores, yms = zip(*consultas)
+    feats, hay = em._cosecha_asof(jugadores, yms, cos, cols, estricto)
+    assert len(feats) == len(consultas)
+    assert not hay[[j == "Nadie" for j in jugadores]].any()
+    for i, (j, ym) in enumerate(consultas):
+        ref = _ultima_cosecha_fila(cos, j, ym, estricto)
+        assert hay[i] == (ref is not None), (j, ym)
+        if ref is not None:
+            np.testing.assert_allclose(feats.iloc[i].to_numpy(dtype=float), ref[cols].to_numpy(dtype=float),
+                                       rtol=1e-12, equal_nan=True, err_msg=f"{j} {ym}")
+        else:
+            assert feats.iloc[i].isna().all()
+
+
+def test_build_dataset_igual_a_la_busqueda_por_fila(batallas_prueba, cosechas_prueba):
+    X, y, all_feat, data = em.build_dataset(batallas_prueba, cosechas_prueba)
+    ref = _dataset_bucles(batallas_prueba, cosechas_prueba)
+    # mismo barajado que build_dataset, para comparar fila a fila
+    ref = ref.sample(frac=1, random_state=42).reset_index(drop=True)
+    assert list(data.columns) == list(ref.columns)
+    pd.testing.assert_frame_equal(data, ref, check_dtype=False, rtol=1e-12)
+    assert len(X) == len(y) == len(ref)
+    assert list(X.columns) == all_feat
+
+
+@pytest.mark.parametrize("con_ym", [True, False])
+def test_build_pred_features_igual_a_la_busqueda_por_fila(cosechas_prueba, con_ym):
+    cos = cosechas_prueba
+    jugadores = list(cos["jugador"].unique())
+    yms = sorted(cos["ym"].unique())
+    # ym=0 (sin fecha), antes de la primera cosecha, exacto y posterior; "Nadie" sin cosecha
+    pend = pd.DataFrame({
+        "player1": [jugadores[0], jugadores[1] + " ", "Nadie", jugadores[2], jugadores[0]],
+        "player2": [jugadores[1], jugadores[2], jugadores[0], "Nadie", jugadores[-1]],
+        "ym":      [0, yms[0] - 1, yms[len(yms) // 2], 0, yms[-1] + 3],
+        "Formato": ["SINGLES"] * 5, "Tier": ["OU"] * 5, "round": ["Final"] * 5,
+    })
+    if not con_ym:
+        pend = pend.drop(columns="ym")
+    top_feat = ["winrate_m3_g", "winrate_m3_p", "n_batallas_m12_p", "wr_diff_m1_vs_m12_g",
+                "log_n_batallas_m36_g", "no_existe_g"]
+    pred = em.build_pred_features(pend, cos, top_feat)
+    ref = _pred_bucles(pend, cos, top_feat)
+    assert set(pred.columns) == set(ref.columns)
+    pd.testing.assert_frame_equal(pred, ref[list(pred.columns)], check_dtype=False, rtol=1e-12)
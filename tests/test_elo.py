@@ -0,0 +1,147 @@
+"""Paridad de motor_elo / motor_elo_pistas con el cálculo original con PSElo, y del
+checkpoint incremental con el recálculo completo."""
+import logging
+
+import pandas as pd
+import pytest
+
+import vistas.elo as vistas_elo
+from vistas.elo import (PSElo, PISTAS_ELO, MESES_ACTIVIDAD_GLOBAL, _partidas_elo,
+                        _elo_desde_partidas, _elo_multipista)
+
+
+def _elo_pselo(elo, meses_actividad, elo_inicial):
+    """El cálculo de antes de motor_elo: PSElo y búsquedas con máscara por batalla."""
+    todos = pd.concat([elo['Ganador'], elo['Perdedor']]).unique()
+    data_elo = pd.DataFrame({'Participantes': todos, 'Elo': elo_inicial})
+    data_filas = pd.DataFrame({
+        'Jugador_A': [''] * len(elo), 'Rating_A': [0.0] * len(elo),
+        'Rating_A_NEW': [0.0] * len(elo), 'Jugador_B': [''] * len(elo),
+        'Rating_B': [0.0] * len(elo), 'Rating_B_NEW': [0.0] * len(elo),
+        'Fecha': elo['date'].values,
+    })
+    for i in range(len(elo)):
+        g, p = elo.loc[i, 'Ganador'], elo.loc[i, 'Perdedor']
+        ra = data_elo.loc[data_elo['Participantes'] == g, 'Elo'].values[0]
+        rb = data_elo.loc[data_elo['Participantes'] == p, 'Elo'].values[0]
+        PSElo(ra).update_rating(g, p, ra, rb, 1, data_elo, data_filas, i)
+    per = elo[['Perdedor', 'date']].rename(columns={'Perdedor': 'Jugador', 'date': 'Fecha'})
+    gan = elo[['Ganador', 'date']].rename(columns={'Ganador': 'Jugador', 'date': 'Fecha'})
+    dfechas = pd.concat([per, gan]).groupby('Jugador')['Fecha'].max().reset_index()
+    data_elo = pd.merge(data_elo, dfechas, how='left', left_on='Participantes', right_on='Jugador')
+    del data_elo['Jugador']
+    cutoff = pd.Timestamp.now() - pd.DateOffset(months=meses_actividad)
+    data_elo['Actividad'] = data_elo['Fecha'].apply(lambda x: 'Activo' if pd.notna(x) and x >= cutoff else 'Inactivo')
+    data_elo = data_elo.sort_values('Elo', ascending=False).reset_index(drop=True)
+    data_elo['RANK'] = range(1, len(data_elo) + 1)
+    return data_elo, data_filas
+
+
+def _comparar(obtenido, esperado):
+    pd.testing.assert_frame_equal(obtenido[0], esperado[0])
+    pd.testing.assert_frame_equal(obtenido[1], esperado[1])
+
+
+@pytest.fixture(scope="module")
+def pistas(batallas):
+    return _elo_multipista(batallas)
+
+
+def _partidas_de_pista(batallas, columna, valor):
+    return _partidas_elo(batallas[batallas[columna] == valor])
+
+
+@pytest.fixture(scope="module")
+def global_pselo(batallas):
+    return _elo_pselo(_partidas_elo(batallas), MESES_ACTIVIDAD_GLOBAL, 1000)
+
+
+def test_global_motor_elo(batallas, global_pselo):
+    _comparar(_elo_desde_partidas(_partidas_elo(batallas), MESES_ACTIVIDAD_GLOBAL), global_pselo)
+
+
+def test_global_multipista(pistas, global_pselo):
+    _comparar(pistas['global'], global_pselo)
+
+
+@pytest.mark.parametrize("columna", list(PISTAS_ELO))
+def test_pistas_formato_tier(batallas, pistas, columna):
+    meses, inicial = PISTAS_ELO[columna]
+    valores = [v for v in batallas[columna].dropna().unique()
+               if not _partidas_de_pista(batallas, columna, v).empty]
+    assert valores and sorted(pistas[columna]) == sorted(valores)
+    for valor in valores:
+        elo = _partidas_de_pista(batallas, columna, valor)
+        esperado = _elo_pselo(elo, meses, inicial)
+        _comparar(_elo_desde_partidas(elo, meses, inicial), esperado)
+        _comparar(pistas[columna][valor], esperado)
+
+
+# ── Checkpoint incremental ───────────────────────────────────────
+
+def _comparar_pistas(obtenido, esperado):
+    _comparar(obtenido['global'], esperado['global'])
+    pd.testing.assert_frame_equal(obtenido['global'][2], esperado['global'][2])
+    for columna in PISTAS_ELO:
+        assert sorted(obtenido.get(columna, {})) == sorted(esperado.get(columna, {}))
+        for valor in esperado.get(columna, {}):
+            _comparar(obtenido[columna][valor], esperado[columna][valor])
+
+
+@pytest.fixture
+def batallas_procesadas(monkeypatch):
+    """Cantidad de batallas que recibe el motor en cada llamada."""
+    llamadas = []
+    original = vistas_elo.motor_elo_pistas
+    def _contar(id_gan, *args, **kwargs):
+        llamadas.append(len(id_gan))
+        return original(id_gan, *args, **kwargs)
+    monkeypatch.setattr(vistas_elo, "motor_elo_pistas", _contar)
+    return llamadas
+
+
+def _hasta(batallas, corte):
+    return batallas[batallas['date'] < corte]
+
+
+def test_checkpoint_retoma_con_batallas_nuevas(batallas, pistas, tmp_path, batallas_procesadas):
+    ruta = str(tmp_path / "elo_checkpoint.pkl")
+    corte = batallas['date'].quantile(0.8)
+    n_prefijo = len(_partidas_elo(_hasta(batallas, corte)))
+    n_total = len(_partidas_elo(batallas))
+    assert 0 < n_prefijo < n_total
+
+    _elo_multipista(_hasta(batallas, corte), ruta_checkpoint=ruta)
+    retomado = _elo_multipista(batallas, ruta_checkpoint=ruta)
+    # la segunda corrida solo procesa las batallas posteriores al checkpoint
+    assert batallas_procesadas == [n_prefijo, n_total - n_prefijo]
+    _comparar_pistas(retomado, pistas)
+
+    # sin cambios: nada que procesar, mismo resultado
+    _comparar_pistas(_elo_multipista(batallas, ruta_checkpoint=ruta), pistas)
+    assert batallas_procesadas[-1] == 0
+
+
+def test_checkpoint_invalido_si_cambia_el_historial(batallas, pistas, tmp_path, batallas_procesadas):
+    ruta = str(tmp_path / "elo_checkpoint.pkl")
+    corte = batallas['date'].quantile(0.8)
+    editadas = batallas.copy()
+    i = editadas.index[editadas['winner'].notna() & ~editadas['pendiente']
+                       & (editadas['date'] < batallas['date'].quantile(0.2))][0]
+    editadas.loc[i, ['winner', 'perdedor']] = editadas.loc[i, ['perdedor', 'winner']].to_numpy()
+
+    _elo_multipista(_hasta(editadas, corte), ruta_checkpoint=ruta)
+    recalculado = _elo_multipista(batallas, ruta_checkpoint=ruta)
+    # la batalla histórica editada invalida el prefijo: se recalcula todo
+    assert batallas_procesadas[-1] == len(_partidas_elo(batallas))
+    _comparar_pistas(recalculado, pistas)
+
+
+def test_checkpoint_que_no_se_puede_guardar(batallas, pistas, tmp_path, caplog):
+    ruta = str(tmp_path / "no_es_directorio" / "elo_checkpoint.pkl")
+    (tmp_path / "no_es_directorio").write_text("")
+    with caplog.at_level(logging.WARNING, logger="vistas.elo"):
+        out = _elo_multipista(batallas, ruta_checkpoint=ruta)
+    _comparar_pistas(out, pistas)
+    assert "No se pudo guardar el checkpoint de Elo" in caplog.text
+    assert list(tmp_path.iterdir()) == [tmp_path / "no_es_directorio"]
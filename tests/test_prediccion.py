@@ -0,0 +1,142 @@
+"""Predicción: orientación de SHAP, predicciones precalculadas de las pendientes,
+features de los cruces y tablas del bundle."""
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import GradientBoostingClassifier, RandomForestClassifier
+
+from utils import shap_hacia_p1
+
+
+def _datos(n=300, semilla=3):
+    rng = np.random.default_rng(semilla)
+    X = pd.DataFrame(rng.normal(size=(n, 4)), columns=["wr_g", "wr_p", "nb_g", "nb_p"])
+    # clase 0 = gana player1: más probable cuanto mejor su winrate
+    y = (X["wr_g"] - X["wr_p"] + rng.normal(scale=0.5, size=n) < 0).astype(int)
+    return X, y
+
+
+MODELOS = {
+    "rf":  lambda: RandomForestClassifier(n_estimators=20, max_depth=4, random_state=0),
+    "gbm": lambda: GradientBoostingClassifier(n_estimators=30, max_depth=2, random_state=0),
+}
+
+
+@pytest.mark.parametrize("nombre", list(MODELOS))
+def test_shap_hacia_p1_suma_prob_p1(nombre):
+    shap = pytest.importorskip("shap")
+    X, y = _datos()
+    modelo = MODELOS[nombre]().fit(X, y)
+    expl = shap.TreeExplainer(modelo)
+    sv = shap_hacia_p1(expl.shap_values(X.head(25)))
+    assert sv.shape == (25, X.shape[1])
+
+    prob_p1 = modelo.predict_proba(X.head(25))[:, 0]
+    base = np.ravel(expl.expected_value)
+    if len(base) == 2:   # probabilidades por clase (Random Forest)
+        np.testing.assert_allclose(base[0] + sv.sum(axis=1), prob_p1, atol=1e-6)
+    else:                # log-odds de la clase 1 (GBM / XGBoost / LightGBM)
+        np.testing.assert_allclose(1 / (1 + np.exp(base[0] - sv.sum(axis=1))), prob_p1, atol=1e-6)
+
+    # una sola fila (el gráfico del enfrentamiento manual)
+    fila = shap_hacia_p1(expl.shap_values(X.head(1)))[0]
+    np.testing.assert_allclose(fila, sv[0], atol=1e-9)
+    # positivo = favorece a player1: un winrate alto de player1 empuja hacia él
+    alto = (X.head(25)["wr_g"] > 0.5).to_numpy()
+    assert alto.any() and sv[alto, 0].mean() > 0
+
+
+def test_pendientes_precalculadas_igual_al_calculo_en_vivo():
+    import entrenar_modelo as em
+    from vistas.prediccion import _predecir_pendientes
+
+    X, y = _datos()
+    top_feat = list(X.columns)
+    trained = {n: f().fit(X, y) for n, f in MODELOS.items()}
+
+    # pendientes de prueba: nulos en features, una probabilidad 50/50 exacta y nombres repetidos
+    pend = X.sample(40, random_state=1).reset_index(drop=True)
+    pend.loc[[3, 7], "nb_g"] = np.nan
+    pend["player1"] = [f"J{i % 7}" for i in range(len(pend))]
+    pend["player2"] = [f"J{(i + 3) % 7}" for i in range(len(pend))]
+
+    class _Mitad:
+        def predict_proba(self, X):
+            return np.full((len(X), 2), 0.5)
+    trained["mitad"] = _Mitad()
+
+    pre = em.puntuar_pendientes(trained, pend, top_feat)
+    cols = ["prob_p1", "prob_p2", "favorito", "confianza"]
+    for nombre, modelo in trained.items():
+        vivo = _predecir_pendientes(modelo, pend, top_feat)
+        pd.testing.assert_frame_equal(pre[nombre][cols], vivo[cols], check_dtype=False, obj=nombre)
+    assert (pre["mitad"]["favorito"] == pend["player1"]).all()
+
+
+# ── Features de los cruces: el armado por par de antes ───────────
+
+def _fila_por_par(j1, j2, latest_stats, feature_cols):
+    def gs(jug):
+        r = latest_stats[latest_stats["Jugador"] == jug]
+        if r.empty:
+            return {}
+        return r.iloc[0].to_dict()
+    s1, s2 = gs(j1), gs(j2)
+    feat = {}
+    for c in feature_cols:
+        if c.endswith("_g"):
+            feat[c] = s1.get(c[:-2], 0)
+        elif c.endswith("_p"):
+            feat[c] = s2.get(c[:-2], 0)
+        else:
+            feat[c] = 0
+    row = pd.DataFrame([feat])
+    for c in feature_cols:
+        if c not in row.columns: row[c] = 0
+    return row[feature_cols].fillna(0)
+
+
+def test_features_enfrentamientos_igual_al_armado_por_par():
+    from vistas.prediccion import features_enfrentamientos, make_pred_row
+    rng = np.random.default_rng(11)
+    stats = pd.DataFrame({
+        "Jugador": ["Ash", "Misty", "Brock", "Misty", "Gary"],   # Misty repetida: vale la primera
+        "winrate_m3":    rng.random(5),
+        "n_batallas_m12": rng.integers(0, 30, 5),
+        "wr_diff_m1_vs_m12": [0.1, np.nan, -0.2, 0.5, np.nan],
+    })
+    feature_cols = ["winrate_m3_g", "winrate_m3_p", "n_batallas_m12_p", "wr_diff_m1_vs_m12_g",
+                    "wr_diff_m1_vs_m12_p", "no_existe_g", "sin_sufijo"]
+    j1 = ["Ash", "Misty", "Nadie", "Gary"]        # Nadie no tiene cosecha
+    j2 = ["Brock", "Misty", "Ash", "Nadie", "Gary"]
+
+    X = features_enfrentamientos(stats, feature_cols, j1, j2)
+    assert list(X.columns) == feature_cols
+    assert len(X) == len(j1) * len(j2)
+    ref = pd.concat([_fila_por_par(a, b, stats, feature_cols) for a in j1 for b in j2], ignore_index=True)
+    pd.testing.assert_frame_equal(X, ref, check_dtype=False)
+    pd.testing.assert_frame_equal(make_pred_row("Misty", "Nadie", stats, feature_cols),
+                                  _fila_por_par("Misty", "Nadie", stats, feature_cols), check_dtype=False)
+
+
+# ── Tablas del bundle: memory-mapped sin copiar las columnas numéricas ──
+
+def test_tablas_del_bundle_sin_copia(tmp_path):
+    import entrenar_modelo as em
+    from vistas.prediccion import _load_bundle
+    X, y = _datos()
+    stats = pd.DataFrame({"jugador": [f"J{i}" for i in range(50)], "winrate_m3": np.linspace(0, 1, 50),
+                          "n_batallas_m12": np.arange(50), "wr_diff_m1_vs_m12": [np.nan] + [0.5] * 49})
+    em.guardar_bundle(str(tmp_path), {"rf": MODELOS["rf"]().fit(X, y)}, tablas={"latest_stats": stats},
+                      meta={"results": {}, "top_feat": list(X.columns)})
+    cache = _load_bundle(str(tmp_path))
+    tabla = cache["latest_stats"]
+    pd.testing.assert_frame_equal(tabla, stats)
+    # numéricas sin nulos: vistas de solo lectura sobre el archivo, sin copia
+    for c in ["winrate_m3", "n_batallas_m12"]:
+        v = tabla[c].to_numpy()
+        assert not v.flags.writeable and not v.flags.owndata, c
+    # una copia sí se puede modificar, y la tabla cacheada no cambia
+    otra = tabla.copy()
+    otra["winrate_m3"] += 1
+    assert tabla["winrate_m3"].iloc[-1] == 1.0
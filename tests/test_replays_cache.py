@@ -0,0 +1,123 @@
+"""Caché SQLite de replays: apertura, esquema y migraciones."""
+import sqlite3
+from contextlib import closing
+
+import pytest
+
+import vistas.replays as replays
+
+
+@pytest.fixture
+def cache(monkeypatch, tmp_path):
+    monkeypatch.setattr(replays, "CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(replays, "CACHE_DB", str(tmp_path / "replay_cache.sqlite"))
+    monkeypatch.setattr(replays, "CACHE_FILE", str(tmp_path / "replay_cache.csv"))
+    return tmp_path
+
+
+def _contar_esquemas(monkeypatch):
+    llamadas = []
+    original = replays._crear_esquema
+    monkeypatch.setattr(replays, "_crear_esquema", lambda con: (llamadas.append(1), original(con)))
+    return llamadas
+
+
+def test_esquema_una_vez_por_proceso(cache, monkeypatch):
+    llamadas = _contar_esquemas(monkeypatch)
+    for _ in range(5):
+        with closing(replays._conectar_cache()) as con:
+            tablas = {t for (t,) in con.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert len(llamadas) == 1
+    assert {"replay_detalle", "replay_componentes", "replay_fallos", "cache_meta"} <= tablas
+    assert replays._generacion_cache() == 0
+
+    # otra ruta (otra base) se prepara por su cuenta
+    monkeypatch.setattr(replays, "CACHE_DB", str(cache / "otra.sqlite"))
+    replays._resumen_cache()
+    replays._resumen_cache()
+    assert len(llamadas) == 2
+
+
+def test_base_borrada_se_vuelve_a_crear(cache, monkeypatch):
+    llamadas = _contar_esquemas(monkeypatch)
+    replays._guardar_en_cache(replays.pd.DataFrame([{"url": "u1", "status": "ok", "player_id": "p1",
+                                                     "pokemon": "Pikachu", "moves": "Thunderbolt"}]))
+    (cache / "replay_cache.sqlite").unlink()
+    assert replays._leer_cache(["u1"]).empty
+    assert len(llamadas) == 2
+
+
+def test_migra_bases_anteriores(cache):
+    # base de una versión anterior: sin columnas nuevas ni replay_componentes
+    with closing(sqlite3.connect(replays.CACHE_DB)) as con, con:
+        con.execute("CREATE TABLE replay_detalle (url TEXT NOT NULL DEFAULT '', status TEXT NOT NULL DEFAULT '', "
+                    "player_id TEXT NOT NULL DEFAULT '', pokemon TEXT NOT NULL DEFAULT '', "
+                    "moves TEXT NOT NULL DEFAULT '', PRIMARY KEY (url, player_id, pokemon)) WITHOUT ROWID")
+        con.execute("INSERT INTO replay_detalle VALUES ('u1', 'ok', 'p1', 'Pikachu', 'Thunderbolt; Surf')")
+
+    filas = replays._leer_cache(["u1"], status="ok")
+    assert list(filas.columns) == replays.CACHE_COLS
+    assert set(replays._leer_componentes(["u1"])["valor"]) == {"Thunderbolt", "Surf"}
+
+
+def _fila(url, jugador, pokemon, win, moves):
+    return {"url": url, "status": "ok", "player_id": jugador, "pokemon": pokemon, "win": win,
+            "moves": moves, "formato_esp": "OU"}
+
+
+def test_uso_materializado_igual_al_detalle(cache):
+    replays._guardar_en_cache(replays.pd.DataFrame([
+        _fila("https://r/1", "p1", "Pikachu", "True", "Thunderbolt; Surf"),
+        _fila("https://r/1", "p2", "Starmie", "False", "Surf"),
+        _fila("https://r/2", "p1", "Pikachu", "False", "Thunderbolt"),
+        _fila("https://r/2", "p2", "Gengar", "True", "Shadow Ball"),
+        _fila("https://r/3", "p1", "Gengar", "True", "Shadow Ball; Protect"),
+    ]))
+    # r/1 está cargada en dos partidas de meses distintos; r/2 repetida en el mismo grupo
+    df = replays.pd.DataFrame({
+        "Match_replays": ["https://r/1", "https://r/1", "https://r/2", "https://r/2 ", "https://r/3"],
+        "date": ["2026-01-05", "2026-02-05", "2026-01-10", "2026-01-11", "2026-02-20"],
+        "Formato": "SINGLES", "Formato_esp": "OU", "Tier": "OU", "Rep": 1,
+    })
+    replays.materializar_uso(df, "prueba")
+    grupos, uso, comp = replays.uso_materializado.__wrapped__("prueba", replays._generacion_cache())
+    assert grupos.set_index("mes")["replays"].to_dict() == {"2026-01": 2, "2026-02": 2}
+
+    def _orden(t, claves):
+        return t.astype({c: str for c in claves}).sort_values(claves).reset_index(drop=True)
+
+    for meses in [[], ["2026-01"], ["2026-02"], ["2026-01", "2026-02"]]:
+        uso_m, comp_m, equipos_m = replays._uso_seleccion(grupos, uso, comp, {"mes": meses})
+        sel = df[df["date"].str[:7].isin(meses)] if meses else df
+        detalle, comp_d, equipos_d, *_ = replays._cargar_todos_replays_detalle(sel, descargar=False)
+        uso_d, comp_d = replays._agregar_uso(detalle, comp_d)
+
+        assert equipos_m == equipos_d
+        replays.pd.testing.assert_frame_equal(_orden(uso_m, ["pokemon"]), _orden(uso_d, ["pokemon"]),
+                                              check_dtype=False)
+        claves = ["pokemon", "campo", "valor"]
+        replays.pd.testing.assert_frame_equal(_orden(comp_m, claves), _orden(comp_d, claves), check_dtype=False)
+
+    uso_todo = replays._uso_seleccion(grupos, uso, comp, {})[0].set_index("pokemon")["usos"].to_dict()
+    assert uso_todo == {"Pikachu": 3, "Starmie": 2, "Gengar": 2}
+
+
+def test_generacion_solo_sube_si_cambian_filas_ok(cache):
+    gen = replays._generacion_cache
+    fallida = {"url": "https://r/9", "status": "failed", "formato_esp": "OU"}
+    inicial = gen()
+
+    replays._guardar_en_cache(replays.pd.DataFrame([fallida]))
+    assert gen() == inicial                       # sólo fallidas: el uso no cambia
+    replays._guardar_en_cache(replays.pd.DataFrame([fallida]), reemplazar=True)
+    assert gen() == inicial + 1                   # el re-parseo borró la fallida anterior
+    replays._guardar_en_cache(replays.pd.DataFrame([{**fallida, "url": "https://r/10"}]), reemplazar=True)
+    assert gen() == inicial + 1                   # nada que borrar y ninguna ok
+
+    replays._guardar_en_cache(replays.pd.DataFrame([_fila("https://r/9", "p1", "Pikachu", "True", "Surf")]))
+    assert gen() == inicial + 2
+    replays._guardar_en_cache(replays.pd.DataFrame([fallida]))
+    assert gen() == inicial + 2                   # una fallida no pisa a la ok
+    replays._guardar_en_cache(replays.pd.DataFrame([fallida]), reemplazar=True)
+    assert gen() == inicial + 3                   # el re-parseo sí la borra
+    assert replays._leer_cache(["https://r/9"])["status"].tolist() == ["failed"]
@@ -0,0 +1,256 @@
+"""Descargador de replays contra un servidor HTTP local con respuestas armadas."""
+import json, sqlite3, threading, time
+from contextlib import closing
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+import pytest
+
+import vistas.replays as replays
+
+SHOWDOWN = "https://replay.pokemonshowdown.com/"
+
+LOG_OK = "\n".join([
+    "|player|p1|Ash|",
+    "|player|p2|Misty|",
+    "|poke|p1|Pikachu, L50|",
+    "|poke|p1|Charizard|",
+    "|poke|p2|Starmie|",
+    "|switch|p1a: Pikachu|Pikachu, L50|100/100",
+    "|switch|p2a: Starmie|Starmie|100/100",
+    "|move|p1a: Pikachu|Thunderbolt|p2a: Starmie",
+    "|-item|p2a: Starmie|Leftovers",
+    "|win|Ash",
+])
+
+
+def _json(cuerpo):
+    return 200, {"Content-Type": "application/json"}, json.dumps(cuerpo).encode()
+
+
+OK        = _json({"log": LOG_OK})
+SIN_POKES = _json({"log": "|player|p1|Ash|\n|player|p2|Misty|\n|win|Ash"})
+NO_JSON   = (200, {"Content-Type": "application/json"}, b"<html>mantenimiento</html>")
+LIMITE    = (429, {"Retry-After": "0.3"}, b"")
+CAIDO     = (503, {}, b"")
+BORRADO   = (404, {}, b"")
+PROHIBIDO = (403, {}, b"")
+
+# ruta -> respuestas en orden (la última se repite)
+RUTAS = {
+    "ok-1":       [OK],
+    "ok-2":       [OK],
+    "limite":     [LIMITE, OK],
+    "caido-dos":  [CAIDO, CAIDO, OK],
+    "caido":      [CAIDO],
+    "borrado":    [BORRADO],
+    "prohibido":  [PROHIBIDO],
+    "no-json":    [NO_JSON],
+    "sin-pokes":  [SIN_POKES],
+}
+
+
+class _Servidor:
+    """http.server en un hilo; anota (ruta, instante) de cada petición."""
+
+    def __init__(self, rutas):
+        self.rutas, self.pedidos, self._lock = rutas, [], threading.Lock()
+        servidor = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                ruta = self.path.strip("/").removesuffix(".json")
+                with servidor._lock:
+                    n = sum(r == ruta for r, _ in servidor.pedidos)
+                    servidor.pedidos.append((ruta, time.monotonic()))
+                respuestas = servidor.rutas.get(ruta, [BORRADO])
+                estado, headers, cuerpo = respuestas[min(n, len(respuestas) - 1)]
+                self.send_response(estado)
+                for k, v in headers.items():
+                    self.send_header(k, v)
+                self.send_header("Content-Length", str(len(cuerpo)))
+                self.end_headers()
+                self.wfile.write(cuerpo)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def veces(self, ruta):
+        return sum(r == ruta for r, _ in self.pedidos)
+
+    def instantes(self, ruta):
+        return [t for r, t in self.pedidos if r == ruta]
+
+
+@pytest.fixture
+def servidor(monkeypatch, tmp_path):
+    s = _Servidor(RUTAS)
+    monkeypatch.setattr(replays, "REPLAY_SERVIDOR", s.url)
+    monkeypatch.setattr(replays, "REPLAY_BACKOFF_BASE", 0.01)
+    monkeypatch.setattr(replays, "REPLAY_LOGS_DIR", str(tmp_path / "replay_logs"))
+    monkeypatch.setattr(replays, "CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(replays, "CACHE_DB", str(tmp_path / "replay_cache.sqlite"))
+    monkeypatch.setattr(replays, "CACHE_FILE", str(tmp_path / "replay_cache.csv"))
+    yield s
+    s.httpd.shutdown()
+    s.httpd.server_close()
+
+
+def _url(ruta):
+    return SHOWDOWN + ruta
+
+
+def test_resultados_motivos_y_progreso(servidor):
+    rutas = list(RUTAS)
+    tareas = [(_url(r), "OU") for r in rutas]
+    errores, avances, hilos = {}, [], set()
+
+    def progreso(hechos, total):
+        avances.append((hechos, total))
+        hilos.add(threading.get_ident())
+
+    res = replays.descargar_replays(tareas, workers=4, rate_por_host=0, progreso=progreso, errores=errores)
+
+    for r in ["ok-1", "ok-2", "limite", "caido-dos"]:
+        filas = res[_url(r)]
+        assert {(f["player_id"], f["pokemon"], f["win"]) for f in filas} == {
+            ("p1", "Pikachu", "True"), ("p1", "Charizard", "True"), ("p2", "Starmie", "False")}
+        assert {f["pokemon"]: f["moves"] for f in filas}["Pikachu"] == "Thunderbolt"
+        assert {f["pokemon"]: f["items"] for f in filas}["Starmie"] == "Leftovers"
+    assert errores == {_url("caido"): "servidor", _url("borrado"): "no_existe",
+                       _url("prohibido"): "http_403", _url("no-json"): "json",
+                       _url("sin-pokes"): "sin_pokemon"}
+    assert all(res[u] is None for u in errores)
+
+    # el progreso avanza de a uno, hasta el total, y siempre desde el hilo que llama
+    assert avances == [(i, len(tareas)) for i in range(1, len(tareas) + 1)]
+    assert hilos == {threading.get_ident()}
+
+
+def test_reintentos_y_backoff(servidor):
+    tareas = [(_url(r), "OU") for r in ["limite", "caido-dos", "caido", "borrado", "prohibido"]]
+    replays.descargar_replays(tareas, workers=5, rate_por_host=0)
+
+    # 429: se respeta el Retry-After antes de reintentar
+    primero, segundo = servidor.instantes("limite")
+    assert segundo - primero >= 0.3
+    # 5xx: se reintenta hasta que responde, o REPLAY_REINTENTOS veces
+    assert servidor.veces("caido-dos") == 3
+    assert servidor.veces("caido") == replays.REPLAY_REINTENTOS + 1
+    # 404 y otros errores definitivos: un solo pedido
+    assert servidor.veces("borrado") == 1
+    assert servidor.veces("prohibido") == 1
+
+
+def test_logs_archivados_no_se_vuelven_a_pedir(servidor):
+    tareas = [(_url("ok-1"), "OU")]
+    primera = replays.descargar_replays(tareas, workers=1, rate_por_host=0)
+    segunda = replays.descargar_replays(tareas, workers=1, rate_por_host=0)
+    assert servidor.veces("ok-1") == 1
+    assert len(segunda[_url("ok-1")]) == len(primera[_url("ok-1")]) == 3
+
+
+def test_limitador_por_host(servidor, monkeypatch):
+    rutas = [f"ok-lim-{i}" for i in range(6)]
+    servidor.rutas.update({r: [OK] for r in rutas})
+    salidas, esperar = [], replays.LimitadorPorHost.esperar
+
+    def esperar_anotando(self, host):
+        esperar(self, host)
+        salidas.append(time.monotonic())
+
+    monkeypatch.setattr(replays.LimitadorPorHost, "esperar", esperar_anotando)
+    replays.descargar_replays([(_url(r), "OU") for r in rutas], workers=6, rate_por_host=20)
+
+    # 20 por segundo: ~50 ms entre inicios al mismo host aunque haya 6 hilos
+    # (cada hilo puede despertar algo tarde, pero los turnos reservados no se corren)
+    salidas.sort()
+    assert len(salidas) == 6
+    assert salidas[-1] - salidas[0] >= 5 * 0.05 - 0.01
+    assert min(b - a for a, b in zip(salidas, salidas[1:])) >= 0.025
+    # del lado del servidor la llegada puede variar un poco, pero el total no baja
+    llegadas = sorted(t for r, t in servidor.pedidos if r in rutas)
+    assert llegadas[-1] - llegadas[0] >= 0.2
+
+
+def test_descargar_pendientes_registra_fallos_y_espera(servidor):
+    rutas = ["ok-1", "ok-2", "caido", "borrado", "sin-pokes"]
+    df = pd.DataFrame({"Match_replays": [_url(r) for r in rutas], "Formato_esp": "OU",
+                       "Formato": "SINGLES", "Tier": "OU", "mes": "2026-01", "equipos": 2})
+    avances = []
+    info = {}
+    n_nuevos, n_fallidos = replays._descargar_pendientes(
+        df, info, progreso=lambda h, t: avances.append((h, t)), workers=2, rate_por_host=0)
+    assert (n_nuevos, n_fallidos) == (2, 3)
+    assert avances[-1] == (5, 5)
+
+    with closing(sqlite3.connect(replays.CACHE_DB)) as con:
+        fallos = {u: (intentos, motivo, muerto) for u, intentos, motivo, muerto in
+                  con.execute("SELECT url, intentos, ultimo_error, muerto FROM replay_fallos")}
+    assert fallos == {_url("caido"): (1, "servidor", 0), _url("borrado"): (1, "no_existe", 0),
+                      _url("sin-pokes"): (1, "sin_pokemon", 1)}
+    assert replays._urls_en_cache(df["Match_replays"]) == {_url("ok-1"), _url("ok-2")}
+
+    # segunda pasada enseguida: los ok están en caché y los fallidos esperan su turno
+    pedidos_antes = len(servidor.pedidos)
+    info = {}
+    assert replays._descargar_pendientes(df, info, progreso=lambda h, t: None,
+                                         workers=2, rate_por_host=0) == (0, 0)
+    assert len(servidor.pedidos) == pedidos_antes
+    assert info == {"omitidos_por_fallos_previos": 3, "pendientes_de_descarga": 0}
+
+    # cumplida la espera se reintentan los que no están muertos
+    en_espera = replays._urls_en_espera(df["Match_replays"], ahora=time.time() + replays.FALLO_ESPERA_BASE + 1)
+    assert en_espera == {_url("sin-pokes")}
+
+
+def test_ingestar_contra_servidor_local(servidor, monkeypatch):
+    import ingestar_replays
+    csv = pd.DataFrame({
+        "player1": "Ash", "player2": "Misty", "winner": "Ash", "league": "TORNEO",
+        "date": "2026-01-10", "Formato": "SINGLES", "Formato_esp": "OU", "Tier": "OU", "Rep": 1,
+        "Match_replays": [_url(r) for r in ["ok-1", "ok-2", "borrado"]] + [None],
+    })
+    monkeypatch.setattr(ingestar_replays, "load_data", lambda: csv)
+    monkeypatch.setattr(ingestar_replays, "version_datos", lambda: "prueba")
+
+    r = ingestar_replays.ingestar(workers=2, rate_por_host=0)
+    assert (r["nuevos"], r["fallidos"], r["omitidos"], r["pendientes"]) == (2, 1, 0, 0)
+    assert replays._ultima_ingesta() == r
+    with closing(sqlite3.connect(replays.CACHE_DB)) as con:
+        assert con.execute("SELECT SUM(replays) FROM uso_grupos").fetchone()[0] == 3
+        assert con.execute("SELECT SUM(usos) FROM uso_pokemon").fetchone()[0] == 6
+
+    r = ingestar_replays.ingestar(workers=2, rate_por_host=0)
+    assert (r["nuevos"], r["fallidos"], r["omitidos"]) == (0, 0, 1)
+
+
+def test_urls_con_espacios(servidor):
+    # el CSV trae urls con espacios alrededor: se guardan y se buscan siempre limpias
+    rutas = ["ok-1", "ok-2", "caido"]
+    df = pd.DataFrame({"Match_replays": [f"  {_url(r)} " for r in rutas] + [_url("ok-1")],
+                       "Formato_esp": "OU", "Formato": "SINGLES", "Tier": "OU", "date": "2026-01-10"})
+    replays_df, _ = replays._replays_a_analizar(df)
+    assert list(replays_df["Match_replays"]) == [_url(r) for r in rutas]
+
+    assert replays._descargar_pendientes(replays_df, {}, progreso=lambda h, t: None,
+                                         workers=2, rate_por_host=0) == (2, 1)
+    pedidos_antes = len(servidor.pedidos)
+    info = {}
+    assert replays._descargar_pendientes(replays._replays_a_analizar(df)[0], info, progreso=lambda h, t: None,
+                                         workers=2, rate_por_host=0) == (0, 0)
+    assert len(servidor.pedidos) == pedidos_antes
+    assert info == {"omitidos_por_fallos_previos": 1, "pendientes_de_descarga": 0}
+
+    detalle, _, total_equipos, *_ = replays._cargar_todos_replays_detalle(df, descargar=False)
+    assert set(detalle["url"]) == {_url("ok-1"), _url("ok-2")}
+    assert total_equipos == 6
+
+    replays.materializar_uso(df, "prueba")
+    with closing(sqlite3.connect(replays.CACHE_DB)) as con:
+        assert con.execute("SELECT SUM(replays) FROM uso_grupos").fetchone()[0] == 3
+        assert con.execute("SELECT SUM(usos) FROM uso_pokemon").fetchone()[0] == 6
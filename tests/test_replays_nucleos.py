@@ -0,0 +1,94 @@
+"""Núcleos de equipo: pares y tríos de X'X contra el conteo por combinaciones."""
+from collections import Counter
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import vistas.replays as replays
+
+
+def _filas_sinteticas(n_replays=120, semilla=5):
+    """Filas ok del caché: equipos de 1 a 6 especies, alguna repetida en el mismo
+    equipo, y resultados ganados / perdidos / sin decidir."""
+    rng = np.random.default_rng(semilla)
+    especies = ["Pikachu", "Charizard", "Gengar", "Snorlax", "Dragonite",
+                "Lapras", "Tyranitar", "Garchomp", "Rotom-Wash", "Amoonguss"]
+    pesos = np.linspace(3, 1, len(especies)); pesos /= pesos.sum()
+    filas = []
+    for i in range(n_replays):
+        for jugador in ("p1", "p2"):
+            tam = 1 if i % 10 == 0 else int(rng.integers(2, 7))   # equipos de un solo miembro
+            equipo = list(rng.choice(especies, tam, replace=False, p=pesos))
+            if i % 7 == 0:
+                equipo.append(equipo[0])                          # especie repetida en el equipo
+            win = ("True" if jugador == "p1" else "False") if i % 11 else "Empate"
+            if i % 4 == 0 and i % 11:
+                win = "False" if jugador == "p1" else "True"
+            filas += [{"url": f"https://replay/{i}", "player_id": jugador, "pokemon": p, "win": win}
+                      for p in equipo]
+    return pd.DataFrame(filas)
+
+
+def _nucleos_combinaciones(filas, k, min_equipos):
+    """Conteo directo: cada equipo aporta todas sus combinaciones de k especies distintas."""
+    equipos = filas.groupby(["url", "player_id"], sort=False).agg(
+        pokes=("pokemon", lambda s: tuple(sorted(set(s)))), win=("win", "first"))
+    n = len(equipos)
+    soporte = Counter(p for pokes in equipos["pokes"] for p in pokes)
+    cnt, gan, dec = Counter(), Counter(), Counter()
+    for pokes, win in zip(equipos["pokes"], equipos["win"]):
+        for combo in combinations(pokes, k):
+            cnt[combo] += 1
+            gan[combo] += win == "True"
+            dec[combo] += win in ("True", "False")
+    filas_out = []
+    for combo, c in cnt.items():
+        if c < min_equipos: continue
+        esperado = np.prod([soporte[p] for p in combo]) / n ** k
+        filas_out.append(list(combo) + [c, round(c / n * 100, 1), round(c / n / esperado, 2),
+                                        round(gan[combo] / dec[combo] * 100, 1) if dec[combo] else np.nan])
+    nombres = ["Pokémon A", "Pokémon B", "Pokémon C"][:k]
+    out = pd.DataFrame(filas_out, columns=nombres + ["Equipos", "% Equipos", "Lift", "Win %"])
+    return out.sort_values(nombres).reset_index(drop=True)
+
+
+def _por_nombre(df, k):
+    return df.sort_values(["Pokémon A", "Pokémon B", "Pokémon C"][:k]).reset_index(drop=True)
+
+
+def test_matriz_equipos():
+    filas = _filas_sinteticas()
+    X, especies, gano, decidido = replays.matriz_equipos(filas)
+    equipos = filas.groupby(["url", "player_id"], sort=False)
+    assert X.shape == (equipos.ngroups, filas["pokemon"].nunique())
+    assert list(especies) == sorted(filas["pokemon"].unique())
+    assert set(np.unique(X.data)) == {1}   # la especie repetida cuenta una vez
+    np.testing.assert_array_equal(np.asarray(X.sum(axis=1)).ravel(),
+                                  equipos["pokemon"].nunique().to_numpy())
+    win = equipos["win"].first().to_numpy()
+    np.testing.assert_array_equal(gano, win == "True")
+    np.testing.assert_array_equal(decidido, np.isin(win, ["True", "False"]))
+
+
+@pytest.mark.parametrize("min_equipos", [1, 5, 20])
+def test_co_ocurrencias_igual_a_las_combinaciones(min_equipos):
+    filas = _filas_sinteticas()
+    pares, trios = replays.co_ocurrencias(*replays.matriz_equipos(filas), min_equipos=min_equipos)
+    pares_ref = _nucleos_combinaciones(filas, 2, min_equipos)
+    trios_ref = _nucleos_combinaciones(filas, 3, min_equipos)
+    assert len(pares_ref) and len(trios_ref)
+    pd.testing.assert_frame_equal(_por_nombre(pares, 2), pares_ref, check_dtype=False)
+    pd.testing.assert_frame_equal(_por_nombre(trios, 3), trios_ref, check_dtype=False)
+    # ordenados por Equipos y luego Lift, de mayor a menor
+    for t in (pares, trios):
+        claves = list(zip(t["Equipos"], t["Lift"]))
+        assert claves == sorted(claves, reverse=True)
+
+
+def test_co_ocurrencias_sin_equipos():
+    vacio = pd.DataFrame(columns=["url", "player_id", "pokemon", "win"])
+    pares, trios = replays.co_ocurrencias(*replays.matriz_equipos(vacio))
+    assert pares.empty and trios.empty
+    assert "Pokémon C" in trios.columns
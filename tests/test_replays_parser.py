@@ -0,0 +1,35 @@
+"""Parser de logs de Showdown: filas iguales a las del parser anterior (varias pasadas).
+
+Cada fixture de tests/fixtures/replay_logs tiene el formato de un log archivado
+({"url", "formato_esp", "replay"}) más "esperado": las filas que devolvía el parser
+de antes, sin fetched_at.
+"""
+import glob
+import json
+import os
+
+import pytest
+
+import vistas.replays as replays
+
+FIXTURES = sorted(glob.glob(os.path.join(os.path.dirname(__file__), "fixtures", "replay_logs", "*.json")))
+
+
+def test_hay_fixtures():
+    nombres = {os.path.basename(r)[:-5] for r in FIXTURES}
+    assert {"dobles_ots", "abandono_sin_preview", "ilusion_apodos"} <= nombres
+
+
+@pytest.mark.parametrize("ruta", FIXTURES, ids=lambda r: os.path.basename(r)[:-5])
+def test_parsear_replay_igual_al_parser_anterior(ruta):
+    with open(ruta, encoding="utf-8") as f:
+        archivado = json.load(f)
+    filas = replays._parsear_replay(archivado["url"], archivado["replay"], archivado["formato_esp"])
+    assert filas is not None
+    assert all(f.pop("fetched_at") for f in filas)
+    assert filas == archivado["esperado"]
+
+
+@pytest.mark.parametrize("log", ["", "|j|☆Ash\n|player|p1|Ash|red|\n|player|p2|Gary|gary|\n|-message|Gary forfeited.\n|win|Ash"])
+def test_parsear_replay_sin_pokemon(log):
+    assert replays._parsear_replay("https://replay/vacio", {"log": log}, "OU") is None
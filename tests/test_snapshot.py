@@ -0,0 +1,67 @@
+"""Snapshot Arrow del CSV: lectura y caída al CSV si el snapshot o su meta están dañados."""
+import json
+import logging
+
+import pandas as pd
+import pytest
+
+import utils
+
+
+@pytest.fixture
+def csv(monkeypatch, tmp_path):
+    monkeypatch.setattr(utils, "SNAPSHOT_DIR", str(tmp_path / "data"))
+    monkeypatch.setattr(utils, "SNAPSHOT_META", str(tmp_path / "data" / "snapshot_meta.json"))
+    ruta = tmp_path / "batallas.csv"
+    ruta.write_text("player1;player2;winner;date\nAsh;Gary;Ash;2024-01-05\nMisty;Brock;Brock;2024-02-10\n")
+    return str(ruta)
+
+
+def _del_csv(ruta):
+    return utils._tipar_csv(pd.read_csv(ruta, sep=";"))
+
+
+def test_snapshot_igual_al_csv(csv, caplog):
+    with caplog.at_level(logging.WARNING, logger="utils"):
+        pd.testing.assert_frame_equal(utils.load_snapshot(csv), _del_csv(csv))
+        assert utils.version_datos(csv) == utils._hash_archivo(csv)
+    assert not caplog.records
+
+
+def test_snapshot_danado_cae_al_csv(csv, caplog):
+    ruta, _ = utils.construir_snapshot(csv)
+    with open(ruta, "wb") as f:
+        f.write(b"no es arrow")
+    with caplog.at_level(logging.WARNING, logger="utils"):
+        df = utils.load_snapshot(csv)
+    pd.testing.assert_frame_equal(df, _del_csv(csv))
+    assert "se lee el CSV" in caplog.text
+
+
+def test_meta_ilegible_reconstruye(csv, caplog):
+    utils.construir_snapshot(csv)
+    with open(utils.SNAPSHOT_META, "w") as f:
+        f.write("{roto")
+    with caplog.at_level(logging.WARNING, logger="utils"):
+        assert utils.version_datos(csv) == utils._hash_archivo(csv)
+    assert "snapshot_meta.json" in caplog.text
+    with open(utils.SNAPSHOT_META) as f:
+        assert json.load(f)["sha1"] == utils._hash_archivo(csv)
+
+
+def test_sin_permiso_de_escritura_usa_el_hash(csv, monkeypatch, caplog):
+    def _falla(*_):
+        raise PermissionError("solo lectura")
+    monkeypatch.setattr(utils, "construir_snapshot", _falla)
+    with caplog.at_level(logging.WARNING, logger="utils"):
+        assert utils.version_datos(csv) == utils._hash_archivo(csv)
+        pd.testing.assert_frame_equal(utils.load_snapshot(csv), _del_csv(csv))
+    assert "se hashea el CSV" in caplog.text and "se lee el CSV" in caplog.text
+
+
+def test_otros_errores_no_se_tapan(csv, monkeypatch):
+    def _falla(*_):
+        raise KeyError("sha1")
+    monkeypatch.setattr(utils, "_snapshot_vigente", _falla)
+    with pytest.raises(KeyError):
+        utils.load_snapshot(csv)
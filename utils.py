@@ -1,7 +1,9 @@
 import pandas as pd
 import numpy as np
 import streamlit as st
-import os
+import os, glob, json, hashlib, logging
+
+log = logging.getLogger(__name__)
 
 LOGOS_LIGAS = {
     "PES": "logo_pes.PNG",
@@ -11,9 +13,126 @@ LOGOS_LIGAS = {
     "PLS": "logo_pls.png",
 }
 
+# ══════════════════════════════════════════════════════════════════
+# SNAPSHOT TIPADO DEL CSV (Arrow en disco, se lee memory-mapped)
+# ══════════════════════════════════════════════════════════════════
+
+CSV_PATH       = "archivo_preuba1.csv"
+SNAPSHOT_DIR   = "data"
+SNAPSHOT_META  = os.path.join(SNAPSHOT_DIR, "snapshot_meta.json")
+SNAPSHOT_FORMATO = 2   # subirlo si cambia _tipar_csv: invalida los snapshots anteriores
+COLS_FECHA     = ["date"]
+
+
+def _hash_archivo(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for bloque in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+def _ruta_snapshot(csv_hash):
+    return os.path.join(SNAPSHOT_DIR, f"snapshot_{csv_hash[:16]}_v{SNAPSHOT_FORMATO}.arrow")
+
+
+def _tipar_csv(df):
+    """Fechas parseadas; el resto queda con los tipos de read_csv, que son los que
+    esperan las vistas (texto como object, contadores int64), así leer el snapshot
+    no tiene que convertir nada."""
+    for c in COLS_FECHA:
+        if c in df.columns:
+            df[c] = pd.to_datetime(df[c], errors="coerce")
+    return df
+
+
+def _leer_meta():
+    try:
+        with open(SNAPSHOT_META) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, json.JSONDecodeError) as e:
+        log.warning("No se pudo leer %s (%s): se vuelve a armar el snapshot", SNAPSHOT_META, e)
+        return {}
+
+
+def construir_snapshot(csv_path=CSV_PATH):
+    """Parsea el CSV una sola vez y lo guarda tipado como Arrow IPC (sin compresión,
+    para poder leerlo memory-mapped). Devuelve (ruta_snapshot, hash_csv)."""
+    import pyarrow as pa
+
+    csv_hash = _hash_archivo(csv_path)
+    ruta = _ruta_snapshot(csv_hash)
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+
+    if not os.path.exists(ruta):
+        df = _tipar_csv(pd.read_csv(csv_path, sep=";"))
+        tabla = pa.Table.from_pandas(df, preserve_index=False)
+        tmp = f"{ruta}.{os.getpid()}.tmp"
+        with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, tabla.schema) as writer:
+            writer.write_table(tabla)
+        os.replace(tmp, ruta)
+
+    st_csv = os.stat(csv_path)
+    meta = {"csv": csv_path, "sha1": csv_hash, "formato": SNAPSHOT_FORMATO, "size": st_csv.st_size,
+            "mtime_ns": st_csv.st_mtime_ns, "snapshot": ruta}
+    tmp_meta = f"{SNAPSHOT_META}.{os.getpid()}.tmp"
+    with open(tmp_meta, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp_meta, SNAPSHOT_META)
+
+    # los snapshots de versiones anteriores del CSV ya no sirven
+    for viejo in glob.glob(os.path.join(SNAPSHOT_DIR, "snapshot_*.arrow")):
+        if os.path.abspath(viejo) != os.path.abspath(ruta):
+            try: os.remove(viejo)
+            except OSError: pass
+    return ruta, csv_hash
+
+
+def _snapshot_vigente(csv_path=CSV_PATH):
+    """Devuelve (ruta, hash) del snapshot del CSV actual. Si tamaño y mtime no
+    cambiaron se confía en el meta sin releer el CSV; si cambiaron se recalcula
+    el hash y solo se reconstruye cuando el contenido es distinto."""
+    meta = _leer_meta()
+    st_csv = os.stat(csv_path)
+    if (meta.get("csv") == csv_path and meta.get("formato") == SNAPSHOT_FORMATO
+            and meta.get("size") == st_csv.st_size
+            and meta.get("mtime_ns") == st_csv.st_mtime_ns
+            and os.path.exists(meta.get("snapshot", ""))):
+        return meta["snapshot"], meta["sha1"]
+    return construir_snapshot(csv_path)
+
+
+def version_datos(csv_path=CSV_PATH):
+    """Hash del contenido del CSV: sirve como llave de caché de todo lo derivado."""
+    import pyarrow as pa
+    try:
+        return _snapshot_vigente(csv_path)[1]
+    except (OSError, pa.ArrowException) as e:
+        log.warning("No se pudo usar el snapshot de %s (%s): se hashea el CSV", csv_path, e)
+        return _hash_archivo(csv_path)
+
+
+def load_snapshot(csv_path=CSV_PATH):
+    """DataFrame del CSV (con 'date' ya convertida) leído memory-mapped desde el
+    snapshot Arrow. Si no se puede usar el snapshot, cae al CSV de siempre."""
+    import pyarrow as pa
+    try:
+        ruta, _ = _snapshot_vigente(csv_path)
+        with pa.memory_map(ruta, "r") as fuente:
+            tabla = pa.ipc.open_file(fuente).read_all()
+        return tabla.to_pandas()
+    except (OSError, pa.ArrowException) as e:   # ArrowInvalid: snapshot truncado o dañado
+        log.warning("No se pudo usar el snapshot de %s (%s): se lee el CSV", csv_path, e)
+        return _tipar_csv(pd.read_csv(csv_path, sep=";"))
+
+
 @st.cache_data(ttl=3600)
 def load_data():
-    return pd.read_csv("archivo_preuba1.csv", sep=";")
+    """Mismo contrato de columnas que el CSV, pero sin parsearlo: sale del snapshot
+    y con 'date' ya convertida."""
+    return load_snapshot()
 
 def normalize_columns(df):
     col_map = {}
@@ -40,6 +159,131 @@ def ensure_fields(df):
         pass
     return df
 
+# ══════════════════════════════════════════════════════════════════
+# TABLA DE HECHOS DE BATALLAS (una sola por versión de datos)
+# ══════════════════════════════════════════════════════════════════
+
+ROUND_ORDER = {
+    'ronda suiza 1': 10, 'ronda suiza 2': 11, 'ronda suiza 3': 12,
+    'ronda suiza 4': 13, 'ronda suiza 5': 14, 'ronda suiza 6': 15,
+    'ronda suiza 7': 16,
+    'ganadores ronda 1': 10, 'ganadores ronda 2': 11, 'ganadores ronda 3': 12,
+    'ganadores ronda 4': 13, 'ganadores ronda 5': 14,
+    'perdedores ronda 1': 10, 'perdedores ronda 2': 11, 'perdedores ronda 3': 12,
+    'perdedores ronda 4': 13, 'perdedores ronda 5': 14,
+    'perdedores ronda 6': 15, 'perdedores ronda 7': 16, 'perdedores ronda 8': 17,
+    'fase de grupos': 20, 'playoff': 25,
+    'treintaidosavo de final': 30, 'dieciseisavos de final': 40,
+    'octavos de final': 50, 'cuartos de final': 60, 'semifinal': 70,
+    'ascenso bo3 semifinales': 71,
+    'ascenso singles semi': 71, 'ascenso doubles semi': 71,
+    'ascenso bo3 final': 80,
+    'ascenso singles cuartos': 61, 'ascenso doubles cuartos': 61,
+    'ascenso singles final': 80, 'ascenso doubles final': 80,
+    'ascenso  final': 80,
+    'final': 90,
+}
+
+
+def get_round_order(r):
+    if pd.isna(r): return 50
+    r_low = str(r).strip().lower()
+    if ' j' in r_low:
+        try: return int(r_low.split(' j')[1])
+        except: pass
+    if r_low.startswith('cypher fecha') or r_low.startswith('ascenso fecha'):
+        try: return int(r_low.split()[-1])
+        except: pass
+    return ROUND_ORDER.get(r_low, 50)
+
+
+def _liga_temporada(r):
+    partes = str(r).split(" ")
+    return partes[0] + partes[1] if pd.notna(r) and len(partes) > 1 else ""
+
+
+def _jornada(r):
+    if pd.isna(r) or ' J' not in str(r): return np.nan
+    try: return int(str(r).split(' J')[1])
+    except: return np.nan
+
+
+def _por_valor_unico(serie, fn):
+    """Aplica fn una vez por valor distinto (hay pocas rondas distintas y miles de filas)."""
+    unicos = serie.dropna().unique()
+    mapa = {u: fn(u) for u in unicos}
+    return serie.map(mapa), fn(np.nan)
+
+
+# columnas que preparar_batallas agrega al CSV
+COLS_HECHOS = ["perdedor", "id_player1", "id_player2", "id_ganador", "id_perdedor", "_ro", "_nt",
+               "Liga_Temporada", "Jornada", "ym", "liga_cat", "pendiente", "completada"]
+
+
+def preparar_batallas(df_raw):
+    """
+    Normaliza el CSV y le agrega, de forma vectorizada, todo lo que las vistas
+    derivaban cada una por su lado:
+        perdedor, id_player1/id_player2/id_ganador/id_perdedor (códigos enteros,
+        -1 si no hay), _ro (orden de ronda), _nt (N_Torneo), Liga_Temporada
+        (solo LIGA), Jornada, ym (año*100+mes), liga_cat, pendiente y completada.
+    Los ids son la posición del jugador en la lista ordenada de nombres (no se
+    guarda en df.attrs: pandas copia attrs en profundidad en cada operación).
+    """
+    df = ensure_fields(normalize_columns(df_raw.copy()))
+
+    p1 = df['player1'].astype(str).str.strip()
+    p2 = df['player2'].astype(str).str.strip()
+    gan = df['winner'].astype(str).str.strip()
+    df['perdedor'] = np.where(df['winner'].isna(), np.nan,
+                              np.where(gan == p1, df['player2'], df['player1']))
+
+    jugadores = pd.Index(sorted(pd.concat([df['player1'], df['player2'], df['winner']]).dropna().unique()))
+    for col, origen in [('id_player1', 'player1'), ('id_player2', 'player2'),
+                        ('id_ganador', 'winner'), ('id_perdedor', 'perdedor')]:
+        df[col] = jugadores.get_indexer(df[origen]).astype('int32')
+
+    if 'round' in df.columns:
+        ro, ro_nan = _por_valor_unico(df['round'], get_round_order)
+        df['_ro'] = ro.fillna(ro_nan).astype(int)
+    else:
+        df['_ro'] = 50
+    df['_nt'] = df['N_Torneo'].fillna(0) if 'N_Torneo' in df.columns else 0
+
+    es_liga = df['league'] == 'LIGA'
+    if 'round' in df.columns:
+        lt, _ = _por_valor_unico(df['round'], _liga_temporada)
+        df['Liga_Temporada'] = lt.fillna('').where(es_liga, '')
+        jor, _ = _por_valor_unico(df['round'], _jornada)
+        df['Jornada'] = jor.astype('Int64')
+    else:
+        df['Liga_Temporada'] = ''
+        df['Jornada'] = pd.array([pd.NA] * len(df), dtype='Int64')
+
+    df['ym'] = (df['date'].dt.year * 100 + df['date'].dt.month).astype('Int64')
+
+    lc = df['Ligas_categoria'].astype(str) if 'Ligas_categoria' in df.columns else pd.Series('', index=df.index)
+    df['liga_cat'] = np.where(es_liga & ~lc.isin(['nan', 'No Posee Liga', '']), lc, df['league'].astype(str))
+
+    if 'Walkover' in df.columns:
+        df['pendiente'] = df['Walkover'] == -1
+    else:
+        df['pendiente'] = df['winner'].isna()
+    df['completada'] = df['winner'].notna() & ~df['pendiente']
+    return df
+
+
+@st.cache_resource(ttl=3600, max_entries=2, show_spinner=False)
+def _batallas_por_version(version):
+    return preparar_batallas(load_data())
+
+
+def load_batallas():
+    """Tabla de hechos compartida por todas las vistas (misma instancia para todas
+    las sesiones mientras no cambie el CSV). Es de SOLO LECTURA: filtrar y hacer
+    .copy() antes de agregar o modificar columnas."""
+    return _batallas_por_version(version_datos())
+
 def compute_player_stats(df):
     players = {}
     completed = df[
@@ -212,124 +456,102 @@ def obtener_banner_torneo(num_torneo):
             if os.path.exists(ruta): return ruta
     return None
 
-@st.cache_data(ttl=3600)
-def build_base_liga(df):
-    df = df[df.Walkover>=0].copy()
-    df_liga = df[df.league == "LIGA"].copy()
-    df_liga["Liga_Temporada"] = df_liga["round"].apply(
-        lambda x: str(x).split(" ")[0]+str(x).split(" ")[1]
-        if pd.notna(x) and len(str(x).split(" ")) > 1 else ""
-    )
-    df_liga = df_liga[df_liga["Liga_Temporada"] != ""].copy()
-    
-    Ganador = df_liga.groupby(["Liga_Temporada","winner"])["N_Torneo"].count().reset_index()
-    Ganador.columns = ["Liga_Temporada","Participante","Victorias"]
-    P1 = df_liga.groupby(["Liga_Temporada","player1"])["N_Torneo"].count().reset_index()
-    P1.columns = ["Liga_Temporada","Participante","Partidas_P1"]
-    P2 = df_liga.groupby(["Liga_Temporada","player2"])["N_Torneo"].count().reset_index()
-    P2.columns = ["Liga_Temporada","Participante","Partidas_P2"]
-
-    g_pk = df_liga[["Liga_Temporada","winner","pokemons Sob","pokemon vencidos"]].copy()
-    g_pk.columns = ["Liga_Temporada","Participante","pokes_sobrevivientes","poke_vencidos"]
-    p_pk = df_liga[["Liga_Temporada","player1","player2","winner","pokemons Sob","pokemon vencidos"]].copy()
-    p_pk["Participante"] = p_pk.apply(lambda r: r["player2"] if r["winner"]==r["player1"] else r["player1"], axis=1)
-    p_pk["poke_vencidos"] = 6 - p_pk["pokemons Sob"]
-    p_pk["pokes_sobrevivientes"] = p_pk["pokemon vencidos"] - 6
-    p_pk = p_pk[["Liga_Temporada","Participante","pokes_sobrevivientes","poke_vencidos"]]
-    data = pd.concat([p_pk, g_pk]).groupby(["Liga_Temporada","Participante"])[["pokes_sobrevivientes","poke_vencidos"]].sum().reset_index()
-
-    bp1 = df_liga[["Liga_Temporada","player1"]].copy(); bp1.columns = ["Liga_Temporada","Participante"]
-    bp2 = df_liga[["Liga_Temporada","player2"]].copy(); bp2.columns = ["Liga_Temporada","Participante"]
-    base = pd.concat([bp1,bp2], ignore_index=True).drop_duplicates()
-    base = pd.merge(base, Ganador, how="left", on=["Liga_Temporada","Participante"])
-    base["Victorias"] = base["Victorias"].fillna(0).astype(int)
-    base = pd.merge(base, P1, how="left", on=["Liga_Temporada","Participante"])
-    base = pd.merge(base, P2, how="left", on=["Liga_Temporada","Participante"])
-    base["Partidas_P1"] = base["Partidas_P1"].fillna(0)
-    base["Partidas_P2"] = base["Partidas_P2"].fillna(0)
-    base["Juegos"] = (base["Partidas_P1"] + base["Partidas_P2"]).astype(int)
-    base["Derrotas"] = base["Juegos"] - base["Victorias"]
-    base = pd.merge(base, data, how="left", on=["Liga_Temporada","Participante"])
-    base["pokes_sobrevivientes"] = base["pokes_sobrevivientes"].fillna(0)
-    base["poke_vencidos"] = base["poke_vencidos"].fillna(0)
-    base = base.drop(columns=["Partidas_P1","Partidas_P2"])
-    return score_final(base), df_liga
+# ══════════════════════════════════════════════════════════════════
+# TABLAS DE POSICIONES (un solo motor para liga, torneo, jornada, mes…)
+# ══════════════════════════════════════════════════════════════════
+
+COLS_POSICIONES = ["Participante", "Victorias", "Juegos", "Derrotas",
+                   "pokes_sobrevivientes", "poke_vencidos"]
+
+
+def formato_largo(df, claves):
+    """
+    Pasa las batallas a formato largo, sin apply fila a fila. Por cada batalla hay
+    cuatro filas: aparición de player1, aparición de player2 (en ese orden, así la
+    tabla conserva el orden de aparición de los jugadores), ganador y perdedor.
+        ganador:  pokes_sobrevivientes = pokemons Sob,          poke_vencidos = pokemon vencidos
+        perdedor: pokes_sobrevivientes = pokemon vencidos - 6,  poke_vencidos = 6 - pokemons Sob
+    """
+    n   = len(df)
+    p1  = df["player1"].to_numpy(dtype=object)
+    p2  = df["player2"].to_numpy(dtype=object)
+    gan = df["winner"].to_numpy(dtype=object)
+    per = np.where(gan == p1, p2, p1)
+    sob  = df["pokemons Sob"].to_numpy()
+    venc = df["pokemon vencidos"].to_numpy()
+    uno, cero = np.ones(n, dtype=np.int64), np.zeros(n, dtype=np.int64)
+
+    largo = pd.concat([df[claves]] * 4, ignore_index=True)
+    largo["Participante"]         = np.concatenate([p1, p2, gan, per])
+    largo["Juegos"]               = np.concatenate([uno, uno, cero, cero])
+    largo["Victorias"]            = np.concatenate([cero, cero, uno, cero])
+    largo["pokes_sobrevivientes"] = np.concatenate([cero, cero, sob, venc - 6])
+    largo["poke_vencidos"]        = np.concatenate([cero, cero, venc, 6 - sob])
+    return largo
+
+
+def agregar_posiciones(largo, claves):
+    """Victorias/Juegos/Derrotas/pokes por (claves, Participante) en un solo groupby
+    y score_final encima. `largo` sale de formato_largo (puede venir filtrado)."""
+    g = (largo.groupby(claves + ["Participante"], sort=False)
+              [["Victorias", "Juegos", "pokes_sobrevivientes", "poke_vencidos"]]
+              .sum().reset_index())
+    g["Derrotas"] = g["Juegos"] - g["Victorias"]
+    return score_final(g[claves + COLS_POSICIONES])
+
+
+def tabla_posiciones(df, claves):
+    """Tabla de posiciones de las batallas de df agrupando por cualquier lista de
+    columnas (Liga_Temporada, N_Torneo, Jornada, ym, Tier, Formato…)."""
+    return agregar_posiciones(formato_largo(df, claves), claves)
+
+
+def _calcular_bases(df):
+    df = df[df["Walkover"] >= 0].copy()
+    if "Liga_Temporada" not in df.columns:
+        lt, _ = _por_valor_unico(df["round"], _liga_temporada)
+        df["Liga_Temporada"] = lt.fillna("").where(df["league"] == "LIGA", "")
+    df["Torneo_Temp"] = df["N_Torneo"]
+    df["N_Jornada"]   = df["N_Torneo"]
+
+    es_liga   = ((df["league"] == "LIGA") & (df["Liga_Temporada"] != "")).to_numpy()
+    es_torneo = (df["league"] == "TORNEO").to_numpy()
+    largo = formato_largo(df, ["Liga_Temporada", "Torneo_Temp", "N_Jornada"])
+    en_liga, en_torneo = np.tile(es_liga, 4), np.tile(es_torneo, 4)
+
+    # los df auxiliares conservan las columnas de antes: las del CSV y las de cada tabla
+    propias = [c for c in df.columns if c not in COLS_HECHOS + ["Torneo_Temp", "N_Jornada"]]
+    df_liga = df.loc[es_liga,   propias + ["Liga_Temporada"]]
+    df_t    = df.loc[es_torneo, propias + ["Torneo_Temp"]]
+    dj      = df.loc[es_liga,   propias + ["Liga_Temporada", "N_Jornada"]]
+    return {
+        "liga":    (agregar_posiciones(largo[en_liga],   ["Liga_Temporada"]), df_liga),
+        "torneo":  (agregar_posiciones(largo[en_torneo], ["Torneo_Temp"]),    df_t),
+        "jornada": (agregar_posiciones(largo[en_liga],   ["Liga_Temporada", "N_Jornada"]), dj),
+    }
+
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def _bases_por_version(version):
+    return _calcular_bases(load_batallas())
 
-@st.cache_data(ttl=3600)
-def build_base_torneo(df):
-    df_t = df[(df.league == "TORNEO") & (df.Walkover >= 0)].copy()
-    df_t["Torneo_Temp"] = df_t["N_Torneo"]
-
-    Ganador = df_t.groupby(["Torneo_Temp","winner"])["N_Torneo"].count().reset_index()
-    Ganador.columns = ["Torneo_Temp","Participante","Victorias"]
-    P1 = df_t.groupby(["Torneo_Temp","player1"])["N_Torneo"].count().reset_index()
-    P1.columns = ["Torneo_Temp","Participante","Partidas_P1"]
-    P2 = df_t.groupby(["Torneo_Temp","player2"])["N_Torneo"].count().reset_index()
-    P2.columns = ["Torneo_Temp","Participante","Partidas_P2"]
-
-    g_pk = df_t[["Torneo_Temp","winner","pokemons Sob","pokemon vencidos"]].copy()
-    g_pk.columns = ["Torneo_Temp","Participante","pokes_sobrevivientes","poke_vencidos"]
-    p_pk = df_t[["Torneo_Temp","player1","player2","winner","pokemons Sob","pokemon vencidos"]].copy()
-    p_pk["Participante"] = p_pk.apply(lambda r: r["player2"] if r["winner"]==r["player1"] else r["player1"], axis=1)
-    p_pk["poke_vencidos"] = 6 - p_pk["pokemons Sob"]
-    p_pk["pokes_sobrevivientes"] = p_pk["pokemon vencidos"] - 6
-    p_pk = p_pk[["Torneo_Temp","Participante","pokes_sobrevivientes","poke_vencidos"]]
-    data = pd.concat([p_pk, g_pk]).groupby(["Torneo_Temp","Participante"])[["pokes_sobrevivientes","poke_vencidos"]].sum().reset_index()
-
-    bp1 = df_t[["Torneo_Temp","player1"]].copy(); bp1.columns = ["Torneo_Temp","Participante"]
-    bp2 = df_t[["Torneo_Temp","player2"]].copy(); bp2.columns = ["Torneo_Temp","Participante"]
-    base = pd.concat([bp1,bp2], ignore_index=True).drop_duplicates()
-    base = pd.merge(base, Ganador, how="left", on=["Torneo_Temp","Participante"])
-    base["Victorias"] = base["Victorias"].fillna(0).astype(int)
-    base = pd.merge(base, P1, how="left", on=["Torneo_Temp","Participante"])
-    base = pd.merge(base, P2, how="left", on=["Torneo_Temp","Participante"])
-    base["Partidas_P1"] = base["Partidas_P1"].fillna(0)
-    base["Partidas_P2"] = base["Partidas_P2"].fillna(0)
-    base["Juegos"] = (base["Partidas_P1"] + base["Partidas_P2"]).astype(int)
-    base["Derrotas"] = base["Juegos"] - base["Victorias"]
-    base = pd.merge(base, data, how="left", on=["Torneo_Temp","Participante"])
-    base["pokes_sobrevivientes"] = base["pokes_sobrevivientes"].fillna(0)
-    base["poke_vencidos"] = base["poke_vencidos"].fillna(0)
-    base = base.drop(columns=["Partidas_P1","Partidas_P2"])
-    return score_final(base), df_t
 
 @st.cache_data(ttl=3600)
-def build_base_jornada(df_liga):
-    dj = df_liga.copy()
-    dj["N_Jornada"] = dj["N_Torneo"]
-
-    Gj = dj.groupby(["Liga_Temporada","N_Jornada","winner"])["N_Torneo"].count().reset_index()
-    Gj.columns = ["Liga_Temporada","N_Jornada","Participante","Victorias"]
-    P1j = dj.groupby(["Liga_Temporada","N_Jornada","player1"])["N_Torneo"].count().reset_index()
-    P1j.columns = ["Liga_Temporada","N_Jornada","Participante","Partidas_P1"]
-    P2j = dj.groupby(["Liga_Temporada","N_Jornada","player2"])["N_Torneo"].count().reset_index()
-    P2j.columns = ["Liga_Temporada","N_Jornada","Participante","Partidas_P2"]
-
-    gk = dj[["Liga_Temporada","N_Jornada","winner","pokemons Sob","pokemon vencidos"]].copy()
-    gk.columns = ["Liga_Temporada","N_Jornada","Participante","pokes_sobrevivientes","poke_vencidos"]
-    pk = dj[["Liga_Temporada","N_Jornada","player1","player2","winner","pokemons Sob","pokemon vencidos"]].copy()
-    pk["Participante"] = pk.apply(lambda r: r["player2"] if r["winner"]==r["player1"] else r["player1"], axis=1)
-    pk["poke_vencidos"] = 6 - pk["pokemons Sob"]
-    pk["pokes_sobrevivientes"] = pk["pokemon vencidos"] - 6
-    pk = pk[["Liga_Temporada","N_Jornada","Participante","pokes_sobrevivientes","poke_vencidos"]]
-    dataj = pd.concat([pk, gk]).groupby(["Liga_Temporada","N_Jornada","Participante"])[["pokes_sobrevivientes","poke_vencidos"]].sum().reset_index()
-
-    bp1 = dj[["Liga_Temporada","N_Jornada","player1"]].copy(); bp1.columns = ["Liga_Temporada","N_Jornada","Participante"]
-    bp2 = dj[["Liga_Temporada","N_Jornada","player2"]].copy(); bp2.columns = ["Liga_Temporada","N_Jornada","Participante"]
-    base = pd.concat([bp1,bp2], ignore_index=True).drop_duplicates()
-    base = pd.merge(base, Gj, how="left", on=["Liga_Temporada","N_Jornada","Participante"])
-    base["Victorias"] = base["Victorias"].fillna(0).astype(int)
-    base = pd.merge(base, P1j, how="left", on=["Liga_Temporada","N_Jornada","Participante"])
-    base = pd.merge(base, P2j, how="left", on=["Liga_Temporada","N_Jornada","Participante"])
-    base["Partidas_P1"] = base["Partidas_P1"].fillna(0)
-    base["Partidas_P2"] = base["Partidas_P2"].fillna(0)
-    base["Juegos"] = (base["Partidas_P1"] + base["Partidas_P2"]).astype(int)
-    base["Derrotas"] = base["Juegos"] - base["Victorias"]
-    base = pd.merge(base, dataj, how="left", on=["Liga_Temporada","N_Jornada","Participante"])
-    base["pokes_sobrevivientes"] = base["pokes_sobrevivientes"].fillna(0)
-    base["poke_vencidos"] = base["poke_vencidos"].fillna(0)
-    base = base.drop(columns=["Partidas_P1","Partidas_P2"])
-    return score_final(base), dj
+def _bases_de_df(df):
+    return _calcular_bases(df)
+
+
+def build_bases(df=None):
+    """
+    Las tres tablas de posiciones en una sola pasada:
+        {"liga": (base2, df_liga), "torneo": (base_torneo_final, df_t),
+         "jornada": (base2_jornada, df_liga_jornada)}
+    Sin argumentos usa la tabla de batallas (cacheada por versión del CSV); con un
+    df propio (p. ej. recortado por fecha) lo procesa aparte.
+    """
+    if df is None:
+        return _bases_por_version(version_datos())
+    return _bases_de_df(df)
 
 def generar_tabla_formatos(df_liga, lt):
     """Win/Total/Rate por formato (Singles/Dobles/VGC) + Puntaje, para una Liga_Temporada."""
@@ -516,14 +738,103 @@ def tabla_enfrentamientos_html(matriz):
     return css + f"<table class='enf-table'>{header}{rows_html}</table>"
 
 
-def obtener_elo_rank_historico(data_elo, data_filas, jugador, fecha_corte=None):
+# ══════════════════════════════════════════════════════════════════
+# ÍNDICE "A UNA FECHA" DEL ELO
+# ══════════════════════════════════════════════════════════════════
+
+class IndiceEloHistorico:
+    """
+    Índice temporal del historial Elo (data_filas) para responder "Elo y rank del
+    jugador X a la fecha D" y "ranking completo a la fecha D" sin reconstruir el
+    historial largo en cada llamada.
+      - Por jugador: fechas y Elo posteriores a cada batalla, en orden de batalla,
+        consultados con búsqueda binaria.
+      - Por mes: una foto del Elo de todos los jugadores al cierre del mes; una
+        fecha cualquiera parte de la foto anterior y aplica solo las batallas del
+        tramo restante.
+    Dentro de un mismo día manda el orden en que el motor Elo procesó las batallas.
+    """
+
+    def __init__(self, data_filas):
+        n = len(data_filas)
+        nombres = np.concatenate([data_filas['Jugador_A'].to_numpy(dtype=object),
+                                  data_filas['Jugador_B'].to_numpy(dtype=object)])
+        elos = np.concatenate([data_filas['Rating_A_NEW'].to_numpy(dtype=float),
+                               data_filas['Rating_B_NEW'].to_numpy(dtype=float)])
+        fechas = pd.to_datetime(pd.Series(np.concatenate([data_filas['Fecha'].to_numpy()] * 2)))
+        batalla = np.concatenate([np.arange(n), np.arange(n)])
+        ok = pd.notna(nombres) & fechas.notna().to_numpy()
+
+        self.jugadores = pd.Index(sorted(set(nombres[ok])))
+        jug = self.jugadores.get_indexer(nombres[ok])
+        fch = fechas.to_numpy()[ok].astype('datetime64[ns]')
+        orden = np.lexsort((batalla[ok], fch))
+        self._jug, self._elo, self._fch = jug[orden], elos[ok][orden], fch[orden]
+
+        # arrays por jugador (orden estable: conserva el orden cronológico)
+        por_jug = np.argsort(self._jug, kind='stable')
+        self._p_fch, self._p_elo = self._fch[por_jug], self._elo[por_jug]
+        self._p_ini = np.searchsorted(self._jug[por_jug], np.arange(len(self.jugadores) + 1))
+
+        # fotos mensuales del Elo de todos los jugadores (NaN = aún sin batallas)
+        self._cortes, self._fotos, self._pos = [], [], []
+        if len(self._fch):
+            meses = pd.period_range(pd.Timestamp(self._fch[0]).to_period('M'),
+                                    pd.Timestamp(self._fch[-1]).to_period('M'), freq='M')
+            foto, k0 = np.full(len(self.jugadores), np.nan), 0
+            for m in meses:
+                corte = np.datetime64(m.end_time, 'ns')
+                k = int(np.searchsorted(self._fch, corte, side='right'))
+                foto = self._aplicar(foto.copy(), k0, k)
+                self._cortes.append(corte); self._fotos.append(foto); self._pos.append(k)
+                k0 = k
+        self._cortes = np.array(self._cortes, dtype='datetime64[ns]')
+
+    def _aplicar(self, foto, k0, k):
+        """Aplica a `foto` las batallas [k0, k): queda el último Elo de cada jugador."""
+        if k > k0:
+            jug = self._jug[k0:k][::-1]
+            _, ult = np.unique(jug, return_index=True)
+            foto[jug[ult]] = self._elo[k0:k][::-1][ult]
+        return foto
+
+    def vector_a(self, fecha_corte):
+        """Elo de todos los jugadores (alineado con self.jugadores) a la fecha, inclusive."""
+        corte = np.datetime64(pd.Timestamp(fecha_corte), 'ns')
+        s = int(np.searchsorted(self._cortes, corte, side='right')) - 1
+        k = int(np.searchsorted(self._fch, corte, side='right'))
+        if s < 0:
+            return self._aplicar(np.full(len(self.jugadores), np.nan), 0, k)
+        return self._aplicar(self._fotos[s].copy(), self._pos[s], k)
+
+    def elo_a(self, jugador, fecha_corte):
+        """Elo de un jugador (nombre exacto) a la fecha, o None si aún no jugaba."""
+        j = self.jugadores.get_indexer([jugador])[0]
+        if j < 0:
+            return None
+        i0, i1 = self._p_ini[j], self._p_ini[j + 1]
+        corte = np.datetime64(pd.Timestamp(fecha_corte), 'ns')
+        k = int(np.searchsorted(self._p_fch[i0:i1], corte, side='right'))
+        return float(self._p_elo[i0 + k - 1]) if k else None
+
+    def ranking(self, fecha_corte):
+        """Ranking completo (RANK, Participantes, Elo) a la fecha, RANK consecutivo."""
+        v = self.vector_a(fecha_corte)
+        ok = np.flatnonzero(~np.isnan(v))
+        ok = ok[np.argsort(-v[ok], kind='stable')]
+        return pd.DataFrame({'RANK': np.arange(1, len(ok) + 1),
+                             'Participantes': self.jugadores[ok],
+                             'Elo': np.round(v[ok]).astype(int)})
+
+
+def obtener_elo_rank_historico(data_elo, data_filas, jugador, fecha_corte=None, indice=None):
     """Devuelve (elo, rank) de un jugador usando la MISMA lógica que el Ranking Elo Mensual/Anual:
     - Si fecha_corte es None -> Elo/Rank actual (idéntico al 'Ranking Elo en Vivo': mismo data_elo,
       mismo RANK con huecos si hay inactivos).
-    - Si se da fecha_corte -> reconstruye el historial largo (Jugador/Elo/Fecha) a partir de
-      data_filas, se queda solo con las batallas hasta esa fecha, toma el último Elo conocido de
-      cada jugador y arma un ranking fresco entre ellos en ese momento (igual que el mes histórico
-      del Ranking Elo Mensual)."""
+    - Si se da fecha_corte -> toma el último Elo conocido de cada jugador hasta esa fecha y arma
+      un ranking fresco entre ellos en ese momento (igual que el mes histórico del Ranking Elo
+      Mensual). Se resuelve con un IndiceEloHistorico; conviene pasar uno ya construido
+      (vistas.elo.indice_elo) para no indexar data_filas en cada llamada."""
     jl = jugador.lower().strip()
 
     if fecha_corte is None:
@@ -536,41 +847,22 @@ def obtener_elo_rank_historico(data_elo, data_filas, jugador, fecha_corte=None):
             return 1000, 0
         return int(round(row.iloc[0]['Elo'])), int(row.iloc[0]['RANK'])
 
-    if data_filas is None or data_filas.empty:
-        return 1000, 0
+    if indice is None:
+        if data_filas is None or data_filas.empty:
+            return 1000, 0
+        indice = IndiceEloHistorico(data_filas)
 
-    a = data_filas[['Jugador_A', 'Rating_A_NEW', 'Fecha']].rename(
-        columns={'Jugador_A': 'Jugador', 'Rating_A_NEW': 'Elo'})
-    b = data_filas[['Jugador_B', 'Rating_B_NEW', 'Fecha']].rename(
-        columns={'Jugador_B': 'Jugador', 'Rating_B_NEW': 'Elo'})
-    long_df = pd.concat([a, b], ignore_index=True)
-    long_df['Fecha'] = pd.to_datetime(long_df['Fecha'])
-    long_df = long_df.dropna(subset=['Jugador', 'Fecha'])
-    long_df = long_df[long_df['Fecha'] <= pd.Timestamp(fecha_corte)]
-    long_df = long_df.sort_values('Fecha')
-
-    if long_df.empty:
+    ranking = indice.ranking(fecha_corte)
+    if ranking.empty:
         return 1000, 0
 
-    ultimo = long_df.groupby('Jugador')['Elo'].last()
-    ranking = ultimo.sort_values(ascending=False)
-
-    nombre_match = None
-    for nombre in ranking.index:
-        if str(nombre).lower().strip() == jl:
-            nombre_match = nombre
-            break
-    if nombre_match is None:
-        for nombre in ranking.index:
-            if jl in str(nombre).lower():
-                nombre_match = nombre
-                break
-    if nombre_match is None:
+    nombres = ranking['Participantes'].astype(str).str.lower()
+    fila = ranking[nombres.str.strip() == jl]
+    if fila.empty:
+        fila = ranking[nombres.str.contains(jl, regex=False)]
+    if fila.empty:
         return 1000, 0
-
-    elo_val = int(round(ranking[nombre_match]))
-    rank_val = int(ranking.index.get_loc(nombre_match)) + 1
-    return elo_val, rank_val
+    return int(fila.iloc[0]['Elo']), int(fila.iloc[0]['RANK'])
 
 
 CSS_BACK = """
@@ -597,4 +889,18 @@ def volver_inicio():
         pages = st.session_state.get("_pages", {})
         if "inicio" in pages:
             st.switch_page(pages["inicio"])
-    st.markdown("---")
\ No newline at end of file
+    st.markdown("---")
+
+# ══════════════════════════════════════════════════════════════════
+# SHAP (lo comparten entrenar_modelo.py y la página de Predicción)
+# ══════════════════════════════════════════════════════════════════
+
+def shap_hacia_p1(sv):
+    """Valores SHAP como matriz (filas, features) orientada a la clase 0 (gana player1):
+    positivo = empuja hacia player1, sea cual sea la forma que devuelva shap."""
+    if isinstance(sv, list):
+        return np.asarray(sv[0])      # Random Forest: lista [clase0, clase1]
+    sv = np.asarray(sv)
+    if sv.ndim == 3:
+        return sv[:, :, 0]            # (muestras, features, clases)
+    return -np.atleast_2d(sv)         # log-odds de la clase 1 (XGBoost / LightGBM / GBM)
@@ -5,7 +5,7 @@ import plotly.express as px
 import plotly.graph_objects as go
 import os, sys
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from utils import load_data, normalize_columns, ensure_fields
+from utils import load_data, normalize_columns, ensure_fields, load_batallas, version_datos
 
 # ── Constantes ────────────────────────────────────────────────────────────────
 SCORE_LABELS = {
@@ -203,21 +203,13 @@ def calcular_calidad(liga_rows: pd.DataFrame, column: str) -> pd.DataFrame:
 
 
 @st.cache_data(ttl=3600)
-def calcular_todas_las_ligas(_df_raw):
-    df = normalize_columns(_df_raw.copy())
-    df = ensure_fields(df)
-    liga_rows = df[df['league'] == 'LIGA'].copy()
-    liga_rows = liga_rows[liga_rows['Walkover'] >= 0]
-    liga_rows['Liga_Temporada'] = liga_rows['round'].apply(
-        lambda x: str(x).split(' ')[0] + str(x).split(' ')[1]
-        if pd.notna(x) and len(str(x).split(' ')) > 1 else ''
-    )
-    liga_rows['Jornada'] = liga_rows['round'].apply(
-        lambda x: int(str(x).split(' J')[1]) if pd.notna(x) and ' J' in str(x) else None
-    )
+def calcular_todas_las_ligas(version):
+    # Liga_Temporada y Jornada ya vienen derivadas en la tabla de batallas
+    df = load_batallas()
+    liga_rows = df[(df['league'] == 'LIGA') & (df['Walkover'] >= 0)]
     liga_rows = liga_rows[(liga_rows['Liga_Temporada'] != '') &
                            liga_rows['Jornada'].notna() &
-                           (liga_rows['Jornada'] != 10)]
+                           (liga_rows['Jornada'] != 10)].copy()
 
     resultados = []
     for lt in sorted(liga_rows['Liga_Temporada'].unique()):
@@ -238,8 +230,7 @@ def show():
     )
 
     with st.spinner("Calculando indicadores de calidad..."):
-        df_raw = load_data()
-        data_calidad = calcular_todas_las_ligas(df_raw)
+        data_calidad = calcular_todas_las_ligas(version_datos())
 
     if data_calidad.empty:
         st.error("No se pudieron calcular indicadores.")
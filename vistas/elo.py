@@ -1,12 +1,14 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
-import os, sys
+import os, sys, pickle, hashlib, logging
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from utils import load_data, normalize_columns, ensure_fields
+from utils import (load_data, normalize_columns, ensure_fields, load_batallas, preparar_batallas,
+                   version_datos, ROUND_ORDER, get_round_order, IndiceEloHistorico)
 
-# ── Clase PSElo (exacta del notebook) ──────────────────────────────
+# ── Clase PSElo (exacta del notebook; referencia de motor_elo) ─────
 class PSElo:
     def __init__(self, initial_rating):
         self.rating = initial_rating
@@ -47,82 +49,116 @@ class PSElo:
         data_filas.loc[i, "Rating_B"]      = opponent_rating
         data_filas.loc[i, "Rating_B_NEW"]  = new_rating_b
 
-ROUND_ORDER = {
-    'ronda suiza 1': 10, 'ronda suiza 2': 11, 'ronda suiza 3': 12,
-    'ronda suiza 4': 13, 'ronda suiza 5': 14, 'ronda suiza 6': 15,
-    'ronda suiza 7': 16,
-    'ganadores ronda 1': 10, 'ganadores ronda 2': 11, 'ganadores ronda 3': 12,
-    'ganadores ronda 4': 13, 'ganadores ronda 5': 14,
-    'perdedores ronda 1': 10, 'perdedores ronda 2': 11, 'perdedores ronda 3': 12,
-    'perdedores ronda 4': 13, 'perdedores ronda 5': 14,
-    'perdedores ronda 6': 15, 'perdedores ronda 7': 16, 'perdedores ronda 8': 17,
-    'fase de grupos': 20, 'playoff': 25,
-    'treintaidosavo de final': 30, 'dieciseisavos de final': 40,
-    'octavos de final': 50, 'cuartos de final': 60, 'semifinal': 70,
-    'ascenso bo3 semifinales': 71,
-    'ascenso singles semi': 71, 'ascenso doubles semi': 71,
-    'ascenso bo3 final': 80,
-    'ascenso singles cuartos': 61, 'ascenso doubles cuartos': 61,
-    'ascenso singles final': 80, 'ascenso doubles final': 80,
-    'ascenso  final': 80,
-    'final': 90,
+# Pistas que se calculan juntas: (columna, meses para "Activo", Elo inicial).
+# La pista global no tiene columna; Tier arranca en 1000.0 (columna Elo float).
+PISTAS_ELO = {
+    'Formato': (12,  1000),
+    'Tier':    (100, 1000.0),
 }
+MESES_ACTIVIDAD_GLOBAL = 6
 
 
-def get_round_order(r):
-    if pd.isna(r): return 50
-    r_low = str(r).strip().lower()
-    if ' j' in r_low:
-        try: return int(r_low.split(' j')[1])
-        except: pass
-    if r_low.startswith('cypher fecha') or r_low.startswith('ascenso fecha'):
-        try: return int(r_low.split()[-1])
-        except: pass
-    return ROUND_ORDER.get(r_low, 50)
-
-@st.cache_data(ttl=3600)
-def calcular_elo(df_raw):
-    """Calcula el Elo de todos los jugadores a partir del CSV principal."""
-    df = normalize_columns(df_raw.copy())
-    df = ensure_fields(df)
-
-    # Solo partidas completadas con ganador conocido y sin walkover
-    elo = df[df['winner'].notna()].copy()
-    if 'Walkover' in df.columns:
-        elo = elo[elo['Walkover'] != -1]
-    elo = elo.rename(columns={'winner': 'Ganador'})
-    elo['Perdedor'] = elo.apply(
-        lambda r: r['player2'] if str(r['Ganador']).strip() == str(r['player1']).strip() else r['player1'], axis=1
-    )
-    elo['_ro'] = elo['round'].apply(get_round_order) if 'round' in elo.columns else 50
-    elo['_nt'] = elo['N_Torneo'].fillna(0) if 'N_Torneo' in elo.columns else 0
-    elo = elo[['Ganador','Perdedor','date','_ro','_nt']].dropna(subset=['Ganador','Perdedor','date']).copy()
+def _partidas_elo(batallas, extra=()):
+    """Batallas con ganador conocido y sin walkover pendiente, en orden cronológico
+    (fecha, N° de torneo, orden de ronda). Sale de la tabla de batallas compartida.
+    `extra` agrega columnas (p. ej. Formato/Tier) para el cálculo multipista."""
+    elo = batallas[batallas['winner'].notna() & ~batallas['pendiente']]
+    elo = elo.rename(columns={'winner': 'Ganador', 'perdedor': 'Perdedor'})
+    elo = elo[['Ganador','Perdedor','date','_ro','_nt', *extra]].dropna(subset=['Ganador','Perdedor','date']).copy()
     elo = elo[elo['Ganador'] != elo['Perdedor']]
-    elo = elo.sort_values(['date','_nt','_ro'], ascending=True).reset_index(drop=True)
-
-    # Inicializar ELOs
+    return elo.sort_values(['date','_nt','_ro'], ascending=True).reset_index(drop=True)
+
+
+# ── Motor O(n): ids enteros + arrays en lugar de búsquedas con máscara ──
+def _k_factor(rating):
+    """Mismo K que PSElo.get_k_factor para el ganador (se aplica a ambos jugadores)."""
+    if rating < 1100:
+        if rating == 1000:
+            return 80
+        return 80 - (30 * (rating - 1000) / 100)
+    elif rating < 1300:
+        return 50
+    elif rating < 1600:
+        return 40
+    return 32
+
+
+def _actualizar(ratings, g, p):
+    """Una batalla (g le gana a p): misma aritmética que PSElo.update_rating."""
+    a = ratings[g]
+    b = ratings[p]
+    k = _k_factor(a)
+    expected_a = 1 / (1 + 10 ** ((b - a) / 400))
+    expected_b = 1 - expected_a
+    new_a = max(1000, round(a + k * (1 - expected_a)))
+    new_b = max(1000, round(b + k * (0 - expected_b)))
+    ratings[g] = new_a
+    ratings[p] = new_b
+    return a, new_a, b, new_b
+
+
+def motor_elo(id_gan, id_per, ratings):
+    """
+    Recorre las batallas ya ordenadas como pares de ids enteros y actualiza
+    `ratings` (indexable por id) en el lugar. Devuelve el historial en arrays
+    preasignados: (rating_a, rating_a_new, rating_b, rating_b_new), uno por batalla.
+    Cada batalla es O(1): no hay búsquedas por nombre ni escrituras en DataFrames.
+    """
+    hist = np.empty((4, len(id_gan)), dtype=np.float64)
+    for i, (g, p) in enumerate(zip(id_gan, id_per)):
+        hist[:, i] = _actualizar(ratings, g, p)
+    return tuple(hist)
+
+
+def motor_elo_pistas(id_gan, id_per, codigos, n_jugadores, iniciales, ratings=None):
+    """
+    Variante multipista de motor_elo: un único recorrido de las batallas ordenadas
+    actualiza la pista global y las de cada dimensión a la vez.
+    codigos[d][i] es la pista de la batalla i en la dimensión d (-1 = no cuenta);
+    cada pista tiene su propio vector de ratings por id global, que se crea con
+    iniciales[d] la primera vez que aparece.
+    `ratings` permite continuar desde un checkpoint (se extiende a n_jugadores).
+    Devuelve (ratings, historiales): ratings[d][pista] es la lista final y
+    historiales[d] un array (4, n) con NaN en las batallas que no cuentan.
+    """
+    n = len(id_gan)
+    if ratings is None:
+        ratings = [{} for _ in codigos]
+    for d, pistas in enumerate(ratings):
+        for r in pistas.values():
+            r.extend([iniciales[d]] * (n_jugadores - len(r)))
+    hist = [np.full((4, n), np.nan) for _ in codigos]
+    for i, (g, p) in enumerate(zip(id_gan, id_per)):
+        for d, cod in enumerate(codigos):
+            c = cod[i]
+            if c < 0:
+                continue
+            r = ratings[d].get(c)
+            if r is None:
+                r = ratings[d][c] = [iniciales[d]] * n_jugadores
+            hist[d][:, i] = _actualizar(r, g, p)
+    return ratings, hist
+
+
+def _tablas_elo(elo, ratings, hist, meses_actividad, dtype):
+    """Arma (data_elo, data_filas). `ratings` se indexa con el orden de aparición
+    de los jugadores en elo (ganadores y luego perdedores), igual que PSElo."""
     todos = pd.concat([elo['Ganador'], elo['Perdedor']]).unique()
-    data_elo = pd.DataFrame({'Participantes': todos, 'Elo': 1000})
-
-    # Inicializar data_filas
+    rat_a, rat_a_new, rat_b, rat_b_new = hist
+    data_elo = pd.DataFrame({
+        'Participantes': todos,
+        'Elo': np.array(ratings, dtype=dtype),
+    })
     data_filas = pd.DataFrame({
-        'Jugador_A': [''] * len(elo),
-        'Rating_A': [0.0] * len(elo),
-        'Rating_A_NEW': [0.0] * len(elo),
-        'Jugador_B': [''] * len(elo),
-        'Rating_B': [0.0] * len(elo),
-        'Rating_B_NEW': [0.0] * len(elo),
-        'Fecha': elo['date'].values,
+        'Jugador_A':    elo['Ganador'].to_numpy(dtype=object),
+        'Rating_A':     rat_a,
+        'Rating_A_NEW': rat_a_new,
+        'Jugador_B':    elo['Perdedor'].to_numpy(dtype=object),
+        'Rating_B':     rat_b,
+        'Rating_B_NEW': rat_b_new,
+        'Fecha':        elo['date'].values,
     })
 
-    for i in range(len(elo)):
-        ganador = elo.loc[i, 'Ganador']
-        perdedor = elo.loc[i, 'Perdedor']
-        rating_a = data_elo.loc[data_elo['Participantes'] == ganador, 'Elo'].values[0]
-        rating_b = data_elo.loc[data_elo['Participantes'] == perdedor, 'Elo'].values[0]
-        player = PSElo(rating_a)
-        player.update_rating(ganador, perdedor, rating_a, rating_b, 1, data_elo, data_filas, i)
-
     # Agregar última fecha activa
     per = elo[['Perdedor', 'date']].rename(columns={'Perdedor': 'Jugador', 'date': 'Fecha'})
     gan = elo[['Ganador',  'date']].rename(columns={'Ganador':  'Jugador', 'date': 'Fecha'})
@@ -130,97 +166,191 @@ def calcular_elo(df_raw):
     data_elo = pd.merge(data_elo, dfechas, how='left', left_on='Participantes', right_on='Jugador')
     del data_elo['Jugador']
 
-    cutoff = pd.Timestamp.now() - pd.DateOffset(months=6)
+    cutoff = pd.Timestamp.now() - pd.DateOffset(months=meses_actividad)
     data_elo['Actividad'] = data_elo['Fecha'].apply(lambda x: 'Activo' if pd.notna(x) and x >= cutoff else 'Inactivo')
     data_elo = data_elo.sort_values('Elo', ascending=False).reset_index(drop=True)
     data_elo['RANK'] = range(1, len(data_elo) + 1)
+    return data_elo, data_filas
+
 
+def _elo_desde_partidas(elo, meses_actividad, elo_inicial=1000):
+    """Corre el motor Elo sobre las partidas ya ordenadas y arma (data_elo, data_filas)."""
+    todos = pd.Index(pd.concat([elo['Ganador'], elo['Perdedor']]).unique())
+    # los ratings viven en una lista de escalares Python durante el recorrido
+    # (acceso por índice más barato que sobre un array) y vuelven a NumPy al final
+    ratings = [elo_inicial] * len(todos)
+    hist = motor_elo(todos.get_indexer(elo['Ganador']).tolist(),
+                     todos.get_indexer(elo['Perdedor']).tolist(), ratings)
+    return _tablas_elo(elo, ratings, hist, meses_actividad, type(elo_inicial))
+
+
+# ── Checkpoint incremental ──────────────────────────────────────────
+ELO_CHECKPOINT = os.path.join("data", "elo_checkpoint.pkl")
+ELO_CHECKPOINT_FORMATO = 1
+
+log = logging.getLogger(__name__)
+
+
+def _hashes_partidas(elo):
+    """Un hash uint64 por batalla ordenada (jugadores, fecha, orden y pistas)."""
+    return pd.util.hash_pandas_object(elo, index=False).to_numpy()
+
+
+def _hash_prefijo(hashes, n):
+    return hashlib.sha1(hashes[:n].tobytes()).hexdigest()
+
+
+def _cargar_checkpoint(ruta, hashes, dims):
+    """Devuelve el checkpoint si sus n batallas siguen siendo el prefijo exacto de la
+    lista ordenada actual; si cambió algo del historial (o no hay) devuelve None."""
+    try:
+        with open(ruta, "rb") as f:
+            ck = pickle.load(f)
+        if (ck.get("formato") == ELO_CHECKPOINT_FORMATO and ck["dims"] == dims
+                and ck["n"] <= len(hashes)
+                and ck["hash_prefijo"] == _hash_prefijo(hashes, ck["n"])):
+            return ck
+    except Exception:
+        pass
+    return None
+
+
+def _guardar_checkpoint(ruta, ck):
+    """Escritura atómica. Si falla, el Elo ya calculado sigue valiendo: solo se avisa
+    en el log y la próxima corrida recalcula desde el checkpoint anterior (o de cero)."""
+    tmp = f"{ruta}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+        with open(tmp, "wb") as f:
+            pickle.dump(ck, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, ruta)
+    except (OSError, pickle.PicklingError) as e:
+        log.warning("No se pudo guardar el checkpoint de Elo en %s: %s", ruta, e)
+        try: os.remove(tmp)
+        except OSError: pass
+
+
+def _codificar(valores, serie):
+    """Códigos enteros estables: los valores nuevos se agregan al final de `valores`."""
+    nuevos = pd.Index(serie.dropna().unique()).difference(pd.Index(valores), sort=False)
+    valores.extend(nuevos.tolist())
+    return pd.Index(valores).get_indexer(serie)
+
+
+def _elo_multipista(batallas, ruta_checkpoint=None):
+    """
+    Global + una pista por cada Formato y cada Tier en un solo recorrido.
+    Devuelve {'global': (data_elo, data_filas, elo),
+              'Formato': {formato: (data_elo, data_filas)}, 'Tier': {tier: (...)}}.
+
+    Con ruta_checkpoint, retoma desde el último estado guardado (ratings por pista,
+    ids de jugadores/pistas e historial) y solo procesa las batallas que quedaron
+    ordenadas después de él. Si alguna batalla ya procesada cambió, se movió o se
+    borró, el hash del prefijo no coincide y se recalcula todo desde cero.
+    """
+    dims = [c for c in PISTAS_ELO if c in batallas.columns]
+    elo = _partidas_elo(batallas, extra=dims)
+    hashes = _hashes_partidas(elo)
+
+    ck = _cargar_checkpoint(ruta_checkpoint, hashes, dims) if ruta_checkpoint else None
+    if ck is None:
+        ck = {"formato": ELO_CHECKPOINT_FORMATO, "dims": dims, "n": 0,
+              "jugadores": [], "valores": [[0]] + [[] for _ in dims],
+              "ratings": None, "hist": [np.empty((4, 0)) for _ in range(len(dims) + 1)]}
+    n0 = ck["n"]
+
+    # ids estables entre corridas: jugadores y pistas nuevas se agregan al final
+    jugadores = ck["jugadores"]
+    id_gan = _codificar(jugadores, elo['Ganador'])
+    id_per = _codificar(jugadores, elo['Perdedor'])
+    codigos = [np.zeros(len(elo), dtype=np.int64)]
+    codigos += [_codificar(ck["valores"][d], elo[c]) for d, c in enumerate(dims, start=1)]
+    iniciales = [1000] + [PISTAS_ELO[c][1] for c in dims]
+
+    ratings, hist_nuevo = motor_elo_pistas(id_gan[n0:].tolist(), id_per[n0:].tolist(),
+                                           [c[n0:].tolist() for c in codigos],
+                                           len(jugadores), iniciales, ck["ratings"])
+    hist = [np.concatenate([h, hn], axis=1) for h, hn in zip(ck["hist"], hist_nuevo)]
+
+    if ruta_checkpoint and n0 < len(elo):
+        ck.update(n=len(elo), hash_prefijo=_hash_prefijo(hashes, len(elo)),
+                  ratings=ratings, hist=hist)
+        _guardar_checkpoint(ruta_checkpoint, ck)
+
+    indice = pd.Index(jugadores)
+
+    def _tablas(m, r, h, meses, dtype):
+        sub = base[m].reset_index(drop=True) if m is not None else base
+        ids = indice.get_indexer(pd.concat([sub['Ganador'], sub['Perdedor']]).unique())
+        return _tablas_elo(sub, [r[j] for j in ids], h, meses, dtype)
+
+    base = elo[['Ganador','Perdedor','date','_ro','_nt']]
+    data_elo, data_filas = _tablas(None, ratings[0].get(0, []), hist[0], MESES_ACTIVIDAD_GLOBAL, int)
+    out = {'global': (data_elo, data_filas, base)}
+    for d, c in enumerate(dims, start=1):
+        meses, inicial = PISTAS_ELO[c]
+        out[c] = {}
+        for k, valor in enumerate(ck["valores"][d]):
+            m = codigos[d] == k
+            if m.any():
+                out[c][valor] = _tablas(m, ratings[d][k], hist[d][:, m], meses, type(inicial))
+    return out
+
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def calcular_elo_pistas(version):
+    """Todas las pistas de Elo de la tabla de batallas, cacheadas por versión del CSV."""
+    return _elo_multipista(load_batallas(), ruta_checkpoint=ELO_CHECKPOINT)
+
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def _calcular_elo_version(version):
+    # solo la pista global: perfil de jugador y TCG no necesitan copiar todas las pistas
+    return calcular_elo_pistas(version)['global']
+
+
+@st.cache_resource(ttl=3600, max_entries=2, show_spinner=False)
+def indice_elo(version):
+    """IndiceEloHistorico del Elo global, compartido (solo lectura) por versión del CSV."""
+    _, data_filas, _ = _calcular_elo_version(version)
+    return IndiceEloHistorico(data_filas)
+
+
+@st.cache_data(ttl=3600)
+def _calcular_elo_df(df_raw):
+    elo = _partidas_elo(preparar_batallas(df_raw))
+    data_elo, data_filas = _elo_desde_partidas(elo, meses_actividad=MESES_ACTIVIDAD_GLOBAL)
     return data_elo, data_filas, elo
 
 
+def calcular_elo(df_raw=None):
+    """Calcula el Elo de todos los jugadores. Sin argumentos usa la tabla de batallas
+    compartida (cacheada por versión del CSV); con un df_raw propio lo procesa aparte."""
+    if df_raw is None:
+        return _calcular_elo_version(version_datos())
+    return _calcular_elo_df(df_raw)
+
+
+def _elo_de_pista(df_raw, columna, valor):
+    vacio = (pd.DataFrame(), pd.DataFrame())
+    if df_raw is None:
+        return calcular_elo_pistas(version_datos()).get(columna, {}).get(valor, vacio)
+    b = preparar_batallas(df_raw)
+    if columna not in b.columns: return vacio
+    b = b[b[columna] == valor]
+    if b.empty: return vacio
+    elo = _partidas_elo(b)
+    if elo.empty: return vacio
+    meses, inicial = PISTAS_ELO[columna]
+    return _elo_desde_partidas(elo, meses_actividad=meses, elo_inicial=inicial)
+
 
 def calcular_elo_formato(df_raw, formato):
-    df = normalize_columns(df_raw.copy())
-    df = ensure_fields(df)
-    if 'Formato' not in df.columns: return pd.DataFrame(), pd.DataFrame()
-    df = df[df['Formato'] == formato]
-    if df.empty: return pd.DataFrame(), pd.DataFrame()
-    elo = df[df['winner'].notna()].copy()
-    if 'Walkover' in df.columns: elo = elo[elo['Walkover'] != -1]
-    elo = elo.rename(columns={'winner': 'Ganador'})
-    elo['Perdedor'] = elo.apply(
-        lambda r: r['player2'] if str(r['Ganador']).strip()==str(r['player1']).strip() else r['player1'], axis=1)
-    elo['_ro'] = elo['round'].apply(get_round_order) if 'round' in elo.columns else 50
-    elo['_nt'] = elo['N_Torneo'].fillna(0) if 'N_Torneo' in elo.columns else 0
-    elo = elo[['Ganador','Perdedor','date','_ro','_nt']].dropna(subset=['Ganador','Perdedor','date']).copy()
-    elo = elo[elo['Ganador'] != elo['Perdedor']]
-    elo = elo.sort_values(['date','_nt','_ro'], ascending=True).reset_index(drop=True)
-    if elo.empty: return pd.DataFrame(), pd.DataFrame()
-    todos = pd.concat([elo['Ganador'], elo['Perdedor']]).unique()
-    data_elo = pd.DataFrame({'Participantes': todos, 'Elo': 1000})
-    data_filas = pd.DataFrame({
-        'Jugador_A': ['']*len(elo), 'Rating_A': [0.0]*len(elo),
-        'Rating_A_NEW': [0.0]*len(elo), 'Jugador_B': ['']*len(elo),
-        'Rating_B': [0.0]*len(elo), 'Rating_B_NEW': [0.0]*len(elo),
-        'Fecha': elo['date'].values,
-    })
-    for i in range(len(elo)):
-        g = elo.loc[i,'Ganador']; p = elo.loc[i,'Perdedor']
-        ra = data_elo.loc[data_elo['Participantes']==g,'Elo'].values[0]
-        rb = data_elo.loc[data_elo['Participantes']==p,'Elo'].values[0]
-        PSElo(ra).update_rating(g, p, ra, rb, 1, data_elo, data_filas, i)
-    per = elo[['Perdedor','date']].rename(columns={'Perdedor':'Jugador','date':'Fecha'})
-    gan = elo[['Ganador','date']].rename(columns={'Ganador':'Jugador','date':'Fecha'})
-    dfechas = pd.concat([per,gan]).groupby('Jugador')['Fecha'].max().reset_index()
-    data_elo = pd.merge(data_elo, dfechas, how='left', left_on='Participantes', right_on='Jugador')
-    del data_elo['Jugador']
-    cutoff = pd.Timestamp.now() - pd.DateOffset(months=12)
-    data_elo['Actividad'] = data_elo['Fecha'].apply(lambda x: 'Activo' if pd.notna(x) and x>=cutoff else 'Inactivo')
-    data_elo = data_elo.sort_values('Elo', ascending=False).reset_index(drop=True)
-    data_elo['RANK'] = range(1, len(data_elo)+1)
-    return data_elo, data_filas
+    return _elo_de_pista(df_raw, 'Formato', formato)
 
 def calcular_elo_tier(df_raw, tier):
-    """Calcula Elo independiente filtrado por Tier — usa PSElo igual que calcular_elo_formato."""
-    df = normalize_columns(df_raw.copy())
-    df = ensure_fields(df)
-    if 'Tier' not in df.columns: return pd.DataFrame(), pd.DataFrame()
-    df = df[df['Tier'] == tier]
-    if df.empty: return pd.DataFrame(), pd.DataFrame()
-    elo = df[df['winner'].notna()].copy()
-    if 'Walkover' in df.columns: elo = elo[elo['Walkover'] != -1]
-    elo = elo.rename(columns={'winner': 'Ganador'})
-    elo['Perdedor'] = elo.apply(
-        lambda r: r['player2'] if str(r['Ganador']).strip()==str(r['player1']).strip() else r['player1'], axis=1)
-    elo['_ro'] = elo['round'].apply(get_round_order) if 'round' in elo.columns else 50
-    elo['_nt'] = elo['N_Torneo'].fillna(0) if 'N_Torneo' in elo.columns else 0
-    elo = elo[['Ganador','Perdedor','date','_ro','_nt']].dropna(subset=['Ganador','Perdedor','date']).copy()
-    elo = elo[elo['Ganador'] != elo['Perdedor']]
-    elo = elo.sort_values(['date','_nt','_ro'], ascending=True).reset_index(drop=True)
-    if elo.empty: return pd.DataFrame(), pd.DataFrame()
-    todos = pd.concat([elo['Ganador'], elo['Perdedor']]).unique()
-    data_elo = pd.DataFrame({'Participantes': todos, 'Elo': 1000.0})
-    data_filas = pd.DataFrame({
-        'Jugador_A': ['']*len(elo), 'Rating_A': [0.0]*len(elo),
-        'Rating_A_NEW': [0.0]*len(elo), 'Jugador_B': ['']*len(elo),
-        'Rating_B': [0.0]*len(elo), 'Rating_B_NEW': [0.0]*len(elo),
-        'Fecha': elo['date'].values,
-    })
-    for i in range(len(elo)):
-        g = elo.loc[i,'Ganador']; p = elo.loc[i,'Perdedor']
-        ra = data_elo.loc[data_elo['Participantes']==g,'Elo'].values[0]
-        rb = data_elo.loc[data_elo['Participantes']==p,'Elo'].values[0]
-        PSElo(ra).update_rating(g, p, ra, rb, 1, data_elo, data_filas, i)
-    per = elo[['Perdedor','date']].rename(columns={'Perdedor':'Jugador','date':'Fecha'})
-    gan = elo[['Ganador','date']].rename(columns={'Ganador':'Jugador','date':'Fecha'})
-    dfechas = pd.concat([per,gan]).groupby('Jugador')['Fecha'].max().reset_index()
-    data_elo = pd.merge(data_elo, dfechas, how='left', left_on='Participantes', right_on='Jugador')
-    del data_elo['Jugador']
-    cutoff = pd.Timestamp.now() - pd.DateOffset(months=100)
-    data_elo['Actividad'] = data_elo['Fecha'].apply(lambda x: 'Activo' if pd.notna(x) and x>=cutoff else 'Inactivo')
-    data_elo = data_elo.sort_values('Elo', ascending=False).reset_index(drop=True)
-    data_elo['RANK'] = range(1, len(data_elo)+1)
-    return data_elo, data_filas
+    """Calcula Elo independiente filtrado por Tier — mismo motor que calcular_elo_formato."""
+    return _elo_de_pista(df_raw, 'Tier', tier)
 
 def get_player_elo_history(player_query, data_filas, exact=False):
     if exact:
@@ -256,9 +386,12 @@ def get_player_elo_history(player_query, data_filas, exact=False):
 
 def show():
     df_raw = load_data()
+    batallas = load_batallas()
 
     with st.spinner("Calculando Elo..."):
-        data_elo, data_filas, elo_raw = calcular_elo(df_raw)
+        pistas = calcular_elo_pistas(version_datos())
+        data_elo, data_filas, elo_raw = pistas['global']
+    vacio = (pd.DataFrame(), pd.DataFrame())
 
     activos = data_elo[data_elo['Actividad'] == 'Activo'].copy()
 
@@ -349,55 +482,23 @@ def show():
     st.caption("Ranking completo (Elo + RANK) de todos los jugadores, congelado al final de un mes/año elegido. "
                "El Elo se mantiene acumulado desde su última partida aunque no hayan jugado ese mes.")
 
-    def _build_long_history(data_filas):
-        a = data_filas[['Jugador_A', 'Rating_A_NEW', 'Fecha']].rename(
-            columns={'Jugador_A': 'Jugador', 'Rating_A_NEW': 'Elo'})
-        b = data_filas[['Jugador_B', 'Rating_B_NEW', 'Fecha']].rename(
-            columns={'Jugador_B': 'Jugador', 'Rating_B_NEW': 'Elo'})
-        long_df = pd.concat([a, b], ignore_index=True)
-        long_df['Fecha'] = pd.to_datetime(long_df['Fecha'])
-        long_df = long_df.dropna(subset=['Jugador', 'Fecha'])
-        long_df = long_df.sort_values('Fecha')
-        return long_df
-
-    def _ranking_periodo(pivot_full, periodo_sel):
-        """Toma la columna del periodo elegido, descarta jugadores sin Elo aún y arma el ranking."""
-        serie = pivot_full.loc[periodo_sel].dropna().sort_values(ascending=False)
-        rank_df = serie.reset_index()
-        rank_df.columns = ['Participantes', 'Elo']
-        rank_df['Elo'] = rank_df['Elo'].round(0).astype(int)
-        rank_df.insert(0, 'RANK', range(1, len(rank_df) + 1))
-        return rank_df
-
-    long_hist = _build_long_history(data_filas)
-
-    if long_hist.empty:
+    indice = indice_elo(version_datos())
+
+    def _ranking_periodo(periodo_sel, freq):
+        """Ranking congelado al cierre del periodo elegido (mes o año)."""
+        return indice.ranking(pd.Period(periodo_sel, freq=freq).end_time)
+
+    if not len(indice.jugadores):
         st.info("No hay historial suficiente para calcular rankings mensuales.")
     else:
-        fecha_min, fecha_max = long_hist['Fecha'].min(), long_hist['Fecha'].max()
-
-        # ---- grilla mensual completa (incluye meses sin partidas, con ffill) ----
-        long_hist['Periodo_M'] = long_hist['Fecha'].dt.to_period('M')
-        last_m = long_hist.groupby(['Periodo_M', 'Jugador'])['Elo'].last().reset_index()
-        pivot_m_full = last_m.pivot(index='Periodo_M', columns='Jugador', values='Elo')
-        pivot_m_full = pivot_m_full.reindex(
-            pd.period_range(fecha_min.to_period('M'), fecha_max.to_period('M'), freq='M')
-        ).ffill()
-        pivot_m_full.index = pivot_m_full.index.astype(str)
-
-        # ---- grilla anual completa ----
-        long_hist['Periodo_A'] = long_hist['Fecha'].dt.to_period('Y')
-        last_a = long_hist.groupby(['Periodo_A', 'Jugador'])['Elo'].last().reset_index()
-        pivot_a_full = last_a.pivot(index='Periodo_A', columns='Jugador', values='Elo')
-        pivot_a_full = pivot_a_full.reindex(
-            pd.period_range(fecha_min.to_period('Y'), fecha_max.to_period('Y'), freq='Y')
-        ).ffill()
-        pivot_a_full.index = pivot_a_full.index.astype(str)
+        fechas_hist = pd.to_datetime(data_filas['Fecha'])
+        fecha_min, fecha_max = fechas_hist.min(), fechas_hist.max()
+        meses_disp = pd.period_range(fecha_min.to_period('M'), fecha_max.to_period('M'), freq='M').astype(str).tolist()
+        anios_disp = pd.period_range(fecha_min.to_period('Y'), fecha_max.to_period('Y'), freq='Y').astype(str).tolist()
 
         tab_mes, tab_anio, tab_torneo = st.tabs(["📅 Ranking Mensual", "📆 Ranking Anual", "🏆 Ranking por Torneo"])
 
         with tab_mes:
-            meses_disp = pivot_m_full.index.tolist()
             mes_sel = st.selectbox("Selecciona mes/año", meses_disp, index=len(meses_disp) - 1, key="rank_mes_sel")
 
             filtro_m = st.radio("Mostrar", ["🌐 Todos", "✅ Solo activos (hoy)"], horizontal=True, key="filtro_rank_mes")
@@ -411,7 +512,7 @@ def show():
                 st.caption("✅ Este mes es el estado acumulado hasta hoy — coincide exactamente con el "
                            "'Ranking Elo en Vivo' de arriba (mismos números de RANK, incluyendo huecos si hay inactivos).")
             else:
-                rank_mes = _ranking_periodo(pivot_m_full, mes_sel)
+                rank_mes = _ranking_periodo(mes_sel, 'M')
                 if filtro_m == "✅ Solo activos (hoy)":
                     rank_mes = rank_mes[rank_mes['Participantes'].isin(activos['Participantes'])].reset_index(drop=True)
                     rank_mes['RANK'] = range(1, len(rank_mes) + 1)
@@ -427,7 +528,6 @@ def show():
                                 f"ranking_elo_{mes_sel}.csv", "text/csv", key="dl_rank_mes")
 
         with tab_anio:
-            anios_disp = pivot_a_full.index.tolist()
             anio_sel = st.selectbox("Selecciona año", anios_disp, index=len(anios_disp) - 1, key="rank_anio_sel")
 
             filtro_a = st.radio("Mostrar", ["🌐 Todos", "✅ Solo activos (hoy)"], horizontal=True, key="filtro_rank_anio")
@@ -439,7 +539,7 @@ def show():
                 st.caption("✅ Este año es el estado acumulado hasta hoy — coincide exactamente con el "
                            "'Ranking Elo en Vivo' de arriba (mismos números de RANK, incluyendo huecos si hay inactivos).")
             else:
-                rank_anio = _ranking_periodo(pivot_a_full, anio_sel)
+                rank_anio = _ranking_periodo(anio_sel, 'Y')
                 if filtro_a == "✅ Solo activos (hoy)":
                     rank_anio = rank_anio[rank_anio['Participantes'].isin(activos['Participantes'])].reset_index(drop=True)
                     rank_anio['RANK'] = range(1, len(rank_anio) + 1)
@@ -482,15 +582,7 @@ def show():
                     st.caption("✅ Este torneo es el evento más reciente registrado — coincide exactamente con "
                                "el 'Ranking Elo en Vivo' de arriba.")
                 else:
-                    hist_corte = long_hist[long_hist['Fecha'] <= fecha_torneo]
-                    if hist_corte.empty:
-                        rank_torneo = pd.DataFrame(columns=['RANK', 'Participantes', 'Elo'])
-                    else:
-                        ultimo = hist_corte.groupby('Jugador')['Elo'].last().sort_values(ascending=False)
-                        rank_torneo = ultimo.reset_index()
-                        rank_torneo.columns = ['Participantes', 'Elo']
-                        rank_torneo['Elo'] = rank_torneo['Elo'].round(0).astype(int)
-                        rank_torneo.insert(0, 'RANK', range(1, len(rank_torneo) + 1))
+                    rank_torneo = indice.ranking(fecha_torneo)
 
                     if filtro_t == "✅ Solo activos (hoy)" and not rank_torneo.empty:
                         rank_torneo = rank_torneo[rank_torneo['Participantes'].isin(activos['Participantes'])].reset_index(drop=True)
@@ -512,9 +604,7 @@ def show():
     st.header("🎮 Ranking Elo por Formato")
     st.caption("Elo calculado de forma independiente para cada formato.")
 
-    df_raw_fmt = load_data()
-    df_fmt_check = normalize_columns(df_raw_fmt.copy())
-    formatos_disp = sorted(df_fmt_check['Formato'].dropna().unique().tolist()) if 'Formato' in df_fmt_check.columns else []
+    formatos_disp = sorted(batallas['Formato'].dropna().unique().tolist()) if 'Formato' in batallas.columns else []
 
     if not formatos_disp:
         st.info("No se encontró la columna 'Formato' en los datos.")
@@ -522,8 +612,7 @@ def show():
         tabs_fmt = st.tabs([f"🎯 {f}" for f in formatos_disp])
         for tab_f, formato in zip(tabs_fmt, formatos_disp):
             with tab_f:
-                with st.spinner(f"Calculando Elo {formato}..."):
-                    elo_fmt, _ = calcular_elo_formato(df_raw_fmt, formato)
+                elo_fmt, _ = pistas.get('Formato', {}).get(formato, vacio)
                 if elo_fmt.empty:
                     st.info(f"Sin partidas de {formato}.")
                     continue
@@ -582,9 +671,7 @@ border:2px solid {colores[idx]};border-radius:12px;padding:16px;text-align:cente
     st.header("🏷️ Ranking Elo por Tier")
     st.caption("Elo calculado de forma independiente para cada Tier.")
 
-    df_raw_tier  = load_data()
-    df_tier_check = normalize_columns(df_raw_tier.copy())
-    tiers_disp = sorted(df_tier_check['Tier'].dropna().unique().tolist()) if 'Tier' in df_tier_check.columns else []
+    tiers_disp = sorted(batallas['Tier'].dropna().unique().tolist()) if 'Tier' in batallas.columns else []
 
     if not tiers_disp:
         st.info("No se encontró la columna 'Tier' en los datos.")
@@ -592,8 +679,7 @@ border:2px solid {colores[idx]};border-radius:12px;padding:16px;text-align:cente
         tabs_tier = st.tabs([f"🏷️ {t}" for t in tiers_disp])
         for tab_t, tier in zip(tabs_tier, tiers_disp):
             with tab_t:
-                with st.spinner(f"Calculando Elo {tier}..."):
-                    elo_tier, _ = calcular_elo_tier(df_raw_tier, tier)
+                elo_tier, _ = pistas.get('Tier', {}).get(tier, vacio)
                 if elo_tier.empty:
                     st.info(f"Sin partidas de {tier}.")
                     continue
@@ -3,9 +3,9 @@ import pandas as pd
 import plotly.express as px
 import re, os, sys, base64
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from utils import (load_data, normalize_columns, ensure_fields, compute_player_stats, generar_tabla_temporada, generar_tabla_torneo,
+from utils import (load_data, normalize_columns, ensure_fields, load_batallas, compute_player_stats, generar_tabla_temporada, generar_tabla_torneo,
                    obtener_banner, obtener_logo_liga, obtener_banner_torneo,
-                   build_base_liga, build_base_torneo, build_base_jornada)
+                   build_bases)
 from vistas.logros import (LOGROS, evaluar_logros, RAREZA_COLORS, CAT_COLORS,
                             CATEGORIAS_ORDEN, BW_COLORS, medal_svg, _get_img_bytes)
 from vistas.elo import calcular_elo
@@ -1133,8 +1133,7 @@ def generar_pdf_jugador(
 
 def show():
     df_raw = load_data()
-    df = normalize_columns(df_raw.copy())
-    df = ensure_fields(df)
+    df = load_batallas()   # solo lectura: tabla de batallas compartida
 
     completed_mask = (
         df['status'].fillna('').str.lower().isin(
@@ -1143,9 +1142,10 @@ def show():
     )
 
     # Build derived data
-    base2, df_liga = build_base_liga(df_raw)
-    base_torneo_final, _ = build_base_torneo(df_raw)
-    base2_jornada, df_liga_jornada = build_base_jornada(df_liga)
+    bases = build_bases()
+    base2, df_liga = bases["liga"]
+    base_torneo_final, _ = bases["torneo"]
+    base2_jornada, df_liga_jornada = bases["jornada"]
 
     leagues = df['league'].fillna('Sin liga').unique().tolist()
 
@@ -2021,7 +2021,7 @@ def show():
             from vistas.logros import mostrar_logros
             # calcular_elo para logros de ranking
             try:
-                _data_elo_lg, _data_filas_lg, _ = calcular_elo(df_raw)
+                _data_elo_lg, _data_filas_lg, _ = calcular_elo()
 
 
 
@@ -2123,7 +2123,7 @@ def show():
                 _camp_liga_pdf  = campeonatos_liga  if 'campeonatos_liga'  in dir() else []
                 _camp_torn_pdf  = campeonatos_torneo if 'campeonatos_torneo' in dir() else []
                 try:
-                    _data_elo_pdf, _data_filas_pdf, _ = calcular_elo(df_raw)
+                    _data_elo_pdf, _data_filas_pdf, _ = calcular_elo()
                 except Exception:
                     _data_elo_pdf   = pd.DataFrame()
                     _data_filas_pdf = pd.DataFrame()
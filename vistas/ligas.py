@@ -6,7 +6,7 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from utils import (load_data, normalize_columns, ensure_fields,
                    generar_tabla_temporada, generar_tabla_torneo,
                    obtener_banner, obtener_logo_liga, obtener_banner_torneo,
-                   build_base_liga, build_base_torneo, build_base_jornada,
+                   build_bases,
                    generar_tabla_jornada, volver_inicio,
                    generar_tabla_formatos, generar_tabla_enfrentamientos,
                    tabla_formatos_html, tabla_enfrentamientos_html)
@@ -16,9 +16,10 @@ def show():
     df = normalize_columns(df_raw.copy())
     df = ensure_fields(df)
 
-    base2, df_liga = build_base_liga(df_raw)
-    base_torneo_final, _ = build_base_torneo(df_raw)
-    base2_jornada, df_liga_jornada = build_base_jornada(df_liga)
+    bases = build_bases()
+    base2, df_liga = bases["liga"]
+    base_torneo_final, _ = bases["torneo"]
+    base2_jornada, df_liga_jornada = bases["jornada"]
 
     # ── Tablas de Ligas ─────────────────────────────────────────────
     st.markdown('<div id="tablas-ligas"></div>', unsafe_allow_html=True)
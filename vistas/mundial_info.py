@@ -3,7 +3,7 @@ import pandas as pd
 import os, sys, re, io
 from PIL import Image, ImageDraw, ImageFont
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from utils import load_data, normalize_columns, ensure_fields, build_base_liga
+from utils import load_data, normalize_columns, ensure_fields, build_bases, load_batallas
 
 
 # ══════════════════════════════════════════════════════════════════
@@ -318,7 +318,7 @@ def _calcular_puntos(tipos, posiciones, ligas_list, df_raw):
 
     # Ligas — posición calculada desde base2
     try:
-        base2, _ = build_base_liga(df_raw)
+        base2, _ = build_bases()["liga"]
         for liga_temp in ligas_list:
             m = re.match(r'^([A-Z]+)', liga_temp)
             if not m: continue
@@ -382,7 +382,7 @@ def _calcular_puntos_por_formato(tipos, posiciones, ligas_dict, df_raw, penalida
 
     # ── Ligas — formato manual + posición calculada desde base2 ─
     try:
-        base2, _ = build_base_liga(df_raw)
+        base2, _ = build_bases()["liga"]
         for liga_temp, liga_fmt in ligas_dict.items():
             liga_fmt = str(liga_fmt).upper()
             if liga_fmt not in rankings: continue
@@ -815,8 +815,7 @@ MONOTYPE1_PENALIDADES = {
 
 def show():
     df_raw = load_data()
-    df     = normalize_columns(df_raw.copy())
-    df     = ensure_fields(df)
+    df     = load_batallas()   # solo lectura: tabla de batallas compartida
 
     st.title("🌎 Mundial Pokémon")
     st.markdown("---")
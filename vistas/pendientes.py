@@ -6,7 +6,8 @@ import os, sys, base64
 from datetime import datetime
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from utils import load_data, normalize_columns, ensure_fields, obtener_banner, obtener_banner_torneo
+from utils import (load_data, normalize_columns, ensure_fields, obtener_banner, obtener_banner_torneo,
+                   load_batallas, version_datos)
 
 # ── Zonas horarias por país ────────────────────────────────────────────────────
 PAIS_TIMEZONE = {
@@ -65,12 +66,9 @@ def cargar_celulares():
     return {}
 
 @st.cache_data(ttl=60)
-def cargar_pendientes(_df_raw):
-    df = normalize_columns(_df_raw.copy())
-    df = ensure_fields(df)
-    if 'Walkover' in df.columns:
-        return df[df['Walkover'] == -1].copy()
-    return df[df['winner'].isna()].copy()
+def cargar_pendientes(version):
+    df = load_batallas()
+    return df[df['pendiente']].copy()
 
 
 def diff_horas(pais_participante: str, pais_rival: str) -> str:
@@ -404,8 +402,7 @@ def show():
     st.markdown("---")
 
     # ── Cargar datos ──────────────────────────────────────────────────────────
-    df_raw    = load_data()
-    pending   = cargar_pendientes(df_raw)
+    pending   = cargar_pendientes(version_datos())
     celulares = cargar_celulares()
 
     if pending.empty:
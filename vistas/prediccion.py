@@ -5,91 +5,243 @@ import plotly.express as px
 import plotly.graph_objects as go
 import os, sys
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from utils import load_data, normalize_columns, ensure_fields, score_final
-import pickle, hashlib
+from utils import (load_data, normalize_columns, ensure_fields, score_final, load_batallas, version_datos,
+                   shap_hacia_p1)
+import pickle, hashlib, json
+from collections.abc import Mapping
 from datetime import datetime
 
-MODEL_CACHE_PATH = "modelo_prediccion.pkl"
+MODEL_CACHE_PATH = "modelo_prediccion.pkl"   # formato anterior: todo en un solo pickle
+MODEL_BUNDLE_DIR = "modelo_prediccion"       # bundle de entrenar_modelo.guardar_bundle
+BUNDLE_FORMATO   = 1
 
 def _data_hash(_df_raw):
     """Hash rápido para detectar cambios en el CSV."""
     return hashlib.md5(str(len(_df_raw)).encode() + str(_df_raw.iloc[-1].values).encode()).hexdigest()[:8]
 
+@st.cache_resource(show_spinner="Cargando modelo...", max_entries=8)
+def _cargar_modelo(ruta, sha1):
+    """Un modelo del bundle; compartido por todas las sesiones mientras no cambie su hash."""
+    with open(ruta, "rb") as f:
+        return pickle.load(f)
+
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def _cargar_tabla(ruta, sha1):
+    """
+    Tabla del bundle sobre el archivo memory-mapped. Con split_blocks cada columna
+    numérica sin nulos queda como vista de solo lectura del mapeo (no se copia, y el
+    mapeo vive mientras viva el DataFrame cacheado); texto y columnas con nulos sí se
+    convierten a memoria propia. Compartida entre sesiones: no modificar en el lugar.
+    """
+    import pyarrow as pa
+    return pa.ipc.open_file(pa.memory_map(ruta, "r")).read_all().to_pandas(split_blocks=True)
+
+
+class _ModelosBundle(Mapping):
+    """Los modelos del bundle por nombre. Listarlos no carga nada: cada modelo (y su
+    librería: xgboost, lightgbm...) se deserializa recién cuando se usa."""
+
+    def __init__(self, directorio, modelos):
+        self._dir, self._modelos = directorio, modelos
+
+    def __getitem__(self, nombre):
+        m = self._modelos[nombre]
+        return _cargar_modelo(os.path.join(self._dir, m["archivo"]), m["sha1"])
+
+    def __contains__(self, nombre):
+        return nombre in self._modelos
+
+    def __iter__(self):
+        return iter(self._modelos)
+
+    def __len__(self):
+        return len(self._modelos)
+
+
+def _load_bundle(directorio=MODEL_BUNDLE_DIR):
+    """Mismo diccionario que el pkl anterior, pero con los modelos perezosos."""
+    with open(os.path.join(directorio, "manifest.json")) as f:
+        man = json.load(f)
+    if man.get("formato") != BUNDLE_FORMATO:
+        raise ValueError(f"formato de bundle {man.get('formato')} no soportado; reentrená con entrenar_modelo.py")
+    cache = dict(man, trained=_ModelosBundle(directorio, man["modelos"]))
+    cache["trained_at"] = datetime.fromisoformat(man["trained_at"]) if man.get("trained_at") else None
+    for nombre, t in man["tablas"].items():
+        cache[nombre] = _cargar_tabla(os.path.join(directorio, t["archivo"]), t["sha1"])
+    return cache
+
+
+def _predicciones_precalculadas(cache, modelo):
+    """Tabla de entrenar_modelo.puntuar_pendientes para `modelo` (una fila por fila de
+    pred_features), o None si no está o no corresponde a ese modelo: se calcula en vivo."""
+    m   = cache.get("modelos", {}).get(modelo, {})
+    pre = m.get("predicciones")
+    if not pre:
+        return None
+    try:
+        t = _cargar_tabla(os.path.join(MODEL_BUNDLE_DIR, pre["archivo"]), pre["sha1"])
+    except Exception:
+        return None
+    if len(t) != len(cache.get("pred_features", ())) or (t["modelo_sha1"] != m["sha1"]).any():
+        return None
+    return t.drop(columns="modelo_sha1")
+
+
+def _predecir_pendientes(modelo, pf, top_feat):
+    """Cálculo en vivo de prob_p1, prob_p2, favorito y confianza (respaldo de
+    _predicciones_precalculadas; debe dar lo mismo que entrenar_modelo.puntuar_pendientes)."""
+    probs = modelo.predict_proba(pf[top_feat].fillna(0))
+    pf = pf.copy()
+    pf["prob_p1"] = (probs[:, 0] * 100).round(1)
+    pf["prob_p2"] = (probs[:, 1] * 100).round(1)
+    pf["favorito"] = pf.apply(
+        lambda r: r["player1"] if r["prob_p1"] >= r["prob_p2"] else r["player2"], axis=1)
+    pf["confianza"] = pf[["prob_p1","prob_p2"]].max(axis=1)
+    return pf
+
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def _load_pkl(ruta, mtime_ns):
+    with open(ruta, "rb") as f:
+        return pickle.load(f)
+
+
 def load_model(df_raw):
     """
-    Solo lee modelo_prediccion.pkl generado por entrenar_modelo.py.
-    Nunca entrena. Si no existe el pkl, muestra error con instrucciones.
+    Lee el bundle modelo_prediccion/ generado por entrenar_modelo.py (o, si no está,
+    el modelo_prediccion.pkl del formato anterior). Nunca entrena. Si no hay ninguno,
+    muestra error con instrucciones.
     """
-    if not os.path.exists(MODEL_CACHE_PATH):
-        return None, "NO_PKL"
     try:
-        with open(MODEL_CACHE_PATH, "rb") as f:
-            cache = pickle.load(f)
-        return cache, "OK"
+        if os.path.exists(os.path.join(MODEL_BUNDLE_DIR, "manifest.json")):
+            return _load_bundle(), "OK"
+        if not os.path.exists(MODEL_CACHE_PATH):
+            return None, "NO_PKL"
+        return _load_pkl(MODEL_CACHE_PATH, os.stat(MODEL_CACHE_PATH).st_mtime_ns), "OK"
     except Exception as e:
         return None, f"ERROR: {e}"
 
 
 
 
+ACTIVOS_VENTANA = 12   # meses sin jugar tras los cuales un jugador sale de la matriz de cruces
+
+
+def features_enfrentamientos(latest_stats, feature_cols, jugadores1, jugadores2):
+    """
+    Features de todos los cruces jugadores1 × jugadores2 (una fila por par, player1
+    = jugadores1 en el orden de filas), con las mismas reglas que el entrenamiento:
+    columnas _g de la cosecha de player1, _p de la de player2, el resto y los
+    jugadores sin cosecha en 0. Los bloques de cada lado se arman una vez y se
+    combinan por broadcasting, sin recorrer latest_stats por par.
+    """
+    stats = latest_stats.drop_duplicates("Jugador").set_index("Jugador")
+    es_g  = np.array([c.endswith("_g") for c in feature_cols])
+    es_p  = np.array([c.endswith("_p") for c in feature_cols])
+
+    def _bloque(jugadores, mascara):
+        bases = [c[:-2] for c, m in zip(feature_cols, mascara) if m]
+        return (stats.reindex(index=list(jugadores), columns=bases)
+                     .apply(pd.to_numeric, errors="coerce").fillna(0).to_numpy(np.float64))
+
+    n1, n2 = len(jugadores1), len(jugadores2)
+    X = np.zeros((n1, n2, len(feature_cols)))
+    X[:, :, es_g] = _bloque(jugadores1, es_g)[:, None, :]
+    X[:, :, es_p] = _bloque(jugadores2, es_p)[None, :, :]
+    return pd.DataFrame(X.reshape(n1 * n2, len(feature_cols)), columns=list(feature_cols))
+
+
 def make_pred_row(j1, j2, latest_stats, feature_cols):
     """Construye vector de features para predicción manual usando cosechas."""
-    def gs(jug):
-        r = latest_stats[latest_stats["Jugador"] == jug]
-        if r.empty:
-            return {}
-        return r.iloc[0].to_dict()
-    s1, s2 = gs(j1), gs(j2)
-    feat = {}
-    for c in feature_cols:
-        if c.endswith("_g"):
-            base = c[:-2]
-            feat[c] = s1.get(base, 0)
-        elif c.endswith("_p"):
-            base = c[:-2]
-            feat[c] = s2.get(base, 0)
-        else:
-            feat[c] = 0
-    row = pd.DataFrame([feat])
-    for c in feature_cols:
-        if c not in row.columns: row[c] = 0
-    return row[feature_cols].fillna(0)
+    return features_enfrentamientos(latest_stats, feature_cols, [j1], [j2])
+
+
+def _jugadores_activos(latest_stats):
+    """Jugadores con alguna batalla en los últimos ACTIVOS_VENTANA meses (todos si la
+    cosecha no trae esa ventana)."""
+    col = f"n_batallas_m{ACTIVOS_VENTANA}"
+    if col not in latest_stats.columns:
+        return sorted(latest_stats["Jugador"].unique().tolist())
+    return sorted(latest_stats.loc[latest_stats[col].fillna(0) > 0, "Jugador"].unique().tolist())
+
+
+def matriz_enfrentamientos(modelo, latest_stats, feature_cols, jugadores):
+    """
+    Matriz N×N con la probabilidad de que el jugador de la fila le gane al de la
+    columna según `modelo`, en un solo predict_proba sobre todos los cruces
+    ordenados. La diagonal queda en NaN.
+    """
+    n = len(jugadores)
+    if n == 0:
+        return pd.DataFrame(dtype=np.float64)
+    X = features_enfrentamientos(latest_stats, feature_cols, jugadores, jugadores)
+    prob = modelo.predict_proba(X)[:, 0].reshape(n, n)   # clase 0 = gana player1 (fila)
+    np.fill_diagonal(prob, np.nan)
+    return pd.DataFrame(prob, index=list(jugadores), columns=list(jugadores))
+
+
+def _clave_modelo(cache, modelo):
+    """Identifica el modelo y la cosecha con que se arma su matriz: los sha1 del
+    bundle, o la fecha de entrenamiento para el pkl del formato anterior."""
+    m = cache.get("modelos", {}).get(modelo)
+    if m and "latest_stats" in cache.get("tablas", {}):
+        return f"{modelo}|{m['sha1']}|{cache['tablas']['latest_stats']['sha1']}"
+    return f"{modelo}|{cache.get('trained_at')}|{cache.get('data_hash')}"
+
+
+@st.cache_resource(show_spinner="Calculando enfrentamientos...", max_entries=8)
+def _matriz_cacheada(clave, _modelo, _latest_stats, feature_cols):
+    """matriz_enfrentamientos de los jugadores activos, compartida entre sesiones
+    mientras no cambie `clave` (no modificar)."""
+    return matriz_enfrentamientos(_modelo, _latest_stats, list(feature_cols),
+                                  _jugadores_activos(_latest_stats))
+
+
+def prob_enfrentamiento(cache, modelo, latest_stats, feature_cols, j1, j2):
+    """P(j1 le gana a j2): de la matriz cacheada si ambos están activos; si no, con
+    una predicción puntual."""
+    M = _matriz_cacheada(_clave_modelo(cache, modelo), cache["trained"][modelo],
+                         latest_stats, tuple(feature_cols))
+    if j1 in M.index and j2 in M.columns and j1 != j2:
+        return float(M.at[j1, j2])
+    X_p = make_pred_row(j1, j2, latest_stats, feature_cols)
+    return float(cache["trained"][modelo].predict_proba(X_p)[0][0])
+
+
+# Orden de prioridad de las palabras clave al clasificar la fase de una batalla
+_FASES_KW = [("jornada","JORNADAS"), ("grupos","GRUPOS"), ("suiza","RONDAS"),
+             ("playoff","Eliminatorias"), ("final","Eliminatorias"),
+             ("semi","Eliminatorias"), ("cuarto","Eliminatorias")]
 
 
 @st.cache_data(show_spinner=False)
-def _build_df_j(_df_raw):
-    """Reconstruye df_j (una fila por jugador por batalla) desde df_raw."""
-    df = normalize_columns(_df_raw.copy())
-    df = ensure_fields(df)
-    df["date"] = pd.to_datetime(df["date"], errors="coerce")
-    df = df[(df["Walkover"] >= 0) & df["winner"].notna()].copy()
-    rows = []
-    for _, row in df.iterrows():
-        ganador  = row["winner"]
-        perdedor = row["player2"] if row["winner"] == row["player1"] else row["player1"]
-        lg   = str(row.get("league", ""))
-        lc   = str(row.get("Ligas_categoria", ""))
-        lcat = lc if (lg == "LIGA" and lc not in ["nan", "No Posee Liga", ""]) else lg
-        tier = str(row.get("Tier", lcat))   # columna Tier del CSV
-        fmt  = str(row.get("Formato", "SINGLES"))
-        fase_raw = str(row.get("Fase_completo", row.get("round", "")))
-        fase = "Eliminatorias"
-        for k, v in [("jornada","JORNADAS"), ("grupos","GRUPOS"), ("suiza","RONDAS"),
-                     ("playoff","Eliminatorias"), ("final","Eliminatorias"),
-                     ("semi","Eliminatorias"), ("cuarto","Eliminatorias")]:
-            if k in fase_raw.lower():
-                fase = v; break
-        for jugador, es_g in [(ganador, True), (perdedor, False)]:
-            rows.append({
-                "Jugador":  jugador,
-                "Formato":  fmt,
-                "Fase":     fase,
-                "Tier":     tier,
-                "League":   lg,
-                "Llave_cat":lcat,
-                "Victoria": 1 if es_g else 0,
-            })
-    return pd.DataFrame(rows)
+def _build_df_j(version):
+    """Reconstruye df_j (una fila por jugador por batalla) desde la tabla de batallas.
+    Vectorizado: cada batalla aporta la fila del ganador seguida de la del perdedor."""
+    df = load_batallas()
+    df = df[(df["Walkover"] >= 0) & df["winner"].notna()]
+    fase_raw = df["Fase_completo"].astype(str).str.lower()
+    fase = np.select([fase_raw.str.contains(k, regex=False) for k, _ in _FASES_KW],
+                     [v for _, v in _FASES_KW], default="Eliminatorias")
+
+    # intercala ganador/perdedor por batalla (mismo orden que el recorrido fila a fila)
+    def _par(a, b):
+        return np.column_stack([np.asarray(a, dtype=object), np.asarray(b, dtype=object)]).ravel()
+
+    def _doble(col):
+        v = np.asarray(col, dtype=object)
+        return _par(v, v)
+
+    return pd.DataFrame({
+        "Jugador":   _par(df["winner"], df["perdedor"]),
+        "Formato":   _doble(df["Formato"].astype(str)),
+        "Fase":      _doble(fase),
+        "Tier":      _doble(df["Tier"].astype(str)),
+        "League":    _doble(df["league"].astype(str)),
+        "Llave_cat": _doble(df["liga_cat"]),
+        "Victoria":  np.tile([1, 0], len(df)),
+    })
 
 
 def _calc_winrates_detallados(jug, df_j):
@@ -297,12 +449,15 @@ def show():
         cache, status = load_model(df_raw)
 
     if status == "NO_PKL":
-        st.error("❌ No se encontró el archivo **modelo_prediccion.pkl**")
+        st.error("❌ No se encontró el modelo (**modelo_prediccion/** ni **modelo_prediccion.pkl**)")
         st.info("""
 **Para generar el modelo:**
 1. Corré localmente: `python entrenar_modelo.py`
-2. Subí el archivo `modelo_prediccion.pkl` generado al repositorio (misma carpeta que `app.py`)
+2. Subí la carpeta `modelo_prediccion/` y el `modelo_prediccion.pkl` generados al repositorio (misma carpeta que `app.py`)
 3. Hacé redeploy en Streamlit Cloud
+
+La página usa la carpeta; el `.pkl` es el formato anterior y sólo se lee si falta la
+carpeta. El entrenamiento lo sigue regenerando para que ese respaldo no quede viejo.
         """)
         return
     elif status != "OK":
@@ -336,7 +491,7 @@ def show():
     df_fecha = pd.DataFrame()
 
     # df_j: una fila por jugador por batalla (para winrates detallados)
-    df_j = _build_df_j(df_raw)
+    df_j = _build_df_j(version_datos())
 
     valid     = {k:v for k,v in results.items() if "error" not in v}
     res_df    = pd.DataFrame(valid).T.reset_index().rename(columns={"index":"Modelo"})
@@ -403,9 +558,8 @@ def show():
         predecir = st.button("🔮 Predecir Combate", use_container_width=True, type="primary")
 
         if predecir:
-            X_p      = make_pred_row(p1, p2, latest_stats, feature_cols)
-            prob     = trained[mod_p].predict_proba(X_p)[0]
-            prob_j1, prob_j2 = prob[0], prob[1]
+            prob_j1  = prob_enfrentamiento(cache, mod_p, latest_stats, feature_cols, p1, p2)
+            prob_j2  = 1.0 - prob_j1
             conf     = max(prob_j1, prob_j2)
             fav      = p1 if prob_j1 >= prob_j2 else p2
 
@@ -458,18 +612,12 @@ Stats: {p1} winrate {wr1t} vs {p2} winrate {wr2t} | Combate **{fmt_p}** en **{lc
             st.markdown("## 🔍 Análisis SHAP")
             try:
                 import shap
+                X_p   = make_pred_row(p1, p2, latest_stats, feature_cols)
                 expl2 = shap.TreeExplainer(trained[mod_p])
                 sv2   = expl2.shap_values(X_p)
 
-                # manejo de distintas formas según modelo
-                if isinstance(sv2, list):
-                    sv2_row = sv2[1][0]       # Random Forest: lista [clase0, clase1]
-                elif sv2.ndim == 3:
-                    sv2_row = sv2[0, :, 1]    # array 3D: (muestras, features, clases)
-                elif sv2.ndim == 2:
-                    sv2_row = sv2[0]          # array 2D: (muestras, features)
-                else:
-                    sv2_row = sv2             # ya es 1D
+                # orientado a la clase 0 (gana J1): positivo = favorece a J1, como el gráfico
+                sv2_row = shap_hacia_p1(sv2)[0]
 
                 sv2df = (pd.DataFrame({
                             "Feature":   feature_cols,
@@ -534,7 +682,11 @@ Stats: {p1} winrate {wr1t} vs {p2} winrate {wr2t} | Combate **{fmt_p}** en **{lc
                                           if "round" in pred_features.columns else [],
                                           key="pend_round")
 
-            pf = pred_features.copy()
+            # predicciones precalculadas al entrenar; si no están, se calculan en vivo
+            pre = _predicciones_precalculadas(cache, mod_pend)
+            pf = pred_features.reset_index(drop=True)
+            if pre is not None:
+                pf = pd.concat([pf, pre], axis=1)
             if filtro_aka and "Aka_evento" in pf.columns:
                 pf = pf[pf["Aka_evento"].isin(filtro_aka)]
             if filtro_round and "round" in pf.columns:
@@ -543,25 +695,21 @@ Stats: {p1} winrate {wr1t} vs {p2} winrate {wr2t} | Combate **{fmt_p}** en **{lc
             if pf.empty:
                 st.warning("Sin batallas pendientes con esos filtros.")
             else:
-                X_pend = pf[top_feat].fillna(0)
-                probs  = trained[mod_pend].predict_proba(X_pend)
-                pf = pf.copy()
-                pf["prob_p1"] = (probs[:, 0] * 100).round(1)
-                pf["prob_p2"] = (probs[:, 1] * 100).round(1)
-                pf["favorito"] = pf.apply(
-                    lambda r: r["player1"] if r["prob_p1"] >= r["prob_p2"] else r["player2"], axis=1)
-                pf["confianza"] = pf[["prob_p1","prob_p2"]].max(axis=1)
+                if pre is None:
+                    pf = _predecir_pendientes(trained[mod_pend], pf, top_feat)
 
                 st.metric("Batallas pendientes", len(pf))
 
                 # tabla visual
                 cols_show = ["player1","player2","prob_p1","prob_p2",
-                             "favorito","confianza","Formato","Tier","round","Aka_evento","N_Torneo"]
+                             "favorito","confianza","top_p1","top_p2",
+                             "Formato","Tier","round","Aka_evento","N_Torneo"]
                 cols_show = [c for c in cols_show if c in pf.columns]
                 display_df = pf[cols_show].rename(columns={
                     "player1":"J1","player2":"J2",
                     "prob_p1":"% J1","prob_p2":"% J2",
                     "favorito":"Favorito","confianza":"Confianza %",
+                    "top_p1":"A favor de J1 (SHAP)","top_p2":"A favor de J2 (SHAP)",
                     "round":"Fase","Aka_evento":"Torneo",
                 })
 
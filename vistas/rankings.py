@@ -2,7 +2,15 @@ import streamlit as st
 import pandas as pd
 import os, sys
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from utils import load_data, normalize_columns, ensure_fields
+from utils import load_data, normalize_columns, ensure_fields, version_datos
+from generar_rankings_elo import manifest_vigente, leer_manifest, etiqueta_mes
+
+
+@st.cache_data(ttl=3600, show_spinner=False, max_entries=4)
+def _manifest_rankings(ruta, mtime_ns):
+    """{'YYYY-MM': ruta_png} del manifest; la llave incluye su mtime, así una
+    generación nueva (que borra las imágenes viejas) nunca sirve un manifest viejo."""
+    return leer_manifest(ruta)
 
 def show():
     df_raw = load_data()
@@ -42,35 +50,25 @@ def show():
     st.markdown('<div id="ranking-elo"></div>', unsafe_allow_html=True)
     st.header("📈 Ranking Elo")
 
-    meses_elo = [
-        ("Julio26.png",    "Julio 26"),
-         ("Junio26.png",    "Junio 26"),
-         ("Mayo26.png",    "Mayo 2026"),
-        ("Abril26.png",    "Abril 2026"),
-        ("Marzo26.png",    "Marzo 2026"),
-        ("Febrero26.png",    "Febrero 2026"),
-          ("Enero26.png",      "Enero 2026"),
-            ("Diciembre25.png",  "Diciembre 2025"),
-         
-        ("Noviembre25.png",  "Noviembre 2025"),
-         ("Octubre25.png",    "Octubre 2025"),
-            ("Septiembre25.png", "Septiembre 2025"),
-                ("Agosto25.png",     "Agosto 2025"),
-                ("Julio25.png",      "Julio 2025"),
-  ("Junio25.png",      "Junio 2025"),
-       ("Mayo25.png",       "Mayo 2025"),
-       ("Abril25.png",      "Abril 2025"),
-               ("Marzo25.png",      "Marzo 2025"),
-    ]
-    tab_elo = st.tabs([label for _, label in meses_elo])
-    for tab, (img, label) in zip(tab_elo, meses_elo):
-        with tab:
-            st.subheader(f"🥇 {label}")
-            if os.path.exists(img):
-                st.image(img, width=900)
-                st.caption(f"Rank Elo {label}")
-            else:
-                st.info(f"Coloca '{img}' en la carpeta del proyecto")
+    vigente  = manifest_vigente()
+    manifest = _manifest_rankings(vigente[0], vigente[2]) if vigente else {}
+    meses_elo = sorted(manifest, reverse=True)
+    if not meses_elo:
+        st.info("Todavía no se generaron los rankings mensuales: corré `python generar_rankings_elo.py`.")
+    else:
+        if vigente[1] != version_datos()[:16]:
+            st.caption("⚠️ Rankings generados con una versión anterior del CSV; "
+                       "corré `python generar_rankings_elo.py` para actualizarlos.")
+        tab_elo = st.tabs([etiqueta_mes(m) for m in meses_elo])
+        for tab, mes in zip(tab_elo, meses_elo):
+            with tab:
+                label = etiqueta_mes(mes)
+                st.subheader(f"🥇 {label}")
+                if os.path.exists(manifest[mes]):
+                    st.image(manifest[mes], width=900)
+                    st.caption(f"Rank Elo {label}")
+                else:   # se está regenerando: el manifest nuevo llega en la próxima recarga
+                    st.info("Imagen en actualización, recargá la página en unos segundos.")
 
     st.markdown("---")
 
@@ -2,19 +2,29 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import requests
-import os, sys, re
+import os, sys, re, time, random, threading, sqlite3, json, gzip, hashlib
+from contextlib import closing
 import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse
+from scipy import sparse
 import urllib3
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from utils import load_data, normalize_columns, ensure_fields
+from utils import load_data, normalize_columns, ensure_fields, version_datos
 
 # ── Carpetas ─────────────────────────────────────────────────────
 PROJECT_ROOT   = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 POKEMON_IMG_DIR = os.path.join(PROJECT_ROOT, "pokemon_imgs")
 CACHE_DIR       = os.path.join(PROJECT_ROOT, "data")
-CACHE_FILE      = os.path.join(CACHE_DIR, "replay_cache.csv")
+CACHE_DB        = os.path.join(CACHE_DIR, "replay_cache.sqlite")
+CACHE_FILE      = os.path.join(CACHE_DIR, "replay_cache.csv")   # formato antiguo, se importa al abrir la base
+REPLAY_LOGS_DIR = os.path.join(CACHE_DIR, "replay_logs")         # JSON crudos de Showdown (gzip)
+
+# Subirlo cada vez que cambie lo que extrae _parsear_replay: las filas con una
+# versión anterior se pueden rehacer desde el archivo con reparsear_replays.py
+PARSER_VERSION = 1
 
 # ── Formatos Free For All (4 jugadores por replay) ──────────────
 FFA_FORMATOS = {"FREE FOR ALL", "FREE FOR ALL RANDOMS"}
@@ -26,7 +36,8 @@ SIN_TEAMPREVIEW = {
 }
 
 CACHE_COLS = ["url", "status", "player_id", "pokemon", "moves", "abilities",
-              "items", "tera", "win", "formato_esp", "fetched_at"]
+              "items", "tera", "win", "formato_esp", "fetched_at", "parser_version"]
+CAMPOS_DETALLE = ["moves", "abilities", "items", "tera"]   # columnas "a; b; c" del caché
 
 
 def _get_pokemon_img(nombre: str):
@@ -47,46 +58,437 @@ def _get_pokemon_img(nombre: str):
 
 
 # ══════════════════════════════════════════════════════════════════
-# CACHÉ PERSISTENTE (CSV en disco)
+# CACHÉ PERSISTENTE (SQLite en disco)
 # ══════════════════════════════════════════════════════════════════
+# Una fila por (url, player_id, pokemon). Los replays fallidos se guardan como
+# una única fila (url, '', '') con status 'failed'. Se escribe sólo lo nuevo y se
+# lee sólo lo de las urls pedidas: el costo no depende del tamaño del caché.
+# replay_componentes guarda además moves/abilities/items/tera ya separados (una
+# fila por valor), para contar con GROUP BY en vez de partir strings.
 
-def _load_cache() -> pd.DataFrame:
-    """Carga el CSV de caché. Si no existe, devuelve un DataFrame vacío con las columnas correctas."""
+_CACHES_INICIADAS = set()            # rutas de CACHE_DB ya creadas/migradas en este proceso
+_CACHES_INICIADAS_LOCK = threading.Lock()
+
+
+def _conectar_cache() -> sqlite3.Connection:
+    """Abre la base del caché. El esquema y las migraciones corren una sola vez
+    por proceso y por ruta (ver _iniciar_cache)."""
+    if CACHE_DB not in _CACHES_INICIADAS or not os.path.exists(CACHE_DB):
+        _iniciar_cache(CACHE_DB)
+    return sqlite3.connect(CACHE_DB, timeout=30)
+
+
+def _iniciar_cache(ruta: str):
+    """Prepara la base de esa ruta una vez; los hilos que llegan a la vez esperan."""
+    with _CACHES_INICIADAS_LOCK:
+        if ruta in _CACHES_INICIADAS and os.path.exists(ruta):
+            return
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        with closing(sqlite3.connect(ruta, timeout=30)) as con:
+            _crear_esquema(con)
+        _CACHES_INICIADAS.add(ruta)
+
+
+def _crear_esquema(con: sqlite3.Connection):
+    """Crea las tablas que falten, migra bases anteriores e importa una sola vez el
+    replay_cache.csv antiguo si todavía existe."""
+    con.execute("PRAGMA journal_mode=WAL")   # queda guardado en el archivo: vale para todas las conexiones
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS replay_detalle (
+            {", ".join(f"{c} TEXT NOT NULL DEFAULT ''" for c in CACHE_COLS)},
+            PRIMARY KEY (url, player_id, pokemon)
+        ) WITHOUT ROWID""")
+    existentes = {fila[1] for fila in con.execute("PRAGMA table_info(replay_detalle)")}
+    for c in CACHE_COLS:
+        if c not in existentes:   # bases creadas con una versión anterior de CACHE_COLS
+            con.execute(f"ALTER TABLE replay_detalle ADD COLUMN {c} TEXT NOT NULL DEFAULT ''")
+    con.execute("CREATE INDEX IF NOT EXISTS idx_replay_url_status ON replay_detalle (url, status)")
+    con.execute("CREATE INDEX IF NOT EXISTS idx_replay_formato ON replay_detalle (formato_esp, status)")
+    # 'generacion' sube con cada escritura que cambia filas ok: así se sabe si el uso
+    # materializado quedó viejo
+    con.execute("CREATE TABLE IF NOT EXISTS cache_meta (clave TEXT PRIMARY KEY, valor TEXT NOT NULL)")
+    con.execute("INSERT OR IGNORE INTO cache_meta VALUES ('generacion', '0')")
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS replay_componentes (
+            url TEXT NOT NULL, player_id TEXT NOT NULL, pokemon TEXT NOT NULL,
+            campo TEXT NOT NULL, valor TEXT NOT NULL
+        )""")
+    con.execute("CREATE INDEX IF NOT EXISTS idx_comp_clave ON replay_componentes (url, player_id, pokemon)")
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS replay_fallos (
+            url TEXT PRIMARY KEY, intentos INTEGER NOT NULL, ultimo_error TEXT NOT NULL,
+            ultimo_intento REAL NOT NULL, proximo_intento REAL NOT NULL, muerto INTEGER NOT NULL DEFAULT 0
+        )""")
+    con.commit()
+    if con.execute("SELECT 1 FROM cache_meta WHERE clave = 'componentes'").fetchone() is None:
+        # bases anteriores a replay_componentes: se separan una sola vez las filas existentes
+        existentes = pd.read_sql("SELECT * FROM replay_detalle WHERE status = 'ok'", con)
+        with con:
+            con.executemany("INSERT INTO replay_componentes VALUES (?, ?, ?, ?, ?)",
+                            _explotar_componentes(existentes).itertuples(index=False, name=None))
+            con.execute("INSERT INTO cache_meta VALUES ('componentes', '1')")
     if os.path.exists(CACHE_FILE):
         try:
-            df = pd.read_csv(CACHE_FILE, dtype=str, keep_default_na=False)
+            viejo = pd.read_csv(CACHE_FILE, dtype=str, keep_default_na=False)
             for c in CACHE_COLS:
-                if c not in df.columns:
-                    df[c] = ""
-            return df[CACHE_COLS]
+                if c not in viejo.columns:
+                    viejo[c] = ""
+            _insertar_filas(con, viejo[CACHE_COLS])
+            os.replace(CACHE_FILE, CACHE_FILE + ".importado")
         except Exception:
             pass
-    return pd.DataFrame(columns=CACHE_COLS)
 
 
-def _save_cache(df: pd.DataFrame):
-    os.makedirs(CACHE_DIR, exist_ok=True)
-    df.to_csv(CACHE_FILE, index=False)
+def _insertar_filas(con: sqlite3.Connection, df: pd.DataFrame, reemplazar: bool = False):
+    """
+    Inserta filas nuevas respetando la prioridad de siempre: las 'ok' reemplazan a
+    las 'failed' de la misma url (si ya se pudo leer, no la dejamos como fallida),
+    y una 'failed' nunca pisa a una url que ya está 'ok'.
+    Con reemplazar=True (re-parseo) antes se borra todo lo guardado de esas urls.
+    """
+    if df.empty:
+        return
+    df = df.reindex(columns=CACHE_COLS).fillna("").astype(str)
+    ok = df[df["status"] == "ok"].drop_duplicates(subset=["url", "player_id", "pokemon"], keep="last")
+    failed = df[(df["status"] == "failed") & ~df["url"].isin(set(ok["url"]))].copy()
+    failed[["player_id", "pokemon"]] = ""
+    failed = failed.drop_duplicates(subset=["url"], keep="last")
+
+    marcas = ", ".join("?" * len(CACHE_COLS))
+    with con:
+        borradas = 0
+        if reemplazar:
+            urls = [(u,) for u in df["url"].unique()]
+            borradas += con.executemany("DELETE FROM replay_detalle WHERE url = ?", urls).rowcount
+            borradas += con.executemany("DELETE FROM replay_componentes WHERE url = ?", urls).rowcount
+        # sólo cambia lo que ven el uso y los núcleos (filas ok) si hay ok nuevas o se borró algo
+        if len(ok) or borradas > 0:
+            con.execute("UPDATE cache_meta SET valor = CAST(valor AS INTEGER) + 1 WHERE clave = 'generacion'")
+        urls_ok = [(u,) for u in ok["url"].unique()]
+        con.executemany("DELETE FROM replay_detalle WHERE url = ? AND status = 'failed'", urls_ok)
+        con.executemany("DELETE FROM replay_fallos WHERE url = ?", urls_ok)
+        con.executemany(f"INSERT OR REPLACE INTO replay_detalle ({', '.join(CACHE_COLS)}) VALUES ({marcas})",
+                        ok.itertuples(index=False, name=None))
+        con.executemany("DELETE FROM replay_componentes WHERE url = ? AND player_id = ? AND pokemon = ?",
+                        ok[["url", "player_id", "pokemon"]].itertuples(index=False, name=None))
+        con.executemany("INSERT INTO replay_componentes VALUES (?, ?, ?, ?, ?)",
+                        _explotar_componentes(ok).itertuples(index=False, name=None))
+        con.executemany(
+            f"INSERT OR REPLACE INTO replay_detalle ({', '.join(CACHE_COLS)}) SELECT {marcas} "
+            f"WHERE NOT EXISTS (SELECT 1 FROM replay_detalle WHERE url = ? AND status = 'ok')",
+            [fila + (fila[0],) for fila in failed.itertuples(index=False, name=None)])
+
+
+def _explotar_componentes(df: pd.DataFrame) -> pd.DataFrame:
+    """Filas del caché -> una fila (url, player_id, pokemon, campo, valor) por cada
+    movimiento/habilidad/item/tera de las columnas "a; b; c"."""
+    partes = []
+    for campo in CAMPOS_DETALLE:
+        p = df[["url", "player_id", "pokemon"]].assign(
+            campo=campo, valor=df[campo].astype(str).str.split(";")).explode("valor")
+        p["valor"] = p["valor"].str.strip()
+        partes.append(p[p["valor"].notna() & (p["valor"] != "")])
+    return pd.concat(partes, ignore_index=True)
+
+
+def _guardar_en_cache(df: pd.DataFrame, reemplazar: bool = False):
+    """Agrega filas nuevas al caché (ok o failed)."""
+    with closing(_conectar_cache()) as con:
+        _insertar_filas(con, df, reemplazar)
+
+
+def _leer_cache(urls=None, status=None) -> pd.DataFrame:
+    """Filas del caché para esas urls (todas si urls es None), opcionalmente de un status."""
+    with closing(_conectar_cache()) as con:
+        where, params = [], []
+        if status is not None:
+            where.append("d.status = ?")
+            params.append(status)
+        desde = "replay_detalle d"
+        if urls is not None:
+            _cargar_urls_pedidas(con, urls)
+            # CROSS JOIN fija el orden: se recorren las urls pedidas y se busca cada una en el índice
+            desde = "urls_pedidas u CROSS JOIN replay_detalle d ON d.url = u.url"
+        sql = f"SELECT {', '.join('d.' + c for c in CACHE_COLS)} FROM {desde}"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        filas = con.execute(sql, params).fetchall()
+    return pd.DataFrame(filas, columns=CACHE_COLS)
+
+
+def _cargar_urls_pedidas(con: sqlite3.Connection, urls):
+    """Deja las urls en la tabla temporal urls_pedidas (para cruzarlas por índice)."""
+    con.execute("CREATE TEMP TABLE IF NOT EXISTS urls_pedidas (url TEXT PRIMARY KEY)")
+    con.execute("DELETE FROM urls_pedidas")
+    con.executemany("INSERT OR IGNORE INTO urls_pedidas VALUES (?)", [(u,) for u in urls])
+
+
+def _leer_componentes(urls) -> pd.DataFrame:
+    """replay_componentes de esas urls, con pokemon/campo/valor como categorías."""
+    with closing(_conectar_cache()) as con:
+        _cargar_urls_pedidas(con, urls)
+        comp = pd.read_sql(
+            "SELECT c.url, c.player_id, c.pokemon, c.campo, c.valor "
+            "FROM urls_pedidas u CROSS JOIN replay_componentes c ON c.url = u.url", con)
+    return comp.astype({"pokemon": "category", "campo": "category", "valor": "category"})
+
+
+def _urls_en_cache(urls, status="ok") -> set:
+    """Cuáles de esas urls ya tienen filas con ese status (sin traer las filas)."""
+    with closing(_conectar_cache()) as con:
+        _cargar_urls_pedidas(con, urls)
+        filas = con.execute(
+            "SELECT u.url FROM urls_pedidas u WHERE EXISTS "
+            "(SELECT 1 FROM replay_detalle d WHERE d.url = u.url AND d.status = ?)", (status,)).fetchall()
+    return {f[0] for f in filas}
 
 
-def _fusionar_cache(a: pd.DataFrame, b: pd.DataFrame) -> pd.DataFrame:
+def _load_cache() -> pd.DataFrame:
+    """Caché completo (sólo para el respaldo descargable)."""
+    return _leer_cache()
+
+
+def _registrar_fallos(errores: dict, ahora: float = None):
+    """Suma un intento fallido a cada url ({url: motivo}) y programa su próximo intento."""
+    if not errores:
+        return
+    ahora = time.time() if ahora is None else ahora
+    with closing(_conectar_cache()) as con:
+        _cargar_urls_pedidas(con, errores)
+        previos = dict(con.execute(
+            "SELECT f.url, f.intentos FROM urls_pedidas u JOIN replay_fallos f ON f.url = u.url").fetchall())
+        filas = []
+        for url, motivo in errores.items():
+            intentos = previos.get(url, 0) + 1
+            muerto = (motivo == "sin_pokemon"
+                      or (motivo == "no_existe" and intentos >= FALLO_INTENTOS_NO_EXISTE)
+                      or intentos >= FALLO_INTENTOS_MAX)
+            espera = min(FALLO_ESPERA_BASE * 2 ** (intentos - 1), FALLO_ESPERA_MAX)
+            filas.append((url, intentos, motivo, ahora, ahora + espera, int(muerto)))
+        with con:
+            con.executemany("INSERT OR REPLACE INTO replay_fallos VALUES (?, ?, ?, ?, ?, ?)", filas)
+
+
+def _urls_en_espera(urls, ahora: float = None) -> set:
+    """Urls que NO hay que pedir todavía: muertas o con su próximo intento en el futuro."""
+    ahora = time.time() if ahora is None else ahora
+    with closing(_conectar_cache()) as con:
+        _cargar_urls_pedidas(con, urls)
+        filas = con.execute(
+            "SELECT f.url FROM urls_pedidas u JOIN replay_fallos f ON f.url = u.url "
+            "WHERE f.muerto = 1 OR f.proximo_intento > ?", (ahora,)).fetchall()
+    return {f[0] for f in filas}
+
+
+def _resumen_fallos():
+    """(en espera, muertos) sin contar los que ya se pueden reintentar."""
+    with closing(_conectar_cache()) as con:
+        return con.execute(
+            "SELECT COALESCE(SUM(muerto = 0 AND proximo_intento > ?), 0), COALESCE(SUM(muerto), 0) "
+            "FROM replay_fallos", (time.time(),)).fetchone()
+
+
+def _reiniciar_fallos():
+    """Olvida el historial de fallos: todos los no leídos se vuelven a pedir."""
+    with closing(_conectar_cache()) as con, con:
+        con.execute("DELETE FROM replay_fallos")
+
+
+def _ultima_ingesta():
+    """{'fecha', 'nuevos', 'fallidos', 'pendientes'} de la última corrida de
+    ingestar_replays.py, o None si nunca corrió."""
+    with closing(_conectar_cache()) as con:
+        fila = con.execute("SELECT valor FROM cache_meta WHERE clave = 'ultima_ingesta'").fetchone()
+    return json.loads(fila[0]) if fila else None
+
+
+def _registrar_ingesta(resumen: dict):
+    with closing(_conectar_cache()) as con, con:
+        con.execute("INSERT OR REPLACE INTO cache_meta VALUES ('ultima_ingesta', ?)", (json.dumps(resumen),))
+
+
+def _generacion_cache() -> int:
+    """Contador de escrituras del caché (cambia cada vez que entra algo nuevo)."""
+    with closing(_conectar_cache()) as con:
+        return int(con.execute("SELECT valor FROM cache_meta WHERE clave = 'generacion'").fetchone()[0])
+
+
+def _resumen_cache():
+    """(urls leídas correctamente, urls fallidas) sin cargar el caché."""
+    with closing(_conectar_cache()) as con:
+        conteo = dict(con.execute(
+            "SELECT status, COUNT(DISTINCT url) FROM replay_detalle GROUP BY status").fetchall())
+    return conteo.get("ok", 0), conteo.get("failed", 0)
+
+
+# ══════════════════════════════════════════════════════════════════
+# ARCHIVO DE LOGS CRUDOS (para re-parsear sin volver a descargar)
+# ══════════════════════════════════════════════════════════════════
+
+def _ruta_log(url: str) -> str:
+    """data/replay_logs/ab/abcdef….json.gz, según el sha1 de la url."""
+    h = hashlib.sha1(url.strip().encode("utf-8")).hexdigest()
+    return os.path.join(REPLAY_LOGS_DIR, h[:2], f"{h}.json.gz")
+
+
+def _archivar_log(url: str, data: dict, formato_esp: str = ""):
+    """Guarda el JSON descargado tal cual (con la url y el Formato_esp con que se pidió)."""
+    ruta = _ruta_log(url)
+    if os.path.exists(ruta):
+        return
+    try:
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        tmp = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp, "wt", encoding="utf-8") as f:
+            json.dump({"url": url.strip(), "formato_esp": formato_esp, "replay": data}, f)
+        os.replace(tmp, ruta)
+    except OSError:
+        pass   # sin archivo sólo se pierde la opción de re-parsear offline
+
+
+def _leer_log_archivado(ruta: str):
+    """{'url', 'formato_esp', 'replay'} de un log archivado, o None si no existe/está dañado."""
+    try:
+        with gzip.open(ruta, "rt", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+# ══════════════════════════════════════════════════════════════════
+# DESCARGA (sesión keep-alive, límite por host y reintentos con backoff)
+# ══════════════════════════════════════════════════════════════════
+
+REPLAY_WORKERS        = 8      # descargas simultáneas
+REPLAY_RATE_POR_HOST  = 8.0    # peticiones por segundo a un mismo host (0 = sin límite)
+REPLAY_REINTENTOS     = 4      # reintentos ante 429 / 5xx / errores de red
+REPLAY_BACKOFF_BASE   = 0.5    # segundos; se duplica en cada reintento
+REPLAY_BACKOFF_MAX    = 20.0
+REPLAY_TIMEOUT        = 10
+# Servidor alternativo para pedir los .json (p. ej. uno local con replays de prueba):
+# se conserva la ruta de la url original y se cambia sólo el esquema + host.
+REPLAY_SERVIDOR       = os.environ.get("REPLAY_SERVIDOR", "")
+_HTTP_REINTENTABLES   = {429, 500, 502, 503, 504}
+
+# ── Replays que fallan: cuándo se vuelven a pedir ────────────────
+# Tras cada fallo se espera FALLO_ESPERA_BASE · 2^(intentos-1) (tope FALLO_ESPERA_MAX)
+# antes de volver a pedirlo. Se da por muerto (no se vuelve a pedir) si Showdown
+# responde 404/410 FALLO_INTENTOS_NO_EXISTE veces, si el log se leyó pero no tiene
+# Pokémon, o tras FALLO_INTENTOS_MAX fallos de cualquier tipo.
+FALLO_ESPERA_BASE        = 3600.0            # segundos
+FALLO_ESPERA_MAX         = 7 * 24 * 3600.0
+FALLO_INTENTOS_NO_EXISTE = 2
+FALLO_INTENTOS_MAX       = 8
+
+
+class LimitadorPorHost:
+    """Espacia las peticiones a un mismo host (intervalo mínimo entre inicios).
+    Thread-safe: los hilos reservan su turno bajo el lock y duermen fuera de él."""
+
+    def __init__(self, por_segundo=REPLAY_RATE_POR_HOST):
+        self.intervalo = 1.0 / por_segundo if por_segundo else 0.0
+        self._proximo = {}
+        self._lock = threading.Lock()
+
+    def esperar(self, host):
+        if not self.intervalo:
+            return
+        with self._lock:
+            ahora = time.monotonic()
+            turno = max(ahora, self._proximo.get(host, ahora))
+            self._proximo[host] = turno + self.intervalo
+        if turno > ahora:
+            time.sleep(turno - ahora)
+
+
+def _crear_sesion(workers=REPLAY_WORKERS):
+    """Sesión HTTP compartida por todos los hilos: reutiliza conexiones (keep-alive)."""
+    session = requests.Session()
+    session.verify = False
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=max(workers, 1))
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def _espera_reintento(resp, intento):
+    """Retry-After del servidor si lo manda; si no, backoff exponencial con jitter."""
+    try:
+        if resp is not None and resp.headers.get("Retry-After"):
+            return min(float(resp.headers["Retry-After"]), REPLAY_BACKOFF_MAX)
+    except ValueError:
+        pass
+    return min(REPLAY_BACKOFF_BASE * (2 ** intento) * (0.5 + random.random()), REPLAY_BACKOFF_MAX)
+
+
+def _descargar_json_replay(url, session=None, limitador=None, reintentos=REPLAY_REINTENTOS):
     """
-    Combina dos DataFrames de caché sin duplicar. Las filas 'ok' tienen prioridad
-    sobre las 'failed' para la misma url (si ya se pudo leer, no la dejamos como fallida).
+    GET de <url>.json. Devuelve (data, None) o (None, motivo del fallo).
+    Reintenta 429/5xx y errores de red; 404 y demás códigos de error fallan de
+    inmediato (el replay no existe, no tiene sentido insistir).
+    Motivos: 'no_existe', 'http_<código>', 'limite', 'servidor', 'red', 'json'.
     """
-    combinado = pd.concat([a, b], ignore_index=True)
-    if combinado.empty:
-        return combinado
+    session = session or _crear_sesion(1)
+    destino = url.strip() + ".json"
+    if REPLAY_SERVIDOR:
+        destino = REPLAY_SERVIDOR.rstrip("/") + urlparse(destino).path
+    host = urlparse(destino).netloc
+    motivo = "red"
+    for intento in range(reintentos + 1):
+        if limitador is not None:
+            limitador.esperar(host)
+        resp = None
+        try:
+            resp = session.get(destino, timeout=REPLAY_TIMEOUT)
+            if resp.status_code in (404, 410):
+                return None, "no_existe"
+            if resp.status_code not in _HTTP_REINTENTABLES:
+                resp.raise_for_status()
+                return resp.json(), None
+            motivo = "limite" if resp.status_code == 429 else "servidor"
+        except (requests.ConnectionError, requests.Timeout):
+            motivo = "red"
+        except requests.HTTPError:
+            return None, f"http_{resp.status_code}"
+        except ValueError:
+            return None, "json"
+        except Exception:
+            return None, "red"
+        if intento < reintentos:
+            time.sleep(_espera_reintento(resp, intento))
+    return None, motivo
 
-    ok = combinado[combinado["status"] == "ok"].drop_duplicates(
-        subset=["url", "player_id", "pokemon"], keep="last"
-    )
-    urls_ok = set(ok["url"])
-    failed = combinado[
-        (combinado["status"] == "failed") & (~combinado["url"].isin(urls_ok))
-    ].drop_duplicates(subset=["url"], keep="last")
 
-    return pd.concat([ok, failed], ignore_index=True)
+def descargar_replays(tareas, workers=REPLAY_WORKERS, rate_por_host=REPLAY_RATE_POR_HOST,
+                      progreso=None, errores=None):
+    """
+    Descarga y parsea en paralelo una lista de (url, formato_esp).
+    Devuelve {url: filas | None}. `progreso(hechos, total)` se llama desde el hilo
+    que invoca (no desde los workers), así puede actualizar la UI de Streamlit.
+    Si se pasa un dict en `errores`, se llena con {url: motivo} de los que fallaron.
+    """
+    resultados = {}
+    if not tareas:
+        return resultados
+    session   = _crear_sesion(workers)
+    limitador = LimitadorPorHost(rate_por_host)
+    try:
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+            futuros = {pool.submit(_obtener_replay, url, fmt, session, limitador): url
+                       for url, fmt in tareas}
+            for hechos, fut in enumerate(as_completed(futuros), start=1):
+                url = futuros[fut]
+                try:
+                    resultados[url], motivo = fut.result()
+                except Exception:
+                    resultados[url], motivo = None, "parser"
+                if motivo and errores is not None:
+                    errores[url] = motivo
+                if progreso is not None:
+                    progreso(hechos, len(futuros))
+    finally:
+        session.close()
+    return resultados
 
 
 # ══════════════════════════════════════════════════════════════════
@@ -144,114 +546,127 @@ def _parsear_teamsheet_texto(html_bloque: str):
     return sets
 
 
-def _extraer_detalle_replay(url: str, formato_esp: str = ""):
+def _extraer_detalle_replay(url: str, formato_esp: str = "", session=None, limitador=None):
     """
     Descarga y parsea un replay del log público de Showdown.
     Devuelve una lista de dicts (uno por Pokémon revelado, con sus movimientos,
     habilidad, item, teratipo y si su jugador ganó), o None si no se pudo
     descargar/leer (replay borrado, error de red, etc.).
     """
-    try:
-        resp = requests.get(url.strip() + ".json", verify=False, timeout=10)
-        resp.raise_for_status()
-        data = resp.json()
-    except Exception:
-        return None
+    return _obtener_replay(url, formato_esp, session, limitador)[0]
+
 
+def _obtener_replay(url: str, formato_esp: str = "", session=None, limitador=None):
+    """Como _extraer_detalle_replay, pero devuelve (filas, None) o (None, motivo del fallo)."""
+    archivado = _leer_log_archivado(_ruta_log(url))
+    if archivado is not None:
+        data = archivado["replay"]
+    else:
+        data, motivo = _descargar_json_replay(url, session, limitador)
+        if data is None:
+            return None, motivo
+        _archivar_log(url, data, formato_esp)
+    filas = _parsear_replay(url, data, formato_esp)
+    return (filas, None) if filas is not None else (None, "sin_pokemon")
+
+
+_TIPOS_LOG = frozenset({"move", "-ability", "-item", "-enditem", "-terastallize",
+                        "switch", "drag", "poke", "player", "win"})
+
+
+def _parsear_replay(url: str, data: dict, formato_esp: str = ""):
+    """
+    Parsea el JSON de un replay ya descargado (ver _extraer_detalle_replay).
+
+    Recorre el log una sola vez: cada línea se corta por '|' una vez y se despacha
+    según su tipo. Lo que depende de haber visto el log completo (los nombres de
+    los jugadores) se resuelve al final: el dueño de cada Open Team Sheet y el
+    ganador de la línea |win|.
+    """
     log_text = data.get("log", "")
     if not log_text:
         return None
-    log_lines = log_text.split("\n")
 
     sin_tp = formato_esp.upper() in SIN_TEAMPREVIEW
 
-    # ── Nombres de jugadores (para relacionar con la línea |win|) ──
-    player_names = {}
-    for line in log_lines:
-        if line.startswith("|player|"):
-            parts = line.split("|")
-            if len(parts) >= 4 and parts[3]:
-                player_names[parts[2]] = parts[3]
-
-    # ── Equipo revelado por jugador ──────────────────────────────
-    equipos = {}
-    if not sin_tp:
-        for line in log_lines:
-            if line.startswith("|poke|"):
-                parts = line.split("|")
-                if len(parts) >= 4:
-                    pid = parts[2]
-                    especie = parts[3].split(",")[0].strip()
-                    equipos.setdefault(pid, [])
-                    if especie and especie not in equipos[pid]:
-                        equipos[pid].append(especie)
-
-    # ── Trackeo de posición activa -> especie, y detalle por pokemon ─
-    activo = {}       # "p1a" -> especie actualmente en esa posición
-    registros = {}    # (pid, especie) -> {moves, abilities, items, tera}
+    player_names = {}  # "p1" -> nombre (para relacionar con |win| y las team sheets)
+    equipos = {}       # "p1" -> especies reveladas, en orden de aparición
+    activo = {}        # "p1a" -> especie actualmente en esa posición
+    registros = {}     # (pid, especie) -> {moves, abilities, items, tera}
+    teamsheets = []    # líneas con Open Team Sheet, se procesan al final
+    nombre_ganador = None
 
     def _get_reg(pos: str):
-        pid = pos[:2]
         especie = activo.get(pos)
         if not especie:
             return None
-        key = (pid, especie)
-        if key not in registros:
-            registros[key] = {"moves": set(), "abilities": set(), "items": set(), "tera": None}
-        return registros[key]
-
-    for line in log_lines:
-        if line.startswith("|switch|") or line.startswith("|drag|"):
-            parts = line.split("|")
+        key = (pos[:2], especie)
+        reg = registros.get(key)
+        if reg is None:
+            reg = registros[key] = {"moves": set(), "abilities": set(), "items": set(), "tera": None}
+        return reg
+
+    for line in log_text.split("\n"):
+        fin = line.find("|", 1) if line[:1] == "|" else -1
+        tipo = line[1:fin] if fin > 0 else ""
+
+        # |raw| / |c| con una Open Team Sheet (si se usó !showteam o el formato lo exige)
+        if tipo == "raw" or tipo == "c" or "|/raw" in line:
+            low = line.lower()
+            if "infobox" in low and "ability:" in low:
+                teamsheets.append(line)
+
+        # la gran mayoría de las líneas (daño, turnos, chat…) no interesa: ni se cortan
+        if tipo not in _TIPOS_LOG:
+            continue
+        parts = line.split("|", 4)   # sólo se usan los campos 1 a 3
+
+        if tipo == "move" or tipo == "-ability" or tipo == "-item" or tipo == "-enditem" \
+                or tipo == "-terastallize":
+            if len(parts) >= 4:
+                reg = _get_reg(parts[2].split(":")[0].strip())
+                if reg:
+                    valor = parts[3].strip()
+                    if tipo == "move":
+                        reg["moves"].add(valor)
+                    elif tipo == "-ability":
+                        reg["abilities"].add(valor)
+                    elif tipo == "-terastallize":
+                        reg["tera"] = valor
+                    else:
+                        reg["items"].add(valor)
+
+        elif tipo == "switch" or tipo == "drag":
             if len(parts) >= 4:
                 pos = parts[2].split(":")[0].strip()
                 especie = parts[3].split(",")[0].strip()
                 activo[pos] = especie
                 if sin_tp:
-                    pid = pos[:2]
-                    equipos.setdefault(pid, [])
-                    if especie not in equipos[pid]:
-                        equipos[pid].append(especie)
+                    lista = equipos.setdefault(pos[:2], [])
+                    if especie not in lista:
+                        lista.append(especie)
                 _get_reg(pos)
 
-        elif line.startswith("|move|"):
-            parts = line.split("|")
-            if len(parts) >= 4:
-                reg = _get_reg(parts[2].split(":")[0].strip())
-                if reg:
-                    reg["moves"].add(parts[3].strip())
-
-        elif line.startswith("|-ability|"):
-            parts = line.split("|")
-            if len(parts) >= 4:
-                reg = _get_reg(parts[2].split(":")[0].strip())
-                if reg:
-                    reg["abilities"].add(parts[3].strip())
+        elif tipo == "poke":
+            if not sin_tp and len(parts) >= 4:
+                especie = parts[3].split(",")[0].strip()
+                lista = equipos.setdefault(parts[2], [])
+                if especie and especie not in lista:
+                    lista.append(especie)
 
-        elif line.startswith("|-item|") or line.startswith("|-enditem|"):
-            parts = line.split("|")
-            if len(parts) >= 4:
-                reg = _get_reg(parts[2].split(":")[0].strip())
-                if reg:
-                    reg["items"].add(parts[3].strip())
+        elif tipo == "player":
+            if len(parts) >= 4 and parts[3]:
+                player_names[parts[2]] = parts[3]
 
-        elif line.startswith("|-terastallize|"):
-            parts = line.split("|")
-            if len(parts) >= 4:
-                reg = _get_reg(parts[2].split(":")[0].strip())
-                if reg:
-                    reg["tera"] = parts[3].strip()
+        elif tipo == "win":
+            if nombre_ganador is None:
+                nombre_ganador = parts[2].strip()
 
-    # ── Open Team Sheets (si se usó !showteam o el formato lo exige) ──
+    # ── Open Team Sheets ──────────────────────────────────────────
     # Esto da datos MUCHO más completos: el moveset completo (no solo lo
     # usado en batalla), habilidad real, item real y teratipo real.
-    for line in log_lines:
+    for line in teamsheets:
         low = line.lower()
-        if "infobox" not in low or "ability:" not in low:
-            continue
-        if not (line.startswith("|raw|") or line.startswith("|c|") or "|/raw" in line):
-            continue
-
         dueño = None
         for pid, uname in player_names.items():
             if uname and uname.lower() in low:
@@ -282,13 +697,10 @@ def _extraer_detalle_replay(url: str, formato_esp: str = ""):
 
     # ── Ganador ────────────────────────────────────────────────
     ganador_pid = None
-    for line in log_lines:
-        if line.startswith("|win|"):
-            nombre = line.split("|")[2].strip()
-            for pid, uname in player_names.items():
-                if uname == nombre:
-                    ganador_pid = pid
-            break
+    if nombre_ganador is not None:
+        for pid, uname in player_names.items():
+            if uname == nombre_ganador:
+                ganador_pid = pid
 
     # ── Armar filas de salida ────────────────────────────────────
     ahora = datetime.datetime.utcnow().isoformat(timespec="seconds")
@@ -308,6 +720,7 @@ def _extraer_detalle_replay(url: str, formato_esp: str = ""):
                 "win": "" if ganador_pid is None else str(pid == ganador_pid),
                 "formato_esp": formato_esp,
                 "fetched_at": ahora,
+                "parser_version": str(PARSER_VERSION),
             })
 
     if not filas:
@@ -321,12 +734,13 @@ def _extraer_detalle_replay(url: str, formato_esp: str = ""):
 # CARGA MASIVA (usa/actualiza el caché persistente)
 # ══════════════════════════════════════════════════════════════════
 
-def _cargar_todos_replays_detalle(df_filtrado: pd.DataFrame):
+def _replays_a_analizar(df_filtrado: pd.DataFrame):
     """
-    Devuelve (df_detalle, total_equipos, n_nuevos, n_fallidos, info_debug).
+    Devuelve (replays, info_debug): una fila por replay y grupo (GRUPO_COLS) a
+    contar, con su url, Formato, Formato_esp, Tier, mes y cuántos equipos aporta
+    (4 en FFA, 2 si no). Una url repetida en el CSV cuenta una vez en cada grupo
+    donde aparece, tanto acá como en el uso materializado.
 
-    - Sólo pide al servidor de Showdown los replays NUEVOS (no están en caché)
-      o los que antes fallaron (status == 'failed').
     - Para formatos VGC / CHAMPIONS usa sólo Rep == 1 (evita contar 2 o 3 veces
       el mismo equipo en un Bo3). Si la columna Rep no existe, o viene vacía
       para una fila, esa fila NO se descarta (para no perder datos por un
@@ -341,7 +755,7 @@ def _cargar_todos_replays_detalle(df_filtrado: pd.DataFrame):
             break
     info_debug["columna_rep_detectada"] = col_rep_real
 
-    cols_necesarias = ["Match_replays", "Formato_esp", "Formato"]
+    cols_necesarias = ["Match_replays", "Formato_esp", "Formato", "Tier"]
     cols = [c for c in cols_necesarias if c in df_filtrado.columns]
     replays = df_filtrado[cols].copy()
     for faltante in cols_necesarias:
@@ -349,9 +763,13 @@ def _cargar_todos_replays_detalle(df_filtrado: pd.DataFrame):
             replays[faltante] = ""
 
     replays["Rep"] = df_filtrado[col_rep_real].values if col_rep_real is not None else np.nan
+    replays["mes"] = pd.to_datetime(df_filtrado["date"], errors="coerce").dt.strftime("%Y-%m") \
+        if "date" in df_filtrado.columns else ""
 
     replays = replays.dropna(subset=["Match_replays"])
-    replays = replays[replays["Match_replays"].str.strip().str.startswith("https://")]
+    # la url limpia se usa para todo: caché, fallos, grupos y duplicados
+    replays["Match_replays"] = replays["Match_replays"].astype(str).str.strip()
+    replays = replays[replays["Match_replays"].str.startswith("https://")]
     info_debug["total_antes_filtro_rep"] = len(replays)
 
     # ── Filtro Rep para VGC / CHAMPIONS ──────────────────────────
@@ -370,84 +788,234 @@ def _cargar_todos_replays_detalle(df_filtrado: pd.DataFrame):
 
     info_debug["total_despues_filtro_rep"] = len(replays)
 
-    if replays.empty:
-        return pd.DataFrame(columns=CACHE_COLS), 0, 0, 0, info_debug
-
-    replays = replays.drop_duplicates(subset=["Match_replays"])
+    for c in GRUPO_COLS:
+        replays[c] = replays[c].fillna("").astype(str)
+    replays = replays.drop_duplicates(subset=["Match_replays"] + GRUPO_COLS)
+    replays["equipos"] = np.where(replays["Formato_esp"].str.strip().str.upper().isin(FFA_FORMATOS), 4, 2)
+    return replays.drop(columns="Rep"), info_debug
 
-    cache_df = _load_cache()
-    ok_urls = set(cache_df.loc[cache_df["status"] == "ok", "url"]) if not cache_df.empty else set()
 
-    a_pedir = replays[~replays["Match_replays"].isin(ok_urls)]
+def _descargar_pendientes(replays: pd.DataFrame, info_debug: dict = None, progreso=None,
+                          limite: int = None, **kw_descarga):
+    """
+    Pide al servidor de Showdown sólo los replays NUEVOS (no están en caché) o los
+    que antes fallaron y ya cumplieron su espera (ver _registrar_fallos), y los
+    guarda. Devuelve (n_nuevos, n_fallidos).
+    `progreso(hechos, total)` reemplaza la barra de Streamlit (lo usa
+    ingestar_replays.py); `limite` acota cuántos se piden en esta pasada.
+    """
+    urls = replays["Match_replays"].unique()
+    ok_urls = _urls_en_cache(urls, status="ok")
+    en_espera = _urls_en_espera([u for u in urls if u not in ok_urls])
+    a_pedir = replays[~replays["Match_replays"].isin(ok_urls | en_espera)] \
+        .drop_duplicates(subset=["Match_replays"])
+    if info_debug is not None:
+        info_debug["omitidos_por_fallos_previos"] = len(en_espera)
+        info_debug["pendientes_de_descarga"] = len(a_pedir)
+    if limite is not None:
+        a_pedir = a_pedir.head(limite)
 
     n_nuevos, n_fallidos = 0, 0
-    filas_nuevas = []
-
-    if not a_pedir.empty:
-        prog  = st.progress(0, text="Descargando replays nuevos...")
-        total = len(a_pedir)
-        for idx, (_, row) in enumerate(a_pedir.iterrows()):
-            url = row["Match_replays"].strip()
-            fmt = str(row["Formato_esp"]).strip()
-            resultado = _extraer_detalle_replay(url, fmt)
-            if resultado is None:
-                filas_nuevas.append({
-                    "url": url, "status": "failed", "player_id": "", "pokemon": "",
-                    "moves": "", "abilities": "", "items": "", "tera": "", "win": "",
-                    "formato_esp": fmt,
-                    "fetched_at": datetime.datetime.utcnow().isoformat(timespec="seconds"),
-                })
-                n_fallidos += 1
-            else:
-                filas_nuevas.extend(resultado)
-                n_nuevos += 1
-            prog.progress((idx + 1) / total, text=f"Replay {idx + 1}/{total}…")
+    if a_pedir.empty:
+        return n_nuevos, n_fallidos
+
+    filas_nuevas, errores = [], {}
+    prog = None
+    if progreso is None:
+        prog = st.progress(0, text="Descargando replays nuevos...")
+        progreso = lambda hechos, total: prog.progress(hechos / total, text=f"Replay {hechos}/{total}…")
+    tareas = list(zip(a_pedir["Match_replays"],
+                      a_pedir["Formato_esp"].astype(str).str.strip()))
+    descargados = descargar_replays(tareas, progreso=progreso, errores=errores, **kw_descarga)
+    for url, fmt in tareas:
+        resultado = descargados.get(url)
+        if resultado is None:
+            filas_nuevas.append({
+                "url": url, "status": "failed", "player_id": "", "pokemon": "",
+                "moves": "", "abilities": "", "items": "", "tera": "", "win": "",
+                "formato_esp": fmt,
+                "fetched_at": datetime.datetime.utcnow().isoformat(timespec="seconds"),
+            })
+            n_fallidos += 1
+        else:
+            filas_nuevas.extend(resultado)
+            n_nuevos += 1
+    if prog is not None:
         prog.empty()
 
-        cache_df = _fusionar_cache(cache_df, pd.DataFrame(filas_nuevas))
-        _save_cache(cache_df)
+    _guardar_en_cache(pd.DataFrame(filas_nuevas, columns=CACHE_COLS))
+    _registrar_fallos({url: errores.get(url, "red") for url, _ in tareas if descargados.get(url) is None})
+    return n_nuevos, n_fallidos
 
-    urls_filtro = set(replays["Match_replays"])
-    if cache_df.empty:
-        df_detalle = pd.DataFrame(columns=CACHE_COLS)
-    else:
-        df_detalle = cache_df[
-            (cache_df["url"].isin(urls_filtro)) & (cache_df["status"] == "ok")
-        ].copy()
+
+def _cargar_todos_replays_detalle(df_filtrado: pd.DataFrame, descargar: bool = True):
+    """
+    Devuelve (df_detalle, componentes, total_equipos, n_nuevos, n_fallidos, info_debug).
+    Descarga lo que falte (ver _descargar_pendientes; salvo descargar=False) y trae
+    del caché las filas 'ok' de los replays del filtro (ver _replays_a_analizar) y
+    sus componentes, repetidas por cada grupo en que aparece la url.
+    """
+    replays, info_debug = _replays_a_analizar(df_filtrado)
+
+    if replays.empty:
+        return pd.DataFrame(columns=CACHE_COLS), _leer_componentes([]), 0, 0, 0, info_debug
+
+    n_nuevos, n_fallidos = _descargar_pendientes(replays, info_debug) if descargar else (0, 0)
+    veces = replays["Match_replays"].value_counts()
+    df_detalle = _repetir_por_grupo(_leer_cache(list(veces.index), status="ok"), veces)
+    componentes = _repetir_por_grupo(_leer_componentes(veces.index), veces)
 
     # ── Total de equipos (denominador del % de uso) ──────────────
-    total_equipos = 0
-    for _, row in replays.iterrows():
-        fmt_up = str(row["Formato_esp"]).strip().upper()
-        total_equipos += 4 if fmt_up in FFA_FORMATOS else 2
+    total_equipos = int(replays["equipos"].sum())
 
-    info_debug["urls_unicas_a_procesar"] = len(replays)
+    info_debug["urls_unicas_a_procesar"] = len(veces)
     info_debug["filas_en_cache_ok_para_estas_urls"] = len(df_detalle)
 
-    return df_detalle, total_equipos, n_nuevos, n_fallidos, info_debug
+    return df_detalle, componentes, total_equipos, n_nuevos, n_fallidos, info_debug
+
+
+def _repetir_por_grupo(df: pd.DataFrame, veces: pd.Series) -> pd.DataFrame:
+    """Repite las filas de cada url tantas veces como grupos la traen (`veces`)."""
+    if not (veces > 1).any():
+        return df
+    return df.loc[df.index.repeat(df["url"].map(veces).fillna(1).astype(int))].reset_index(drop=True)
+
 
+# ══════════════════════════════════════════════════════════════════
+# USO MATERIALIZADO (por Formato / Formato_esp / Tier / mes)
+# ══════════════════════════════════════════════════════════════════
+# Cada vez que cambia el caché (o el CSV) se precalculan, por grupo y especie,
+# los usos, victorias/derrotas y los conteos de movimientos/habilidad/item/tera.
+# Todo es sumable, así que cualquier combinación de esos filtros se resuelve
+# sumando filas ya calculadas en vez de recorrer los replays.
+
+GRUPO_COLS = ["Formato", "Formato_esp", "Tier", "mes"]
+
+
+def _agregar_uso(detalle: pd.DataFrame, componentes: pd.DataFrame = None):
+    """
+    Agrega por especie filas del caché (una por Pokémon y replay) y sus componentes
+    (ver _leer_componentes; si no se pasan se separan de `detalle`).
+    Devuelve (uso, componentes):
+      uso         -> pokemon, usos, victorias, derrotas
+      componentes -> pokemon, campo, valor, usos
+    """
+    if componentes is None:
+        componentes = _explotar_componentes(detalle)
+    win = detalle["win"]
+    uso = pd.DataFrame({"pokemon": detalle["pokemon"],
+                        "victorias": (win == "True").astype(int),
+                        "derrotas": (win == "False").astype(int)}) \
+        .groupby("pokemon", sort=False).agg(
+            usos=("victorias", "size"), victorias=("victorias", "sum"), derrotas=("derrotas", "sum"),
+        ).reset_index()
+    comp = componentes.groupby(["pokemon", "campo", "valor"], sort=False, observed=True) \
+        .size().rename("usos").reset_index()
+    return uso, comp[comp["usos"] > 0].reset_index(drop=True)
+
+
+def materializar_uso(df: pd.DataFrame, version: str):
+    """Recalcula y guarda las tablas uso_grupos / uso_pokemon / uso_componentes."""
+    generacion = _generacion_cache()
+    # una url repetida en el CSV cuenta una vez en cada grupo donde aparece
+    replays, _ = _replays_a_analizar(df)
+    replays["grupo_id"] = replays.groupby(GRUPO_COLS, sort=False).ngroup()
+    grupos = replays.groupby(["grupo_id"] + GRUPO_COLS, sort=False).agg(
+        replays=("Match_replays", "size"), equipos=("equipos", "sum")).reset_index()
+
+    with closing(_conectar_cache()) as con:
+        con.execute("CREATE TEMP TABLE url_grupo (url TEXT, grupo_id INTEGER, PRIMARY KEY (url, grupo_id))")
+        con.executemany("INSERT INTO url_grupo VALUES (?, ?)",
+                        replays[["Match_replays", "grupo_id"]].itertuples(index=False, name=None))
+        uso = pd.read_sql("""
+            SELECT g.grupo_id, d.pokemon, COUNT(*) AS usos,
+                   SUM(d.win = 'True') AS victorias, SUM(d.win = 'False') AS derrotas
+            FROM url_grupo g CROSS JOIN replay_detalle d ON d.url = g.url
+            WHERE d.status = 'ok'
+            GROUP BY g.grupo_id, d.pokemon""", con)
+        componentes = pd.read_sql("""
+            SELECT g.grupo_id, c.pokemon, c.campo, c.valor, COUNT(*) AS usos
+            FROM url_grupo g CROSS JOIN replay_componentes c ON c.url = g.url
+            GROUP BY g.grupo_id, c.pokemon, c.campo, c.valor""", con)
+        for nombre, tabla in [("uso_grupos", grupos), ("uso_pokemon", uso), ("uso_componentes", componentes)]:
+            tabla.to_sql(nombre, con, if_exists="replace", index=False)
+        con.executemany("INSERT OR REPLACE INTO cache_meta VALUES (?, ?)",
+                        [("uso_generacion", str(generacion)), ("uso_version", version)])
+        con.commit()
+
+
+@st.cache_resource(show_spinner="Actualizando estadísticas de uso...", max_entries=2)
+def uso_materializado(version: str, generacion: int):
+    """
+    (grupos, uso, componentes) ya precalculados para esta versión del CSV y del
+    caché. Si las tablas guardadas quedaron viejas, se rehacen primero.
+    Se comparte entre sesiones: tratar como sólo lectura.
+    """
+    with closing(_conectar_cache()) as con:
+        meta = dict(con.execute("SELECT clave, valor FROM cache_meta").fetchall())
+    if meta.get("uso_generacion") != str(generacion) or meta.get("uso_version") != version:
+        df = ensure_fields(normalize_columns(load_data().copy()))
+        materializar_uso(df, version)
+    with closing(_conectar_cache()) as con:
+        grupos, uso, componentes = (pd.read_sql(f"SELECT * FROM {t}", con)
+                                    for t in ("uso_grupos", "uso_pokemon", "uso_componentes"))
+    uso["pokemon"] = uso["pokemon"].astype("category")
+    componentes = componentes.astype({"pokemon": "category", "campo": "category", "valor": "category"})
+    return grupos, uso, componentes
+
+
+def _uso_seleccion(grupos, uso, componentes, filtros: dict):
+    """
+    Suma los grupos que pasan los filtros ({columna de GRUPO_COLS: valores}).
+    Devuelve (uso, componentes, total_equipos) sin columnas de grupo.
+    """
+    mask = pd.Series(True, index=grupos.index)
+    for col, valores in filtros.items():
+        if valores:
+            mask &= grupos[col].isin([str(v) for v in valores])
+    ids = grupos.loc[mask, "grupo_id"]
+    uso_sel = uso[uso["grupo_id"].isin(ids)].groupby("pokemon", sort=False, observed=True)[
+        ["usos", "victorias", "derrotas"]].sum().reset_index()
+    comp_sel = componentes[componentes["grupo_id"].isin(ids)].groupby(
+        ["pokemon", "campo", "valor"], sort=False, observed=True)["usos"].sum().reset_index()
+    return uso_sel, comp_sel, int(grupos.loc[mask, "equipos"].sum())
+
+
+def desglose_especies(uso: pd.DataFrame, componentes: pd.DataFrame, especies=None) -> pd.DataFrame:
+    """
+    Desglose de movimientos/habilidad/item/teratipo de varias especies a la vez
+    (todas si especies es None), a partir de lo que devuelven _agregar_uso /
+    _uso_seleccion. Tabla larga: pokemon, campo, valor, Usos, % Uso (sobre las
+    apariciones de la especie), ordenada por especie, campo y Usos descendente.
 
-def _desglose_pokemon(df_detalle: pd.DataFrame, especie: str) -> dict:
+        top50 = uso.nlargest(50, "usos")["pokemon"]
+        desglose_especies(uso, componentes, top50)
+    """
+    comp = componentes if especies is None else componentes[componentes["pokemon"].isin(list(especies))]
+    apariciones = uso.groupby("pokemon", observed=True)["usos"].sum()
+    out = comp.rename(columns={"usos": "Usos"}).reset_index(drop=True)
+    total = out["pokemon"].map(apariciones).astype(float)
+    out["% Uso"] = (out["Usos"] / total * 100).round(1)
+    orden = out["campo"].astype(str).map({c: i for i, c in enumerate(CAMPOS_DETALLE)})
+    out = out.assign(_orden=orden).sort_values(["pokemon", "_orden", "Usos"], ascending=[True, True, False],
+                                               kind="stable")
+    return out.drop(columns="_orden").reset_index(drop=True)
+
+
+def _desglose_pokemon(uso: pd.DataFrame, componentes: pd.DataFrame, especie: str) -> dict:
     """Devuelve tablas de uso de movimientos/habilidad/item/teratipo para un Pokémon."""
-    sub = df_detalle[df_detalle["pokemon"] == especie]
-    total = len(sub)
+    fila = uso[uso["pokemon"] == especie]
+    tabla = desglose_especies(uso, componentes, [especie])
 
     def _contar(col):
-        contador = {}
-        for val in sub[col].dropna():
-            for item in str(val).split(";"):
-                item = item.strip()
-                if item:
-                    contador[item] = contador.get(item, 0) + 1
-        out = pd.DataFrame(list(contador.items()), columns=[col.capitalize(), "Usos"])
-        if not out.empty and total > 0:
-            out["% Uso"] = (out["Usos"] / total * 100).round(1)
-            out = out.sort_values("Usos", ascending=False).reset_index(drop=True)
-            out.index += 1
+        out = tabla.loc[tabla["campo"] == col, ["valor", "Usos", "% Uso"]].reset_index(drop=True)
+        out["valor"] = out["valor"].astype(str)
+        out.columns = [col.capitalize(), "Usos", "% Uso"]
+        out.index += 1
         return out
 
-    victorias = (sub["win"] == "True").sum()
-    derrotas  = (sub["win"] == "False").sum()
+    victorias = int(fila["victorias"].sum())
+    derrotas  = int(fila["derrotas"].sum())
     decididos = victorias + derrotas
     win_rate  = round(victorias / decididos * 100, 1) if decididos > 0 else None
 
@@ -456,13 +1024,117 @@ def _desglose_pokemon(df_detalle: pd.DataFrame, especie: str) -> dict:
         "abilities": _contar("abilities"),
         "items": _contar("items"),
         "tera": _contar("tera"),
-        "total_apariciones": total,
-        "victorias": int(victorias),
-        "derrotas": int(derrotas),
+        "total_apariciones": int(fila["usos"].sum()),
+        "victorias": victorias,
+        "derrotas": derrotas,
         "win_rate": win_rate,
     }
 
 
+# ══════════════════════════════════════════════════════════════════
+# NÚCLEOS DE EQUIPO (co-ocurrencia de especies)
+# ══════════════════════════════════════════════════════════════════
+# Matriz dispersa equipos × especies (un equipo = un player_id en un replay).
+# Con X' X salen todos los pares a la vez; para los tríos se arma la matriz
+# equipos × pares frecuentes y se multiplica de nuevo por X.
+
+def _equipos_formato(formato_esp: str) -> pd.DataFrame:
+    """Filas ok del caché de un Formato_esp: url, player_id, pokemon, win."""
+    with closing(_conectar_cache()) as con:
+        return pd.read_sql(
+            "SELECT url, player_id, pokemon, win FROM replay_detalle "
+            "WHERE formato_esp = ? AND status = 'ok'", con, params=(formato_esp,))
+
+
+def matriz_equipos(filas: pd.DataFrame):
+    """
+    (X, especies, gano, decidido): X es la matriz de incidencia equipos × especies
+    (CSR, 1 si el equipo llevó la especie); gano/decidido son booleanos por equipo.
+    """
+    equipo = filas.groupby(["url", "player_id"], sort=False).ngroup().to_numpy()
+    cod, especies = pd.factorize(filas["pokemon"], sort=True)
+    n_equipos = int(equipo.max()) + 1 if len(equipo) else 0
+    X = sparse.csr_matrix((np.ones(len(filas), dtype=np.int32), (equipo, cod)),
+                          shape=(n_equipos, len(especies)))
+    X.data[:] = 1   # por si una especie se repitiera en el mismo equipo
+    win = filas.groupby(equipo, sort=True)["win"].first()
+    return X, pd.Index(especies), (win == "True").to_numpy(), win.isin(["True", "False"]).to_numpy()
+
+
+def _valores(M, filas, cols) -> np.ndarray:
+    """M[filas[i], cols[i]] como vector denso (scipy devuelve matriz dispersa si están vacíos)."""
+    v = M.tocsr()[filas, cols]
+    return np.asarray(v.todense() if sparse.issparse(v) else v, dtype=float).ravel()
+
+
+def _win_pct(ganados, decididos):
+    return np.where(decididos > 0, np.round(ganados / np.maximum(decididos, 1) * 100, 1), np.nan)
+
+
+def co_ocurrencias(X, especies, gano, decidido, min_equipos: int = 10):
+    """
+    Pares y tríos de especies presentes juntos en al menos `min_equipos` equipos.
+    Devuelve (pares, trios) con Equipos, % Equipos, Lift (veces más de lo esperado
+    si se eligieran independientemente) y Win % del núcleo.
+    """
+    n = X.shape[0]
+    columnas_par = ["Pokémon A", "Pokémon B", "Equipos", "% Equipos", "Lift", "Win %"]
+    columnas_trio = ["Pokémon A", "Pokémon B", "Pokémon C", "Equipos", "% Equipos", "Lift", "Win %"]
+    if n == 0:
+        return pd.DataFrame(columns=columnas_par), pd.DataFrame(columns=columnas_trio)
+    soporte = np.asarray(X.sum(axis=0)).ravel().astype(float)
+    Xc = X.tocsc()
+    Xg, Xd = X[gano], X[decidido]
+
+    # ── Pares: X'X ───────────────────────────────────────────────
+    C = sparse.triu(X.T @ X, k=1).tocoo()
+    keep = C.data >= min_equipos
+    a, b, cnt = C.row[keep], C.col[keep], C.data[keep].astype(float)
+    ganados   = _valores(Xg.T @ Xg, a, b)
+    decididos = _valores(Xd.T @ Xd, a, b)
+    pares = pd.DataFrame({
+        "Pokémon A": especies[a], "Pokémon B": especies[b], "Equipos": cnt.astype(int),
+        "% Equipos": np.round(cnt / n * 100, 1),
+        "Lift": np.round(cnt * n / (soporte[a] * soporte[b]), 2),
+        "Win %": _win_pct(ganados, decididos),
+    }, columns=columnas_par)
+
+    # ── Tríos: (equipos × pares frecuentes)' X ───────────────────
+    trios = pd.DataFrame(columns=columnas_trio)
+    if len(a):
+        P = Xc[:, a].multiply(Xc[:, b]).tocsc()       # equipos que llevan el par
+        T = (P.T @ X).tocoo()                         # pares × especie extra
+        keep = (T.col > b[T.row]) & (T.data >= min_equipos)
+        fila, c, cnt3 = T.row[keep], T.col[keep], T.data[keep].astype(float)
+        Pg, Pd = P[gano], P[decidido]
+        ganados   = _valores(Pg.T @ Xg, fila, c)
+        decididos = _valores(Pd.T @ Xd, fila, c)
+        trios = pd.DataFrame({
+            "Pokémon A": especies[a[fila]], "Pokémon B": especies[b[fila]], "Pokémon C": especies[c],
+            "Equipos": cnt3.astype(int), "% Equipos": np.round(cnt3 / n * 100, 1),
+            "Lift": np.round(cnt3 * n * n / (soporte[a[fila]] * soporte[b[fila]] * soporte[c]), 2),
+            "Win %": _win_pct(ganados, decididos),
+        }, columns=columnas_trio)
+
+    orden = lambda t: t.sort_values(["Equipos", "Lift"], ascending=False, kind="stable").reset_index(drop=True)
+    return orden(pares), orden(trios)
+
+
+@st.cache_data(show_spinner="Calculando núcleos de equipo...", max_entries=32)
+def nucleos_formato(formato_esp: str, generacion: int, min_equipos: int = 10):
+    """(n_equipos, pares, trios) de un Formato_esp; se recalcula sólo si cambia el caché."""
+    X, especies, gano, decidido = matriz_equipos(_equipos_formato(formato_esp))
+    pares, trios = co_ocurrencias(X, especies, gano, decidido, min_equipos)
+    return X.shape[0], pares, trios
+
+
+def _formatos_en_cache() -> list:
+    with closing(_conectar_cache()) as con:
+        return [f[0] for f in con.execute(
+            "SELECT DISTINCT formato_esp FROM replay_detalle WHERE status = 'ok' AND formato_esp != '' "
+            "ORDER BY formato_esp")]
+
+
 from PIL import Image, ImageDraw, ImageFont
 import io
 
@@ -576,23 +1248,30 @@ def show():
 
     # ── Respaldo del caché de replays ────────────────────────────
     with st.expander("💾 Caché de replays (para no re-descargar todo cada vez)"):
-        cache_actual = _load_cache()
-        n_ok = cache_actual.loc[cache_actual["status"] == "ok", "url"].nunique() if not cache_actual.empty else 0
-        n_fail = cache_actual.loc[cache_actual["status"] == "failed", "url"].nunique() if not cache_actual.empty else 0
+        n_ok, n_fail = _resumen_cache()
         st.caption(
-            "El caché vive en un CSV en el servidor: sólo se piden a Showdown los "
+            "El caché vive en una base SQLite en el servidor: sólo se piden a Showdown los "
             "replays nuevos o los que antes fallaron. Si tu hosting reinicia el "
             "disco entre despliegues (ej. redeploy), el caché se pierde — descarga "
             "un respaldo de vez en cuando y súbelo para restaurarlo."
         )
         st.write(f"Replays en caché: **{n_ok} leídos correctamente**, **{n_fail} pendientes/fallidos**.")
+        n_espera, n_muertos = _resumen_fallos()
+        if n_espera or n_muertos:
+            st.caption(
+                f"De los fallidos, {n_espera} esperan su próximo reintento y {n_muertos} se dan por "
+                "perdidos (borrados de Showdown o sin Pokémon legibles): no se vuelven a pedir."
+            )
+            if st.button("🔄 Reintentar todos los fallidos en el próximo análisis"):
+                _reiniciar_fallos()
+                st.success("Listo: se volverán a pedir al analizar.")
 
         c_dl, c_up = st.columns(2)
         with c_dl:
-            if not cache_actual.empty:
+            if (n_ok or n_fail) and st.button("📦 Preparar respaldo del caché"):
                 st.download_button(
                     "📥 Descargar respaldo del caché",
-                    cache_actual.to_csv(index=False).encode("utf-8"),
+                    _load_cache().to_csv(index=False).encode("utf-8"),
                     "replay_cache_backup.csv", "text/csv",
                 )
         with c_up:
@@ -603,8 +1282,7 @@ def show():
                     for c in CACHE_COLS:
                         if c not in nuevo.columns:
                             nuevo[c] = ""
-                    fusionado = _fusionar_cache(cache_actual, nuevo[CACHE_COLS])
-                    _save_cache(fusionado)
+                    _guardar_en_cache(nuevo[CACHE_COLS])
                     st.success("Caché fusionado correctamente. Vuelve a analizar los replays.")
                 except Exception as e:
                     st.error(f"No se pudo leer el archivo subido: {e}")
@@ -645,6 +1323,10 @@ def show():
             if "round" in df.columns else []
         filtro_ronda = st.multiselect("🏷️ Fase", rondas_opts, placeholder="Todos")
 
+    meses_df = df["date"].dt.strftime("%Y-%m")
+    filtro_mes = st.multiselect("📅 Mes", sorted(meses_df.dropna().unique().tolist(), reverse=True),
+                                placeholder="Todos")
+
     top_n = st.slider("🔢 Top N Pokémon a mostrar", 5, 50, 20)
 
     # ── Aplicar filtros ─────────────────────────────────────────
@@ -661,6 +1343,8 @@ def show():
         mask &= df["Formato_esp"].isin(filtro_formato_esp)
     if filtro_ronda and "round" in df.columns:
         mask &= df["round"].isin(filtro_ronda)
+    if filtro_mes:
+        mask &= meses_df.isin(filtro_mes)
 
     df_filtrado = df[mask].copy()
     replays_disp = df_filtrado["Match_replays"].dropna()
@@ -674,57 +1358,82 @@ def show():
         return
 
     # ── Botón para cargar ───────────────────────────────────────
+    # Si ingestar_replays.py corre aparte (cron), la página sólo lee el caché.
+    ultima = _ultima_ingesta()
+    descargar = st.checkbox(
+        "⬇️ Descargar replays nuevos al analizar", value=ultima is None,
+        help="Si está desactivado sólo se usa lo que ya está en caché (lo mantiene ingestar_replays.py).",
+    )
+    if ultima:
+        st.caption(
+            f"Última ingesta automática: {ultima['fecha']} · {ultima['nuevos']} nuevos · "
+            f"{ultima['fallidos']} fallidos · {ultima['pendientes']} pendientes."
+        )
+
     if st.button("🚀 Analizar replays", type="primary"):
         with st.spinner("Procesando replays..."):
-            df_detalle, total_equipos, n_nuevos, n_fallidos, info_debug = _cargar_todos_replays_detalle(df_filtrado)
+            if filtro_torneo or filtro_aka or filtro_ronda:
+                # filtros que no están en el uso materializado: se agregan las filas del caché
+                df_detalle, comp_detalle, total_equipos, n_nuevos, n_fallidos, info_debug = \
+                    _cargar_todos_replays_detalle(df_filtrado, descargar)
+                uso, componentes = _agregar_uso(df_detalle, comp_detalle)
+            else:
+                replays, info_debug = _replays_a_analizar(df_filtrado)
+                n_nuevos, n_fallidos = _descargar_pendientes(replays, info_debug) \
+                    if descargar and not replays.empty else (0, 0)
+                grupos_mat, uso_mat, comp_mat = uso_materializado(version_datos(), _generacion_cache())
+                uso, componentes, total_equipos = _uso_seleccion(grupos_mat, uso_mat, comp_mat, {
+                    "Formato": filtro_formato, "Tier": filtro_tier,
+                    "Formato_esp": filtro_formato_esp, "mes": filtro_mes,
+                })
+                info_debug["urls_unicas_a_procesar"] = replays["Match_replays"].nunique()
+                info_debug["uso_materializado"] = True
 
         with st.expander("🔧 Diagnóstico (por si algo no cuadra)"):
             st.json(info_debug)
 
-        if df_detalle.empty:
+        if uso.empty:
             st.warning(
                 "No se pudieron extraer Pokémon de los replays. Revisa el "
                 "diagnóstico de arriba: si 'total_despues_filtro_rep' es 0 pero "
                 "'total_antes_filtro_rep' no lo es, el filtro de Rep para "
                 "VGC/CHAMPIONS está descartando todo."
             )
-            st.session_state.pop("_replay_detalle", None)
+            st.session_state.pop("_replay_uso", None)
             return
 
-        st.session_state["_replay_detalle"]  = df_detalle
+        st.session_state["_replay_uso"]      = (uso, componentes)
         st.session_state["_replay_filtrado"] = df_filtrado.copy()
         st.session_state["_replay_aka"]      = filtro_aka
         st.session_state["_replay_total_eq"] = total_equipos
         st.session_state["_replay_msg"] = (
             f"✅ {n_nuevos} replay(s) nuevo(s) descargado(s) · "
-            f"⚠️ {n_fallidos} no se pudo(ieron) leer (se reintentará la próxima vez)."
-        )
+            f"⚠️ {n_fallidos} no se pudo(ieron) leer (se reintentará más adelante)."
+            + (f" · ⏸️ {info_debug['omitidos_por_fallos_previos']} omitido(s) por fallos anteriores."
+               if info_debug.get("omitidos_por_fallos_previos") else "")
+        ) if descargar else "📦 Resultados con los replays ya guardados en caché (sin descargar nada)."
 
     # ── Mostrar resultados si ya están cargados ─────────────────
-    if "_replay_detalle" not in st.session_state:
+    if "_replay_uso" not in st.session_state:
         return
 
     if st.session_state.get("_replay_msg"):
         st.info(st.session_state["_replay_msg"])
 
-    df_detalle    = st.session_state["_replay_detalle"]
+    uso, componentes = st.session_state["_replay_uso"]
     df_filtrado   = st.session_state["_replay_filtrado"]
     total_equipos = st.session_state["_replay_total_eq"]
     filtro_aka    = st.session_state["_replay_aka"]
 
     # ── Ranking de uso + win rate ────────────────────────────────
-    ranking = df_detalle["pokemon"].value_counts().reset_index()
-    ranking.columns = ["Pokémon", "Usos"]
-    ranking["% Uso"] = (ranking["Usos"] / total_equipos * 100).round(1) if total_equipos else np.nan
-
-    tmp = df_detalle.copy()
-    tmp["_win"]  = tmp["win"] == "True"
-    tmp["_lose"] = tmp["win"] == "False"
-    wr = tmp.groupby("pokemon").agg(Victorias=("_win", "sum"), Derrotas=("_lose", "sum"))
-    decididos = wr["Victorias"] + wr["Derrotas"]
-    wr["Win %"] = np.where(decididos > 0, (wr["Victorias"] / decididos * 100).round(1), np.nan)
-
-    ranking = ranking.merge(wr[["Win %"]], left_on="Pokémon", right_index=True, how="left")
+    ranking = uso.sort_values(["usos", "pokemon"], ascending=[False, True]).reset_index(drop=True)
+    decididos = ranking["victorias"] + ranking["derrotas"]
+    ranking = pd.DataFrame({
+        "Pokémon": ranking["pokemon"],
+        "Usos": ranking["usos"],
+        "% Uso": (ranking["usos"] / total_equipos * 100).round(1) if total_equipos else np.nan,
+        "Win %": np.where(decididos > 0, (ranking["victorias"] / decididos * 100).round(1), np.nan),
+    })
     ranking_top = ranking.head(top_n).reset_index(drop=True)
     ranking_top.index += 1
 
@@ -790,7 +1499,7 @@ def show():
     especies_disp = ranking["Pokémon"].tolist()
     if especies_disp:
         especie_sel = st.selectbox("Selecciona un Pokémon", especies_disp)
-        detalle = _desglose_pokemon(df_detalle, especie_sel)
+        detalle = _desglose_pokemon(uso, componentes, especie_sel)
 
         m1, m2, m3 = st.columns(3)
         m1.metric("Apariciones", detalle["total_apariciones"])
@@ -822,6 +1531,32 @@ def show():
 
     st.markdown("---")
 
+    # ══════════════════════════════════════════════════════════════
+    # NÚCLEOS DE EQUIPO (pares y tríos que se llevan juntos)
+    # ══════════════════════════════════════════════════════════════
+    st.subheader("🤝 Núcleos de equipo")
+    formatos_cache = _formatos_en_cache()
+    if formatos_cache:
+        n1, n2 = st.columns([2, 1])
+        pref = next((f for f in filtro_formato_esp if f in formatos_cache), formatos_cache[0]) \
+            if filtro_formato_esp else formatos_cache[0]
+        formato_nucleo = n1.selectbox("Tier (Formato_esp)", formatos_cache, index=formatos_cache.index(pref))
+        min_equipos = n2.number_input("Mínimo de equipos", min_value=2, value=10, step=1)
+        n_eq, pares, trios = nucleos_formato(formato_nucleo, _generacion_cache(), int(min_equipos))
+        st.caption(
+            f"{n_eq} equipos en caché para {formato_nucleo}. Lift = cuántas veces más "
+            "aparecen juntos de lo esperado si se eligieran por separado."
+        )
+        t1, t2 = st.tabs(["Pares", "Tríos"])
+        with t1:
+            st.dataframe(pares.head(100), use_container_width=True) if not pares.empty \
+                else st.caption("Ningún par llega al mínimo de equipos.")
+        with t2:
+            st.dataframe(trios.head(100), use_container_width=True) if not trios.empty \
+                else st.caption("Ningún trío llega al mínimo de equipos.")
+
+    st.markdown("---")
+
     # ══════════════════════════════════════════════════════════════
     # VISOR DE REPLAYS
     # ══════════════════════════════════════════════════════════════
@@ -2,7 +2,7 @@ import streamlit as st
 import pandas as pd
 import os, sys
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from utils import load_data, normalize_columns, ensure_fields
+from utils import load_data, normalize_columns, ensure_fields, load_batallas, version_datos
 
 # ── Configuración ─────────────────────────────────────────────────────────────
 TORNEO_NUM    = 80
@@ -31,10 +31,9 @@ def cargar_excel():
     return df_pokemon, df_equipos, df_teams
 
 @st.cache_data(ttl=3600)
-def cargar_resultados_torneo(_df_raw):
-    """Carga las batallas del torneo 80 del CSV principal."""
-    df = normalize_columns(_df_raw.copy())
-    df = ensure_fields(df)
+def cargar_resultados_torneo(version):
+    """Carga las batallas del torneo 80 desde la tabla de batallas."""
+    df = load_batallas()
     torneo = df[(df['league'] == 'TORNEO') & (df['N_Torneo'] == TORNEO_NUM)].copy()
     return torneo
 
@@ -82,8 +81,7 @@ def show():
         st.error(f"No se encontró el archivo **{EXCEL_PATH}** en la carpeta del proyecto.")
         return
 
-    df_raw = load_data()
-    df_torneo = cargar_resultados_torneo(df_raw)
+    df_torneo = cargar_resultados_torneo(version_datos())
 
     # ── Tabs principales ───────────────────────────────────────────────────────
     tab_teams, tab_equipos, tab_pokemon, tab_resultados = st.tabs([
@@ -129,7 +129,7 @@ def _paste_center(base, overlay, cx, cy):
 
 def calcular_stats(df, jugador, fecha_corte=None):
     """Calcula todas las stats del jugador hasta fecha_corte."""
-    from utils import build_base_liga, build_base_torneo, load_data
+    from utils import build_bases
 
     df_full = df.copy()
     if fecha_corte:
@@ -193,23 +193,23 @@ def calcular_stats(df, jugador, fecha_corte=None):
     elo_val  = 1000
     rank_val = 0
     try:
-        from vistas.elo import calcular_elo
-        from utils import obtener_elo_rank_historico
+        from vistas.elo import calcular_elo, indice_elo
+        from utils import obtener_elo_rank_historico, version_datos
         # siempre se calcula sobre el historial COMPLETO; el recorte por fecha se aplica
         # después, reconstruyendo el Elo acumulado hasta ese momento (no se recalcula el
         # algoritmo de Elo desde cero con datos truncados).
-        df_completo = load_data()
-        data_elo, data_filas, _ = calcular_elo(df_completo)
-        elo_val, rank_val = obtener_elo_rank_historico(data_elo, data_filas, jugador, fecha_corte)
+        data_elo, data_filas, _ = calcular_elo()
+        elo_val, rank_val = obtener_elo_rank_historico(data_elo, data_filas, jugador, fecha_corte,
+                                                        indice=indice_elo(version_datos()))
     except Exception as e:
         print(f"Error ELO: {e}")
 
     # ── SCORE desde base2 (ligas) + base_torneo_final (torneos) ──
     score_val = 0.0
     try:
-        df_for_score = df if fecha_corte else load_data()
-        base2, _              = build_base_liga(df_for_score)
-        base_torneo_final, _  = build_base_torneo(df_for_score)
+        bases = build_bases(df if fecha_corte else None)
+        base2, _              = bases["liga"]
+        base_torneo_final, _  = bases["torneo"]
 
         score_l = 0.0
         score_t = 0.0